@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Iterator, Optional
+
+from ..domain.ports import IChatRepository
+from ..domain.models import ChatHistoryPage
+
+MAX_PAGE_SIZE = 200
+
+class GetChatHistoryPageUseCase:
+    def __init__(self, chat_repo: IChatRepository):
+        self.chat_repo = chat_repo
+
+    def execute(self, session_id: str, after_id: Optional[int] = None, limit: int = 50,
+                since: Optional[datetime] = None, until: Optional[datetime] = None) -> ChatHistoryPage:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        # Fetch one extra row to know whether another page follows.
+        items = self.chat_repo.get_page(session_id, after_id, limit + 1, since, until)
+        if len(items) > limit:
+            items = items[:limit]
+            return ChatHistoryPage(items=items, next_cursor=items[-1].id)
+        return ChatHistoryPage(items=items, next_cursor=None)
+
+class ExportChatHistoryUseCase:
+    def __init__(self, chat_repo: IChatRepository):
+        self.chat_repo = chat_repo
+
+    def execute(self, session_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[str]:
+        """Yields the session as NDJSON, one message per line."""
+        for chat in self.chat_repo.iter_by_session_id(session_id, since=since, until=until):
+            yield chat.model_dump_json() + "\n"
@@ -1,14 +1,19 @@
+from typing import TYPE_CHECKING, Optional
 from ..domain.ports import IChatRepository
-from ..domain.models import ChatHistory
-from ..infrastructure.model_factory import ModelFactory # Import the factory
+from ..domain.models import ChatHistory, GenerationOptions
 import uuid
 
+if TYPE_CHECKING:
+    from ..infrastructure.model_factory import ModelFactory
+    from ..infrastructure.prompts import PromptRegistry
+
 class GenerateTextUseCase:
-    def __init__(self, model_factory: ModelFactory, chat_repo: IChatRepository):
+    def __init__(self, model_factory: "ModelFactory", chat_repo: IChatRepository, prompt_registry: Optional["PromptRegistry"] = None):
         self.model_factory = model_factory
         self.chat_repo = chat_repo
+        self.prompt_registry = prompt_registry
 
-    def execute(self, prompt: str, model: str, session_id: str = None) -> dict:
+    def execute(self, prompt: str, model: str, session_id: str = None, options: Optional[GenerationOptions] = None) -> dict:
         if not session_id:
             session_id = str(uuid.uuid4())
         
@@ -16,8 +21,15 @@ class GenerateTextUseCase:
             # 1. Get the correct text generator from the factory
             text_generator = self.model_factory.get_text_generator(model)
 
-            # 2. Generate text using the selected generator
-            ai_response = text_generator.generate_text(prompt, model)
+            # 2. Fit the prompt to the model's context window, cap the generation options and generate text
+            model_prompt, rendered = prompt, None
+            if self.prompt_registry is not None:
+                rendered = self.prompt_registry.render("chat", model, options=options, prompt=prompt)
+                model_prompt, options = rendered.text, rendered.options
+            generation = text_generator.generate(model_prompt, model, options)
+            if rendered is not None:
+                self.prompt_registry.record_generation(rendered, generation)
+            ai_response = generation.text
             
             # 3. Persist the conversation
             history = ChatHistory(
@@ -28,6 +40,7 @@ class GenerateTextUseCase:
             self.chat_repo.add(history)
 
             # 4. Return the result
-            return {"status": "SUCCESS", "result": ai_response, "session_id": session_id}
+            usage = {"output_tokens": generation.output_tokens, "finish_reason": generation.finish_reason}
+            return {"status": "SUCCESS", "result": ai_response, "session_id": session_id, "usage": usage}
         except Exception as e:
             return {"status": "FAILURE", "error": str(e)}
@@ -1,9 +1,80 @@
-from typing import Optional, Any, List
+from typing import TYPE_CHECKING, Optional, Any, List, Callable
+import os
 import json
+import uuid
+import hashlib
+from datetime import datetime
 from pydantic import ValidationError
 
-from ..domain.ports import ICeleryClient, IFileStorage, ILlavaClient
+from ..domain.ports import ICeleryClient, IFileStorage, ILlavaClient, IIdempotencyStore
 from ..schemas import TaskTicket, TaskStatus, GenerateProductDescriptionRequest
+from ..infrastructure.deadlines import resolve_deadline
+
+if TYPE_CHECKING:
+    from ..infrastructure.semantic_cache import SemanticCache # Pulls in NumPy and the Ollama client
+
+def auto_idempotency_keys_enabled() -> bool:
+    return os.environ.get("IDEMPOTENCY_AUTO_KEYS", "true").lower() in ("1", "true", "yes")
+
+def build_idempotency_key(task_name: str, idempotency_key: Optional[str], content_digest: Optional[str]) -> Optional[str]:
+    """Client-provided keys win; otherwise fall back to a hash of the task input."""
+    if idempotency_key:
+        return f"{task_name}:key:{idempotency_key}"
+    if content_digest and auto_idempotency_keys_enabled():
+        return f"{task_name}:sha256:{content_digest}"
+    return None
+
+def send_task_once(
+    celery_client: ICeleryClient,
+    idempotency_store: Optional[IIdempotencyStore],
+    key: Optional[str],
+    task_name: str,
+    queue: str,
+    build_args: Callable[[], list],
+    send: Optional[Callable[..., Any]] = None,
+    expires: Optional[datetime] = None,
+) -> TaskTicket:
+    """
+    Enqueues a task unless `key` already maps to one, in which case the original ticket is returned.
+    `build_args` is only called when a new task is actually enqueued (e.g. to save an upload).
+    `send(args, task_id=...)` replaces celery_client.send_task, e.g. to enqueue a whole workflow.
+    `expires` is the caller's deadline, after which workers drop the task.
+    """
+    def enqueue(**options):
+        if expires is not None:
+            options["expires"] = expires
+        if send is not None:
+            return send(build_args(), **options)
+        return celery_client.send_task(task_name, args=build_args(), queue=queue, **options)
+
+    if idempotency_store is None or key is None:
+        task = enqueue()
+        return TaskTicket(task_id=task.id, status="PENDING")
+
+    task_id = str(uuid.uuid4())
+    try:
+        existing_task_id = idempotency_store.reserve(key, task_id)
+    except Exception as e:
+        print(f"Idempotency store unavailable, enqueueing without deduplication: {e}")
+        task = enqueue()
+        return TaskTicket(task_id=task.id, status="PENDING")
+
+    if existing_task_id is not None:
+        try:
+            existing_status = celery_client.get_task_status(existing_task_id).status
+        except Exception:
+            existing_status = "PENDING"
+        if existing_status != "FAILURE":
+            return TaskTicket(task_id=existing_task_id, status=existing_status)
+        # The original attempt failed, so a retry should really run again.
+        idempotency_store.replace(key, task_id)
+
+    try:
+        task = enqueue(task_id=task_id)
+    except Exception:
+        idempotency_store.release(key)
+        raise
+    return TaskTicket(task_id=task.id, status="PENDING")
 
 class TestTextWorkerUseCase:
     def __init__(self, celery_client: ICeleryClient):
@@ -26,34 +97,114 @@ class TestTextWorkerUseCase:
             return {"status": "FAILURE", "error": str(e)}
 
 class ProcessCatalogIntakeUseCase:
-    def __init__(self, celery_client: ICeleryClient, file_storage: IFileStorage):
+    TASK_NAME = 'workers.vision_worker.process_product_image'
+
+    def __init__(self, celery_client: ICeleryClient, file_storage: IFileStorage, idempotency_store: Optional[IIdempotencyStore] = None):
         self.celery_client = celery_client
         self.file_storage = file_storage
+        self.idempotency_store = idempotency_store
 
-    def execute(self, file_content: Any, original_filename: str, project_id: Optional[str]) -> TaskTicket:
-        file_path = self.file_storage.save_file(file_content, original_filename)
-        task = self.celery_client.send_task(
-            'workers.vision_worker.process_product_image',
-            args=[str(file_path), project_id],
-            queue='vision_queue'
-        )
-        return TaskTicket(task_id=task.id, status="PENDING")
+    def execute(self, file_content: Any, original_filename: str, project_id: Optional[str], idempotency_key: Optional[str] = None,
+                deadline: Optional[datetime] = None) -> TaskTicket:
+        content_digest = None
+        if self.idempotency_store is not None and not idempotency_key and auto_idempotency_keys_enabled():
+            content_digest = self._hash_upload(file_content, project_id)
+        key = build_idempotency_key(self.TASK_NAME, idempotency_key, content_digest)
+
+        def build_args() -> list:
+            file_path = self.file_storage.save_file(file_content, original_filename)
+            return [str(file_path), project_id]
+
+        return send_task_once(self.celery_client, self.idempotency_store, key, self.TASK_NAME, 'vision_queue', build_args,
+                              expires=resolve_deadline(deadline))
+
+    @staticmethod
+    def _hash_upload(file_content: Any, project_id: Optional[str]) -> str:
+        digest = hashlib.sha256((project_id or "").encode("utf-8") + b"\0")
+        for chunk in iter(lambda: file_content.read(1024 * 1024), b""):
+            digest.update(chunk)
+        file_content.seek(0) # Rewind so the upload can still be saved
+        return digest.hexdigest()
+
+class ProcessProductListingUseCase:
+    """
+    Turns a product photo into a finished listing in one workflow: the vision
+    worker analyses the image and hands its analysis straight to the text
+    worker, which returns a ProductData under the workflow's single task id.
+    """
+    TASK_NAME = 'workflows.product_listing'
+    STEPS = (
+        ('workers.vision_worker.process_product_image', 'vision_queue'),
+        ('workers.text_worker.generate_product_listing', 'text_queue'),
+    )
+
+    def __init__(self, celery_client: ICeleryClient, file_storage: IFileStorage, idempotency_store: Optional[IIdempotencyStore] = None):
+        self.celery_client = celery_client
+        self.file_storage = file_storage
+        self.idempotency_store = idempotency_store
+
+    def execute(self, file_content: Any, original_filename: str, project_id: Optional[str], category_hint: Optional[str] = None, idempotency_key: Optional[str] = None,
+                deadline: Optional[datetime] = None) -> TaskTicket:
+        content_digest = None
+        if self.idempotency_store is not None and not idempotency_key and auto_idempotency_keys_enabled():
+            content_digest = ProcessCatalogIntakeUseCase._hash_upload(file_content, f"{project_id or ''}\0{category_hint or ''}")
+        key = build_idempotency_key(self.TASK_NAME, idempotency_key, content_digest)
+
+        def build_args() -> list:
+            file_path = self.file_storage.save_file(file_content, original_filename)
+            return [str(file_path), project_id]
+
+        def send(args: list, **options):
+            (vision_task, vision_queue), (text_task, text_queue) = self.STEPS
+            return self.celery_client.send_chain([(vision_task, args, vision_queue), (text_task, [category_hint], text_queue)], **options)
+
+        return send_task_once(self.celery_client, self.idempotency_store, key, self.TASK_NAME, 'vision_queue', build_args, send=send,
+                              expires=resolve_deadline(deadline))
 
 class GenerateProductDescriptionUseCase:
-    def __init__(self, celery_client: ICeleryClient):
+    TASK_NAME = 'workers.text_worker.generate_product_description'
+
+    def __init__(self, celery_client: ICeleryClient, idempotency_store: Optional[IIdempotencyStore] = None, semantic_cache: Optional["SemanticCache"] = None):
         self.celery_client = celery_client
+        self.idempotency_store = idempotency_store
+        self.semantic_cache = semantic_cache
 
-    def execute(self, request_data: GenerateProductDescriptionRequest) -> TaskTicket:
-        task = self.celery_client.send_task(
-            'workers.text_worker.generate_product_description',
-            args=[request_data.product_name_input, request_data.category_hint],
-            queue='text_queue'
-        )
-        return TaskTicket(task_id=task.id, status="PENDING")
+    def execute(self, request_data: GenerateProductDescriptionRequest, idempotency_key: Optional[str] = None,
+                deadline: Optional[datetime] = None) -> TaskTicket:
+        args = [request_data.product_name_input, request_data.category_hint]
+        if request_data.description_length is not None:
+            args.append(request_data.description_length)
+
+        # 1. Near-duplicate of an earlier request? Answer from the semantic cache
+        # (whose entries don't record a length, so only when none was asked for).
+        cached_result, query_vector = None, None
+        if self.semantic_cache is not None and request_data.description_length is None:
+            try:
+                cached_result, query_vector = self.semantic_cache.lookup(request_data.product_name_input, request_data.category_hint)
+            except Exception as e:
+                print(f"Semantic cache lookup failed, generating normally: {e}")
+        if cached_result is not None:
+            # Stored under a fresh task id so clients keep polling /api/ai/status as usual.
+            task_id = str(uuid.uuid4())
+            self.celery_client.store_result(task_id, cached_result)
+            return TaskTicket(task_id=task_id, status="SUCCESS")
+
+        # 2. Otherwise enqueue (once) and remember the query so the result can be cached.
+        content_digest = hashlib.sha256(json.dumps(args, sort_keys=True).encode("utf-8")).hexdigest()
+        key = build_idempotency_key(self.TASK_NAME, idempotency_key, content_digest)
+        ticket = send_task_once(self.celery_client, self.idempotency_store, key, self.TASK_NAME, 'text_queue', lambda: args,
+                                expires=resolve_deadline(deadline or request_data.deadline))
+        if query_vector is not None and ticket.status == "PENDING":
+            self.semantic_cache.add_pending(ticket.task_id, query_vector, request_data.product_name_input, request_data.category_hint)
+        return ticket
 
 class GetTaskStatusUseCase:
-    def __init__(self, celery_client: ICeleryClient):
+    def __init__(self, celery_client: ICeleryClient, semantic_cache: Optional["SemanticCache"] = None):
         self.celery_client = celery_client
+        self.semantic_cache = semantic_cache
 
     def execute(self, task_id: str) -> TaskStatus:
-        return self.celery_client.get_task_status(task_id)
+        task_status = self.celery_client.get_task_status(task_id)
+        if self.semantic_cache is not None and task_status.status == "SUCCESS":
+            self.semantic_cache.complete(task_id, task_status.result)
+        return task_status
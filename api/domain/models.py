@@ -1,5 +1,6 @@
 # D:\Oficina\servico-ia-unificado\api\domain\models.py
 
+from datetime import datetime
 from typing import Optional, List
 from pydantic import BaseModel
 
@@ -20,11 +21,31 @@ class TaskStatus(BaseModel):
 # --- Persistence --- #
 
 class ChatHistory(BaseModel):
+    id: Optional[int] = None # Assigned by the repository
     session_id: str
     human_message: str
     ai_message: str
+    created_at: Optional[datetime] = None # Assigned by the database
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatHistory]
+    next_cursor: Optional[int] = None # Pass as after_id to get the next page; None on the last page
 
 class GenerateProductDescriptionRequest(BaseModel):
     product_name: str
     description_length: Optional[int] = 100
 
+
+# --- Text Generation --- #
+
+class GenerationOptions(BaseModel):
+    max_output_tokens: Optional[int] = None # num_predict on Ollama, max_tokens on llama.cpp
+    stop: Optional[List[str]] = None
+    temperature: Optional[float] = None
+    seed: Optional[int] = None
+    context_window: Optional[int] = None # num_ctx on Ollama; set by the prompt registry to the window it budgeted for
+
+class GenerationResult(BaseModel):
+    text: str
+    output_tokens: Optional[int] = None # None when the backend does not report it
+    finish_reason: Optional[str] = None # "stop", or "length" when max_output_tokens cut the answer
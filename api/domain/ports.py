@@ -1,15 +1,16 @@
 # D:\Oficina\servico-ia-unificado\api\domain\ports.py
 
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
 
 from .models import TaskTicket, TaskStatus
 
 
-from celery.result import AsyncResult
+if TYPE_CHECKING:
+    from celery.result import AsyncResult
 
 class ICeleryClient:
-    def send_task(self, name: str, args: Optional[list] = None, kwargs: Optional[dict] = None, queue: Optional[str] = None) -> AsyncResult:
+    def send_task(self, name: str, args: Optional[list] = None, kwargs: Optional[dict] = None, queue: Optional[str] = None, task_id: Optional[str] = None) -> "AsyncResult":
         pass
 
     @abstractmethod
@@ -29,19 +30,35 @@ class ILlavaClient(ABC):
         pass
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 
 from ..schemas import TaskStatus
 
 class ICeleryClient(ABC):
     @abstractmethod
-    def send_task(self, task_name: str, args: list = None, kwargs: dict = None, queue: str = None) -> Any:
+    def send_task(self, task_name: str, args: list = None, kwargs: dict = None, queue: str = None, task_id: str = None,
+                  expires: Optional[datetime] = None) -> Any:
+        """`expires`: the caller's deadline; workers drop the task once it has passed."""
         pass
 
     @abstractmethod
     def get_task_status(self, task_id: str) -> TaskStatus:
         pass
 
+    @abstractmethod
+    def store_result(self, task_id: str, result: Any) -> None:
+        """Records a successful result for a task id that was never enqueued (e.g. a cache hit)."""
+        pass
+
+    @abstractmethod
+    def send_chain(self, steps: List[Tuple[str, list, str]], task_id: str = None, expires: Optional[datetime] = None) -> Any:
+        """
+        Enqueues (task name, args, queue) steps as one workflow; each step also gets the
+        previous step's result as its first argument. `task_id` is the id of the last step.
+        """
+        pass
+
 class IFileStorage(ABC):
     @abstractmethod
     def save_file(self, file_content: Any, filename: str) -> str:
@@ -49,7 +66,22 @@ class IFileStorage(ABC):
 
 class ILlavaClient(ABC):
     @abstractmethod
-    def analyze_image(self, image_path: str, prompt: str, model: str = "llava") -> dict:
+    def analyze_image(self, image_path: str, prompt: str, model: str = "llava", deadline: Optional[datetime] = None,
+                      options: Optional["GenerationOptions"] = None) -> dict:
+        pass
+
+class IIdempotencyStore(ABC):
+    @abstractmethod
+    def reserve(self, key: str, task_id: str) -> Optional[str]:
+        """Maps key to task_id if unused. Returns the task id already mapped to key, or None."""
+        pass
+
+    @abstractmethod
+    def replace(self, key: str, task_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def release(self, key: str) -> None:
         pass
 
 
@@ -63,7 +95,7 @@ class IGeminiClient(ABC):
         pass
 
 
-from .models import ChatHistory
+from .models import ChatHistory, GenerationOptions, GenerationResult
 
 class IChatRepository(ABC):
     @abstractmethod
@@ -74,10 +106,33 @@ class IChatRepository(ABC):
     def get_by_session_id(self, session_id: str) -> List[ChatHistory]:
         pass
 
+    @abstractmethod
+    def get_page(self, session_id: str, after_id: Optional[int] = None, limit: int = 50,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[ChatHistory]:
+        """Up to `limit` messages of the session with id > after_id, in id order, created in [since, until)."""
+        pass
+
+    @abstractmethod
+    def iter_by_session_id(self, session_id: str, batch_size: int = 500,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[ChatHistory]:
+        """Streams the session's messages in id order without loading them all at once."""
+        pass
+
 
 class ITextGenerator(ABC):
     @abstractmethod
-    def generate_text(self, prompt: str, model: str) -> str:
+    def generate_text(self, prompt: str, model: str, options: Optional[GenerationOptions] = None) -> str:
+        pass
+
+    def generate(self, prompt: str, model: str, options: Optional[GenerationOptions] = None) -> GenerationResult:
+        """Like generate_text, plus the tokens generated when the backend reports them."""
+        return GenerationResult(text=self.generate_text(prompt, model, options))
+
+
+class ITextEmbedder(ABC):
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Returns one embedding vector per input text."""
         pass
 
 
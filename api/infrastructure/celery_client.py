@@ -1,5 +1,6 @@
-from typing import Optional
-from celery import Celery # Keep this for type hinting if needed
+from datetime import datetime
+from typing import List, Optional, Tuple
+from celery import Celery, chain # Keep this for type hinting if needed
 from celery.result import AsyncResult # Add this import
 import os
 from config.celery_config import celery_app # Import the global instance
@@ -11,10 +12,22 @@ class CeleryClient(ICeleryClient):
     def __init__(self):
         self.celery_app = celery_app # Use the global instance
 
-    def send_task(self, name: str, args: Optional[list] = None, kwargs: Optional[dict] = None, queue: Optional[str] = None) -> AsyncResult:
-        task_result = self.celery_app.send_task(name, args=args, kwargs=kwargs, queue=queue)
+    def send_task(self, name: str, args: Optional[list] = None, kwargs: Optional[dict] = None, queue: Optional[str] = None, task_id: Optional[str] = None,
+                  expires: Optional[datetime] = None) -> AsyncResult:
+        task_result = self.celery_app.send_task(name, args=args, kwargs=kwargs, queue=queue, task_id=task_id, expires=expires)
         return task_result
 
+    def send_chain(self, steps: List[Tuple[str, list, str]], task_id: Optional[str] = None, expires: Optional[datetime] = None) -> AsyncResult:
+        # Results go straight from one worker to the next; a failed step marks
+        # the remaining steps (and so the workflow's task id) as failed.
+        # Every step gets the deadline, as an ISO string so msgpack can carry it in the chain.
+        options = {"expires": expires.isoformat()} if expires is not None else {}
+        workflow = chain(*(self.celery_app.signature(name, args=args, queue=queue, **options) for name, args, queue in steps))
+        return workflow.apply_async(task_id=task_id)
+
+    def store_result(self, task_id: str, result) -> None:
+        self.celery_app.backend.store_result(task_id, result, "SUCCESS")
+
     def get_task_status(self, task_id: str) -> TaskStatus:
         task_result = AsyncResult(task_id, app=self.celery_app)
 
@@ -0,0 +1,167 @@
+import os
+import re
+import gzip
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Engine
+
+TABLE_NAME = "chat_history"
+DEFAULT_PARTITION = f"{TABLE_NAME}_default"
+PARTITION_PATTERN = re.compile(rf"^{TABLE_NAME}_y(\d{{4}})m(\d{{2}})$")
+# Serializes schema changes between API replicas and workers starting at once.
+ADVISORY_LOCK_KEY = 7303010401
+
+CREATE_PARTITIONED_TABLE = f"""
+CREATE TABLE {TABLE_NAME} (
+    id BIGSERIAL,
+    session_id VARCHAR,
+    human_message TEXT,
+    ai_message TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE_NAME}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """The month a partition covers, or None for tables that aren't monthly partitions."""
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def expired_partitions(names: Iterable[str], retention_months: int, now: Optional[datetime] = None) -> List[str]:
+    """Monthly partitions that lie entirely before the retention window, oldest first."""
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    months = {name: partition_month(name) for name in names}
+    return sorted((name for name, month in months.items() if month is not None and month < cutoff), key=months.get)
+
+
+def ensure_partitioned_table(engine: Engine) -> None:
+    """
+    Makes chat_history a table range-partitioned by created_at (Postgres only).
+    An existing unpartitioned table is migrated once; its rows are stamped
+    with the migration time, since they were never timestamped.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        kind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": TABLE_NAME}
+        ).scalar()
+        if kind == "p":
+            return
+
+        if kind is not None:
+            print(f"Migrating {TABLE_NAME} to a table partitioned by month...")
+            conn.execute(text(f"ALTER TABLE {TABLE_NAME} RENAME TO {TABLE_NAME}_unpartitioned"))
+        conn.execute(text(CREATE_PARTITIONED_TABLE))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE_NAME} DEFAULT"))
+        _create_partitions(conn, month_start(datetime.now(timezone.utc)), months_ahead=2)
+        if kind is not None:
+            conn.execute(text(
+                f"INSERT INTO {TABLE_NAME} (id, session_id, human_message, ai_message) "
+                f"SELECT id, session_id, human_message, ai_message FROM {TABLE_NAME}_unpartitioned"
+            ))
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{TABLE_NAME}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {TABLE_NAME}), false)"
+            ))
+            conn.execute(text(f"DROP TABLE {TABLE_NAME}_unpartitioned"))
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = 2) -> None:
+    """Creates the partitions for this month and the next `months_ahead` months."""
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        _create_partitions(conn, month_start(datetime.now(timezone.utc)), months_ahead)
+
+
+def _create_partitions(conn, first_month: datetime, months_ahead: int) -> None:
+    for offset in range(months_ahead + 1):
+        month = add_months(first_month, offset)
+        try:
+            with conn.begin_nested():
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE_NAME} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                ))
+        except DBAPIError as e:
+            # e.g. the default partition already holds rows for that month; they stay there.
+            print(f"Could not create partition {partition_name(month)}: {e}")
+
+
+def list_partition_tables(engine: Engine) -> List[str]:
+    """Monthly partition tables, attached or left detached by an interrupted archival run."""
+    with engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname LIKE :prefix"
+        ), {"prefix": f"{TABLE_NAME}_y%"}).scalars().all()
+    return [name for name in names if PARTITION_PATTERN.match(name)]
+
+
+def write_archive(rows: Iterable, path: Path) -> int:
+    """Writes rows as gzip-compressed NDJSON, atomically. Returns the number of rows."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    count = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            record = dict(row._mapping)
+            record["created_at"] = record["created_at"].isoformat()
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def archive_expired_partitions(engine: Engine, retention_months: int, archive_dir: Optional[Path]) -> List[str]:
+    """
+    Detaches each monthly partition older than the retention window, writes it
+    to `archive_dir` as <partition>.ndjson.gz (unless archive_dir is None) and
+    drops it. Safe to re-run after an interruption.
+    """
+    archived = []
+    attached = _attached_partitions(engine)
+    for name in expired_partitions(list_partition_tables(engine), retention_months):
+        if name in attached:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {name}"))
+        if archive_dir is not None:
+            with engine.connect() as conn:
+                rows = conn.execution_options(yield_per=1000).execute(
+                    text(f"SELECT id, session_id, human_message, ai_message, created_at FROM {name} ORDER BY id")
+                )
+                count = write_archive(rows, Path(archive_dir) / f"{name}.ndjson.gz")
+            print(f"Archived {count} rows of {name} to {archive_dir}.")
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+        archived.append(name)
+    return archived
+
+
+def _attached_partitions(engine: Engine) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table)"
+        ), {"table": TABLE_NAME}).scalars().all())
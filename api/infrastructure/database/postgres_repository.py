@@ -1,41 +1,90 @@
 import os
-import psycopg2
-from sqlalchemy import create_engine, Column, String, Integer, Text
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, select, func, Column, String, Integer, BigInteger, Text, DateTime, Index
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from typing import List
+from typing import Iterator, List, Optional
 
 from ...domain.models import ChatHistory
 from ...domain.ports import IChatRepository
+from .partitions import ensure_partitioned_table, ensure_partitions
 
 # SQLAlchemy setup
-DATABASE_URL = os.environ.get("supabase_POSTGRES_URL")
-if not DATABASE_URL:
-    raise ValueError("supabase_POSTGRES_URL must be set in environment variables")
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # Define the table model
 class ChatHistoryORM(Base):
     __tablename__ = "chat_history"
 
-    id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True)
+    # On Postgres the table is range-partitioned by created_at (see partitions.py),
+    # with (id, created_at) as its primary key; ids still come from one sequence.
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    session_id = Column(String)
     human_message = Column(Text)
     ai_message = Column(Text)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(),
+                        default=lambda: datetime.now(timezone.utc))
+
+    # Keyset pagination and export walk a session in id order.
+    __table_args__ = (Index("ix_chat_history_session_id_id", "session_id", "id"),)
+
+_engine = None
+_SessionLocal = None
+_engine_lock = threading.Lock()
+
+def get_session_factory() -> sessionmaker:
+    """
+    Creates the engine (and the tables, if missing) on first use, so importing
+    this module never needs the database or its credentials.
+    """
+    global _engine, _SessionLocal
+    with _engine_lock:
+        if _SessionLocal is None:
+            database_url = os.environ.get("supabase_POSTGRES_URL")
+            if not database_url:
+                raise ValueError("supabase_POSTGRES_URL must be set in environment variables")
+            engine = create_engine(database_url, pool_pre_ping=True)
+            if engine.dialect.name == "postgresql":
+                ensure_partitioned_table(engine)
+                ensure_partitions(engine)
+            # Create the table in the database if it doesn't exist
+            Base.metadata.create_all(bind=engine)
+            # create_all skips indexes of tables that already exist.
+            for index in ChatHistoryORM.__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
+            _engine = engine
+            _SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return _SessionLocal
+
+def get_engine() -> Engine:
+    get_session_factory()
+    return _engine
+
+_HISTORY_COLUMNS = (ChatHistoryORM.id, ChatHistoryORM.session_id, ChatHistoryORM.human_message, ChatHistoryORM.ai_message, ChatHistoryORM.created_at)
 
-# Create the table in the database if it doesn't exist
-Base.metadata.create_all(bind=engine)
+def _to_chat_history(row) -> ChatHistory:
+    # Rows come straight from the database; skip re-validating them.
+    return ChatHistory.model_construct(id=row.id, session_id=row.session_id, human_message=row.human_message,
+                                       ai_message=row.ai_message, created_at=row.created_at)
+
+def _session_query(session_id: str, since: Optional[datetime], until: Optional[datetime]):
+    # A created_at bound lets Postgres skip the monthly partitions outside it.
+    query = select(*_HISTORY_COLUMNS).where(ChatHistoryORM.session_id == session_id)
+    if since is not None:
+        query = query.where(ChatHistoryORM.created_at >= since)
+    if until is not None:
+        query = query.where(ChatHistoryORM.created_at < until)
+    return query
 
 class PostgresChatRepository(IChatRepository):
-    def __init__(self):
-        self.db_session = SessionLocal()
+    def __init__(self, session_factory: Optional[sessionmaker] = None):
+        self.db_session = (session_factory or get_session_factory())()
 
     def add(self, chat_history: ChatHistory) -> None:
         try:
-            db_chat = ChatHistoryORM(**chat_history.model_dump())
+            db_chat = ChatHistoryORM(**chat_history.model_dump(exclude={"id", "created_at"}))
             self.db_session.add(db_chat)
             self.db_session.commit()
         except Exception as e:
@@ -45,8 +94,30 @@ class PostgresChatRepository(IChatRepository):
             self.db_session.close()
 
     def get_by_session_id(self, session_id: str) -> List[ChatHistory]:
+        return list(self.iter_by_session_id(session_id))
+
+    def get_page(self, session_id: str, after_id: Optional[int] = None, limit: int = 50,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[ChatHistory]:
+        """Up to `limit` messages with id > after_id, oldest first (keyset pagination on id)."""
+        query = _session_query(session_id, since, until)
+        if after_id is not None:
+            query = query.where(ChatHistoryORM.id > after_id)
+        try:
+            rows = self.db_session.execute(query.order_by(ChatHistoryORM.id).limit(limit))
+            return [_to_chat_history(row) for row in rows]
+        finally:
+            self.db_session.close()
+
+    def iter_by_session_id(self, session_id: str, batch_size: int = 500,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[ChatHistory]:
+        """Streams a whole session through a server-side cursor, `batch_size` rows at a time."""
+        query = (
+            _session_query(session_id, since, until)
+            .order_by(ChatHistoryORM.id)
+            .execution_options(yield_per=batch_size)
+        )
         try:
-            db_chats = self.db_session.query(ChatHistoryORM).filter(ChatHistoryORM.session_id == session_id).all()
-            return [ChatHistory.model_validate(chat) for chat in db_chats]
+            for row in self.db_session.execute(query):
+                yield _to_chat_history(row)
         finally:
             self.db_session.close()
@@ -0,0 +1,77 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from .metrics import metrics
+
+DEADLINE_HEADER = "X-Request-Deadline"
+SHARED_METRICS_KEY = "deadline_metrics"
+
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before the task finished; its work was abandoned."""
+
+    def __init__(self, message: str, stage: str = "inference"):
+        super().__init__(message)
+        self.stage = stage
+
+
+def parse_deadline(value: str) -> datetime:
+    """Parses an ISO 8601 timestamp or Unix seconds; naive timestamps are UTC."""
+    value = value.strip()
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except ValueError:
+        pass
+    deadline = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return deadline if deadline.tzinfo else deadline.replace(tzinfo=timezone.utc)
+
+
+def resolve_deadline(requested: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    The caller's deadline, else now + TASK_MAX_AGE_SECONDS (0, the default,
+    means tasks without a deadline never expire).
+    """
+    if requested is not None:
+        return requested if requested.tzinfo else requested.replace(tzinfo=timezone.utc)
+    max_age = float(os.environ.get("TASK_MAX_AGE_SECONDS", "0"))
+    return datetime.now(timezone.utc) + timedelta(seconds=max_age) if max_age > 0 else None
+
+
+def current_task_deadline() -> Optional[datetime]:
+    """The `expires` of the Celery task running in this thread, if any."""
+    from celery import current_task
+    expires = getattr(getattr(current_task, "request", None), "expires", None)
+    if not expires:
+        return None
+    return parse_deadline(expires) if isinstance(expires, str) else resolve_deadline(expires)
+
+
+def check_deadline(deadline: Optional[datetime], stage: str) -> None:
+    """Raises DeadlineExceeded if the deadline has passed, before doing the work of `stage`."""
+    if deadline is not None and datetime.now(timezone.utc) >= deadline:
+        raise DeadlineExceeded(f"Deadline {deadline.isoformat()} passed before {stage} finished", stage)
+
+
+def record_deadline_miss(task_name: str, stage: str, redis_client=None) -> None:
+    """
+    Counts a task dropped for being past its deadline: "queued" when the
+    worker discarded it unstarted, otherwise the stage it was abandoned in.
+    """
+    metrics.incr("deadline_exceeded", task=task_name, stage=stage)
+    try:
+        if redis_client is None:
+            from .redis_client import get_redis_client
+            redis_client = get_redis_client()
+        redis_client.hincrby(SHARED_METRICS_KEY, f"{task_name}|{stage}", 1)
+    except Exception as e:
+        print(f"Could not record the deadline miss: {e}")
+
+
+def shared_deadline_metrics(redis_client) -> Dict[str, Dict[str, int]]:
+    """Tasks dropped past their deadline, by task name and stage, recorded by every worker."""
+    stats: Dict[str, Dict[str, int]] = {}
+    for field, value in redis_client.hgetall(SHARED_METRICS_KEY).items():
+        task_name, _, stage = field.rpartition("|")
+        stats.setdefault(task_name, {})[stage] = int(value)
+    return stats
@@ -1,12 +1,23 @@
 import os
 from pathlib import Path
+from typing import Optional
 import google.genai as genai
+from google.genai import errors as genai_errors
 from PIL import Image
 from google.api_core.exceptions import ResourceExhausted # Import ResourceExhausted
 from fastapi import HTTPException, status # Import HTTPException and status
 
+from ..domain.models import GenerationOptions, GenerationResult
 from ..domain.ports import ITextGenerator, IGeminiClient # Implement both for now
 
+
+class GeminiQuotaExceeded(RuntimeError):
+    """Gemini answered 429: a rate or daily quota is used up."""
+
+
+def is_quota_error(error: Exception) -> bool:
+    return isinstance(error, ResourceExhausted) or (isinstance(error, genai_errors.APIError) and error.code == 429)
+
 class GeminiClient(ITextGenerator, IGeminiClient):
     def __init__(self):
         api_key = os.environ.get("GEMINI_API_KEY")
@@ -15,20 +26,43 @@ class GeminiClient(ITextGenerator, IGeminiClient):
         
         self.client = genai.Client(api_key=api_key)
         
-    def generate_text(self, prompt: str, model: str = 'gemini-pro') -> str:
+    def generate_text(self, prompt: str, model: str = 'gemini-pro', options: Optional[GenerationOptions] = None) -> str:
+        return self.generate(prompt, model, options).text
+
+    def generate(self, prompt: str, model: str = 'gemini-pro', options: Optional[GenerationOptions] = None) -> GenerationResult:
+        kwargs = {}
+        if options is not None:
+            values = {
+                "max_output_tokens": options.max_output_tokens,
+                "stop_sequences": options.stop,
+                "temperature": options.temperature,
+                "seed": options.seed,
+            }
+            config = {name: value for name, value in values.items() if value is not None}
+            if config:
+                kwargs["config"] = config
         try:
             response = self.client.models.generate_content(
                 model=model,
-                contents=prompt
+                contents=prompt,
+                **kwargs
             )
-            return response.text
-        except ResourceExhausted as e: # Catch specific quota error
-            print(f"Quota exceeded for Gemini API: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Quota exceeded for Gemini API: {e}"
+            usage = getattr(response, "usage_metadata", None)
+            candidates = getattr(response, "candidates", None) or []
+            reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+            reason = str(getattr(reason, "name", reason) or "").lower() or None
+            return GenerationResult(
+                text=response.text,
+                output_tokens=getattr(usage, "candidates_token_count", None),
+                finish_reason="length" if reason == "max_tokens" else reason, # Same name as Ollama and llama.cpp
             )
         except Exception as e:
+            if is_quota_error(e):
+                print(f"Quota exceeded for Gemini API: {e}")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"Quota exceeded for Gemini API: {e}"
+                )
             print(f"Error generating text with Gemini API: {e}")
             raise RuntimeError(f"Failed to generate text with Gemini API: {e}")
 
@@ -43,12 +77,10 @@ class GeminiClient(ITextGenerator, IGeminiClient):
         except FileNotFoundError:
             print(f"Error: Image file not found at {image_path}")
             raise
-        except ResourceExhausted as e: # Catch specific quota error
-            print(f"Quota exceeded for Gemini API: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Quota exceeded for Gemini API: {e}"
-            )
         except Exception as e:
+            if is_quota_error(e):
+                # Raised to the vision worker, which pauses spillover for a while.
+                print(f"Quota exceeded for Gemini API: {e}")
+                raise GeminiQuotaExceeded(f"Quota exceeded for Gemini API: {e}") from e
             print(f"Error analyzing image with Gemini API: {e}")
             raise RuntimeError(f"Failed to analyze image with Gemini API: {e}")
@@ -1,22 +1,31 @@
 import os
 import uuid
 from pathlib import Path
-from io import BytesIO
-from PIL import Image
+from typing import Optional
 
 import google.genai as genai
 from google.api_core.exceptions import ResourceExhausted # Import ResourceExhausted
 from fastapi import HTTPException, status # Import HTTPException and status
 
 from ..domain.ports import IImageGenerator
+from .generated_image_cache import (
+    GENERATED_IMAGES_URL_PATH,
+    extension_for_mime_type,
+    get_enabled_variants,
+    get_generated_image_cache,
+    prompt_cache_key,
+)
 
 class GeminiImageClient(IImageGenerator):
-    def __init__(self):
+    MODEL = 'gemini-pro-vision' # Or appropriate model for image generation
+
+    def __init__(self, output_dir: Optional[Path] = None):
         api_key = os.environ.get("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY must be set in environment variables")
         
         self.client = genai.Client(api_key=api_key)
+        self.output_dir = Path(output_dir or os.environ.get("GENERATED_IMAGES_DIR", "generated_images"))
 
     def generate_image(self, prompt: str) -> str:
         """Generates an image using the Gemini API."""
@@ -26,8 +35,16 @@ class GeminiImageClient(IImageGenerator):
             # Prepend the prompt with instructions for the model to generate an image
             generation_prompt = f"Generate an image of: {prompt}"
 
+            # Identical prompts are served from the on-disk cache instead of regenerating
+            cache = get_generated_image_cache(self.output_dir)
+            cache_key = prompt_cache_key(self.MODEL, generation_prompt)
+            cached_filename = cache.lookup(cache_key)
+            if cached_filename is not None:
+                print(f"Serving cached image {cached_filename}")
+                return f"{GENERATED_IMAGES_URL_PATH}/{cached_filename}"
+
             response = self.client.models.generate_content(
-                model='gemini-pro-vision', # Or appropriate model for image generation
+                model=self.MODEL,
                 contents=[generation_prompt] # Pass prompt as a list
             )
 
@@ -44,23 +61,20 @@ class GeminiImageClient(IImageGenerator):
                 text_response = response.text
                 raise RuntimeError(f"Model did not return an image. It responded with: '{text_response}'")
 
-            # Process the image data
+            # Write the returned bytes as-is; the mime type tells us the format,
+            # so there is no need to decode and re-encode the image here.
             image_bytes = image_part.inline_data.data
-            image = Image.open(BytesIO(image_bytes))
-
-            # Define and create the directory for generated images
-            output_dir = Path("generated_images")
-            output_dir.mkdir(parents=True, exist_ok=True)
+            extension = extension_for_mime_type(image_part.inline_data.mime_type)
 
             # Generate a unique filename and save the image
-            image_filename = f"gemini_image_{uuid.uuid4().hex}.png"
-            image_path = output_dir / image_filename
-            image.save(image_path)
-            
+            image_filename = f"gemini_image_{uuid.uuid4().hex}{extension}"
+            image_path = cache.store(cache_key, image_bytes, image_filename)
+            cache.schedule_variants(cache_key, get_enabled_variants())
+
             print(f"Image saved to {image_path}")
 
             # Return the web-accessible path
-            return f"/{output_dir.name}/{image_filename}"
+            return f"{GENERATED_IMAGES_URL_PATH}/{image_filename}"
 
         except ResourceExhausted as e: # Catch specific quota error
             print(f"Quota exceeded for Gemini API: {e}")
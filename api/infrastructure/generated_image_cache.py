@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+INDEX_FILENAME = ".cache_index.json"
+
+# Where main.py mounts the generated images directory, whatever its name on disk.
+GENERATED_IMAGES_URL_PATH = "/generated_images"
+
+MIME_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+# Variants are derived on a single background thread so they never compete
+# with request handling for more than one core.
+_variant_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-variants")
+
+
+def extension_for_mime_type(mime_type: Optional[str]) -> str:
+    if mime_type in MIME_EXTENSIONS:
+        return MIME_EXTENSIONS[mime_type]
+    return (mime_type and mimetypes.guess_extension(mime_type)) or ".png"
+
+
+def prompt_cache_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def get_enabled_variants() -> List[str]:
+    """Reads GENERATED_IMAGE_VARIANTS, e.g. 'thumbnail,webp'. Empty disables variants."""
+    names = os.environ.get("GENERATED_IMAGE_VARIANTS", "")
+    return [name.strip() for name in names.split(",") if name.strip() in ("thumbnail", "webp")]
+
+
+def generate_variants(image_path: Path, variants: List[str], thumbnail_size: int = 256) -> List[str]:
+    """Writes derived images next to `image_path` and returns their filenames."""
+    from PIL import Image # Only needed off the request path
+
+    written = []
+    with Image.open(image_path) as image:
+        image.load()
+        if "webp" in variants and image_path.suffix != ".webp":
+            target = image_path.with_suffix(".webp")
+            image.save(target, format="WEBP", quality=85)
+            written.append(target.name)
+        if "thumbnail" in variants:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+            target = image_path.with_name(f"{image_path.stem}_thumb.webp")
+            thumbnail.save(target, format="WEBP", quality=80)
+            written.append(target.name)
+    return written
+
+
+class GeneratedImageCache:
+    """
+    Prompt-hash index over the generated images directory.
+
+    The index maps prompt keys to stored files and is bounded by total size;
+    the least recently used entries (and their variants) are evicted first.
+    Access times are only kept in memory on a hit and written out at most
+    every `save_interval` seconds, with the next store, or on flush().
+    """
+
+    def __init__(self, directory: Path, max_bytes: Optional[int] = None, save_interval: float = 30.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / INDEX_FILENAME
+        self.max_bytes = max_bytes or int(os.environ.get("GENERATED_IMAGES_MAX_BYTES", str(500 * 1024 * 1024)))
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = self._load()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Returns the cached filename for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not (self.directory / entry["filename"]).exists():
+                del self._entries[key]
+                self._dirty = True
+                return None
+            entry["last_access"] = time.time()
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.save_interval:
+                self._save()
+            return entry["filename"]
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def store(self, key: str, data: bytes, filename: str) -> Path:
+        """Writes `data` as-is (no decode/re-encode) and records it in the index."""
+        path = self.directory / filename
+        tmp_path = path.with_name(f".{filename}.tmp")
+        with open(tmp_path, "wb") as buffer:
+            buffer.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous["filename"] != filename:
+                self._remove_files([previous["filename"]] + previous.get("variants", []))
+            self._entries[key] = {
+                "filename": filename,
+                "size": len(data),
+                "variants": [],
+                "last_access": time.time(),
+            }
+            self._evict()
+            self._save()
+        return path
+
+    def schedule_variants(self, key: str, variants: List[str]) -> None:
+        if variants:
+            _variant_executor.submit(self._build_variants, key, variants)
+
+    def _build_variants(self, key: str, variants: List[str]) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            filename = entry["filename"] if entry else None
+        if filename is None:
+            return
+        try:
+            written = generate_variants(self.directory / filename, variants)
+        except Exception as e:
+            print(f"Failed to generate variants for {filename}: {e}")
+            return
+        size = sum((self.directory / name).stat().st_size for name in written)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: # Evicted while we were working
+                self._remove_files([filename] + written)
+                return
+            entry["variants"] = written
+            entry["size"] += size
+            self._evict()
+            self._save()
+
+    def _evict(self) -> None:
+        # Caller must hold self._lock.
+        total = sum(entry["size"] for entry in self._entries.values())
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            self._remove_files([entry["filename"]] + entry.get("variants", []))
+            total -= entry["size"]
+            del self._entries[key]
+
+    def _remove_files(self, filenames: List[str]) -> None:
+        for name in filenames:
+            try:
+                (self.directory / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self) -> None:
+        # Caller must hold self._lock.
+        tmp_path = self.index_path.with_name(f"{INDEX_FILENAME}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+
+_caches: Dict[str, GeneratedImageCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_generated_image_cache(directory: Path) -> GeneratedImageCache:
+    """Returns the process-wide cache for `directory`, so all requests share one index and lock."""
+    resolved = str(Path(directory).resolve())
+    with _caches_lock:
+        if resolved not in _caches:
+            _caches[resolved] = GeneratedImageCache(Path(directory))
+        return _caches[resolved]
+
+
+def flush_generated_image_caches() -> None:
+    """Persists pending access times; called on API shutdown."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.flush()
@@ -0,0 +1,33 @@
+import os
+from typing import Optional
+
+import redis
+
+from ..domain.ports import IIdempotencyStore
+from .redis_client import get_redis_client
+
+KEY_PREFIX = "idempotency"
+
+
+class RedisIdempotencyStore(IIdempotencyStore):
+    """Maps idempotency keys to Celery task ids with a TTL (SET NX, so reservation is atomic)."""
+
+    def __init__(self, client: Optional[redis.Redis] = None, ttl_seconds: Optional[int] = None):
+        self.client = client or get_redis_client()
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "900"))
+
+    def reserve(self, key: str, task_id: str) -> Optional[str]:
+        redis_key = f"{KEY_PREFIX}:{key}"
+        if self.client.set(redis_key, task_id, nx=True, ex=self.ttl_seconds):
+            return None
+        existing = self.client.get(redis_key)
+        if existing is None:
+            # The key expired between SET and GET; try once more.
+            return None if self.client.set(redis_key, task_id, nx=True, ex=self.ttl_seconds) else self.client.get(redis_key)
+        return existing
+
+    def replace(self, key: str, task_id: str) -> None:
+        self.client.set(f"{KEY_PREFIX}:{key}", task_id, ex=self.ttl_seconds)
+
+    def release(self, key: str) -> None:
+        self.client.delete(f"{KEY_PREFIX}:{key}")
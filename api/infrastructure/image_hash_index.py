@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+LOG_FILENAME = "entries.log"
+
+
+def perceptual_hash(image_path: str) -> int:
+    """
+    64-bit DCT perceptual hash (pHash) of an image file.
+
+    Re-encoding, resizing and small crops or colour changes flip only a few
+    bits, so near-identical photos end up a small Hamming distance apart.
+    """
+    image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not decode image: {image_path}")
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(small)[:8, :8].flatten()
+    # The DC term only reflects overall brightness; leave it out of the median.
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, image_hash: int) -> np.ndarray:
+    """Number of differing bits between `image_hash` and every hash in the uint64 array."""
+    differing = np.bitwise_xor(hashes, np.uint64(image_hash))
+    return np.unpackbits(differing.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def get_dedup_thresholds() -> Dict[str, int]:
+    """Parses IMAGE_DEDUP_THRESHOLDS, e.g. 'loja-a=4,loja-b=10,loja-c=-1'."""
+    thresholds = {}
+    for item in os.environ.get("IMAGE_DEDUP_THRESHOLDS", "").split(","):
+        if "=" in item:
+            project_id, value = item.rsplit("=", 1)
+            thresholds[project_id.strip()] = int(value)
+    return thresholds
+
+
+def get_dedup_max_distance(project_id: Optional[str]) -> Optional[int]:
+    """Max Hamming distance treated as a duplicate for the project; None disables deduplication."""
+    thresholds = get_dedup_thresholds()
+    if project_id in thresholds:
+        max_distance = thresholds[project_id]
+    else:
+        max_distance = int(os.environ.get("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+    return max_distance if max_distance >= 0 else None
+
+
+class _PartitionState:
+    """A partition's entries, replayed from its log up to `offset` bytes of the file `inode`."""
+
+    def __init__(self, inode: Optional[int] = None):
+        self.inode = inode
+        self.offset = 0
+        self.records = 0 # Lines replayed, live or not
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._hashes: Optional[np.ndarray] = None
+
+    @property
+    def hashes(self) -> np.ndarray:
+        if self._hashes is None:
+            self._hashes = np.array([entry["hash"] for entry in self.entries.values()], dtype=np.uint64)
+        return self._hashes
+
+
+class ImageHashIndex:
+    """
+    Persisted perceptual-hash index of analysed images, one partition per project.
+
+    Each partition is an append-only log with one JSON record per claim,
+    result or discard, keyed by task id; every process replays only the
+    records appended since it last looked. Writers take a file lock, so several
+    vision worker processes or containers can share the directory. Once most
+    records are superseded, the log is compacted to one record per entry.
+    """
+
+    def __init__(self, directory: Path, max_entries: int = 50000, pending_ttl: float = 600.0,
+                 compact_min_records: int = 1000):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.pending_ttl = pending_ttl
+        self.compact_min_records = compact_min_records
+        self._partitions: Dict[str, _PartitionState] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, project_id: Optional[str], image_hash: int, max_distance: int, task_id: str) -> Optional[dict]:
+        """
+        Returns the nearest entry within `max_distance` (finished, or still being
+        analysed by another task). If there is none, records `task_id` as
+        analysing this image, so near-duplicates arriving meanwhile wait for it.
+        """
+        def update(state: _PartitionState):
+            entry = self._nearest(state, image_hash, max_distance)
+            if entry is not None:
+                return entry, None
+            return None, {"task_id": task_id, "hash": image_hash, "status": "PENDING", "created_at": time.time()}
+
+        return self._update(project_id, update)
+
+    def complete(self, project_id: Optional[str], task_id: str, image_hash: int, result) -> None:
+        """Stores the analysis for the image hashed as `image_hash`."""
+        record = {"task_id": task_id, "hash": image_hash, "status": "SUCCESS", "result": result, "created_at": time.time()}
+        self._update(project_id, lambda state: (None, record))
+
+    def discard(self, project_id: Optional[str], task_id: str) -> None:
+        """Drops the pending entry of a task whose analysis failed."""
+        def update(state: _PartitionState):
+            if task_id not in state.entries:
+                return None, None
+            return None, {"task_id": task_id, "status": "DISCARDED"}
+
+        self._update(project_id, update)
+
+    def wait_for_result(self, project_id: Optional[str], task_id: str, timeout: float, poll_interval: float = 1.0):
+        """Polls until `task_id`'s analysis is stored. Returns it, or None on timeout or failure."""
+        deadline = time.monotonic() + timeout
+        partition = self._partition(project_id)
+        while True:
+            with self._lock:
+                entry = self._refresh(partition).entries.get(task_id)
+            if entry is None:
+                return None # The other task failed and discarded its claim
+            if entry["status"] == "SUCCESS":
+                return entry["result"]
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def _nearest(self, state: _PartitionState, image_hash: int, max_distance: int) -> Optional[dict]:
+        if len(state.entries) == 0:
+            return None
+        distances = hamming_distances(state.hashes, image_hash)
+        entries = list(state.entries.values())
+        now = time.time()
+        best = None
+        for row in np.argsort(distances, kind="stable"):
+            if distances[row] > max_distance:
+                break
+            entry = entries[row]
+            if entry["status"] == "SUCCESS":
+                return entry
+            if best is None and now - entry["created_at"] < self.pending_ttl:
+                best = entry # A live claim; keep looking for a finished analysis first
+        return best
+
+    def _apply(self, state: _PartitionState, record: dict) -> None:
+        # A task's later record replaces its entry in place; the oldest entries go past max_entries.
+        if record["status"] == "DISCARDED":
+            state.entries.pop(record["task_id"], None)
+        else:
+            state.entries[record["task_id"]] = record
+            while len(state.entries) > self.max_entries:
+                state.entries.popitem(last=False)
+        state.records += 1
+        state._hashes = None
+
+    def _partition(self, project_id: Optional[str]) -> Path:
+        # project_id comes from clients; hash it rather than using it as a path.
+        return self.directory / hashlib.sha256((project_id or "").encode("utf-8")).hexdigest()[:16]
+
+    def _refresh(self, partition: Path) -> _PartitionState:
+        """Replays records appended since the last call. Caller must hold self._lock."""
+        state = self._partitions.get(partition.name)
+        try:
+            log_file = open(partition / LOG_FILENAME, "rb")
+        except FileNotFoundError:
+            state = _PartitionState()
+            self._partitions[partition.name] = state
+            return state
+        with log_file:
+            stat = os.fstat(log_file.fileno())
+            if state is None or state.inode != stat.st_ino or stat.st_size < state.offset:
+                state = _PartitionState(stat.st_ino) # New, or compacted by another process
+                self._partitions[partition.name] = state
+            log_file.seek(state.offset)
+            data = log_file.read()
+        complete = data.rfind(b"\n") + 1 # A writer may be halfway through the last line
+        for line in data[:complete].splitlines():
+            try:
+                self._apply(state, json.loads(line))
+            except (ValueError, KeyError):
+                print(f"Skipping a corrupt record in the image hash index at {partition}.")
+        state.offset += complete
+        return state
+
+    def _update(self, project_id: Optional[str], update: Callable):
+        partition = self._partition(project_id)
+        partition.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(partition / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = self._refresh(partition)
+                result, record = update(state)
+                if record is not None:
+                    self._append(partition, state, record)
+                    if state.records > max(self.compact_min_records, 2 * len(state.entries)):
+                        self._compact(partition, state)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, partition: Path, state: _PartitionState, record: dict) -> None:
+        # Caller holds the file lock and has replayed the whole log.
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(partition / LOG_FILENAME, "ab") as log_file:
+            log_file.write(line)
+            state.inode = os.fstat(log_file.fileno()).st_ino
+        state.offset += len(line)
+        self._apply(state, record)
+
+    @staticmethod
+    def _compact(partition: Path, state: _PartitionState) -> None:
+        # Readers notice the new inode and replay the compacted log from the start.
+        tmp_path = partition / f".{LOG_FILENAME}.tmp"
+        with open(tmp_path, "wb") as log_file:
+            for entry in state.entries.values():
+                log_file.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            state.inode = os.fstat(log_file.fileno()).st_ino
+            state.offset = log_file.tell()
+        os.replace(tmp_path, partition / LOG_FILENAME)
+        state.records = len(state.entries)
+
+
+_index: Optional[ImageHashIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_image_hash_index() -> ImageHashIndex:
+    """Returns the process-wide index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ImageHashIndex(
+                Path(os.environ.get("IMAGE_HASH_INDEX_DIR", "/app/image_hash_index")),
+                max_entries=int(os.environ.get("IMAGE_HASH_INDEX_MAX_ENTRIES", "50000")),
+            )
+        return _index
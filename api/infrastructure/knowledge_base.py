@@ -0,0 +1,153 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..domain.ports import ITextEmbedder
+from .ollama_client import OllamaClient
+from .vector_index import VectorIndex
+
+MANIFEST_FILENAME = "manifest.json"
+INDEXED_SUFFIXES = (".md", ".txt", ".csv", ".json")
+
+
+def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    """Splits text into ~chunk_size character passages, preferring paragraph boundaries."""
+    chunks, current = [], ""
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > chunk_size:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > chunk_size:
+            chunks.append(current[:chunk_size])
+            current = current[chunk_size - overlap:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class KnowledgeBaseIndex:
+    """
+    Persisted retrieval index over the knowledge_base directory.
+
+    Passages are embedded once and stored as a memory-mapped vector matrix
+    plus JSONL metadata. `refresh()` only re-embeds files whose content hash
+    changed since the last run; readers pick up a new index on their next search.
+    """
+
+    def __init__(self, source_dir: Path, index_dir: Path, embedder: ITextEmbedder, batch_size: int = 32):
+        self.source_dir = Path(source_dir)
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self._index: Optional[VectorIndex] = None
+        self._loaded_version = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> dict:
+        """Incrementally re-indexes changed files. Returns counts of what changed."""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.index_dir / ".lock", "w") as lock_file:
+            # Several worker processes may refresh at once; only one writes at a time.
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return self._refresh_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_locked(self) -> dict:
+        manifest = self._load_manifest()
+        try:
+            # remove() below copies the rows it keeps, so the map is never written to.
+            index = VectorIndex.load(self.index_dir, mmap=True, strict=True)
+        except ValueError:
+            index, manifest = VectorIndex(), {} # Unreadable: rebuild it from every file
+        current = {}
+        for path in sorted(self.source_dir.rglob("*")):
+            if path.is_file() and path.suffix.lower() in INDEXED_SUFFIXES:
+                current[str(path.relative_to(self.source_dir))] = hashlib.sha256(path.read_bytes()).hexdigest()
+
+        changed = [name for name, digest in current.items() if manifest.get(name) != digest]
+        removed = [name for name in manifest if name not in current]
+        if not changed and not removed:
+            return {"changed": 0, "removed": 0, "passages": len(index)}
+
+        stale = set(changed) | set(removed)
+        index.remove([row for row, meta in enumerate(index.metadata) if meta["source"] in stale])
+
+        for name in changed:
+            text = (self.source_dir / name).read_text(encoding="utf-8", errors="ignore")
+            passages = chunk_text(text)
+            vectors = []
+            for start in range(0, len(passages), self.batch_size):
+                vectors.extend(self.embedder.embed(passages[start:start + self.batch_size]))
+            # One copy into the index per file rather than per passage.
+            index.add_many(vectors, [{"source": name, "chunk": chunk, "text": passage} for chunk, passage in enumerate(passages)])
+
+        index.save(self.index_dir)
+        self._save_manifest(current)
+        print(f"Knowledge base re-indexed: {len(changed)} changed, {len(removed)} removed, {len(index)} passages.")
+        return {"changed": len(changed), "removed": len(removed), "passages": len(index)}
+
+    def search(self, query: str, k: int = 3) -> List[Dict]:
+        """Returns the k passages most similar to `query`."""
+        index = self._read_index()
+        if len(index) == 0:
+            return []
+        vector = self.embedder.embed([query])[0]
+        return [
+            {"score": score, "source": meta["source"], "text": meta["text"]}
+            for score, _, meta in index.search(vector, k=k)
+        ]
+
+    def _read_index(self) -> VectorIndex:
+        # Reload (memory-mapped) whenever a refresh has switched CURRENT to a new version.
+        version = VectorIndex.current_version(self.index_dir)
+        with self._lock:
+            if self._index is None or version != self._loaded_version:
+                try:
+                    self._index = VectorIndex.load(self.index_dir, mmap=True, strict=True)
+                    self._loaded_version = version
+                except ValueError:
+                    # Not cached: the next search tries again. Meanwhile, keep serving the previous index.
+                    return self._index if self._index is not None else VectorIndex()
+            return self._index
+
+    def _load_manifest(self) -> Dict[str, str]:
+        try:
+            with open(self.index_dir / MANIFEST_FILENAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, str]) -> None:
+        tmp_path = self.index_dir / f".{MANIFEST_FILENAME}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.index_dir / MANIFEST_FILENAME)
+
+
+_knowledge_base: Optional[KnowledgeBaseIndex] = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base() -> Optional[KnowledgeBaseIndex]:
+    """Returns the process-wide index, or None when no knowledge base is mounted."""
+    global _knowledge_base
+    source_dir = Path(os.environ.get("KNOWLEDGE_BASE_DIR", "/app/knowledge_base"))
+    if not source_dir.is_dir():
+        return None
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = KnowledgeBaseIndex(
+                source_dir,
+                Path(os.environ.get("KNOWLEDGE_BASE_INDEX_DIR", "/app/knowledge_base_index")),
+                OllamaClient(),
+            )
+        return _knowledge_base
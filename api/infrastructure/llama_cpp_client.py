@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from ..domain.models import GenerationOptions, GenerationResult
+from ..domain.ports import ITextGenerator
+
+# Loaded models, one per GGUF path per process. Weights are memory-mapped
+# (use_mmap), so prefork children loading the same file share its pages
+# through the page cache instead of each holding a private copy.
+_models: Dict[str, Any] = {}
+_model_locks: Dict[str, threading.Lock] = {}
+_models_lock = threading.Lock()
+
+
+def get_llama_cpp_settings() -> dict:
+    return {
+        "n_threads": int(os.environ.get("LLAMA_CPP_N_THREADS", str(os.cpu_count() or 1))),
+        "n_ctx": int(os.environ.get("LLAMA_CPP_N_CTX", "4096")),
+        "n_batch": int(os.environ.get("LLAMA_CPP_N_BATCH", "512")),
+        "use_mmap": True,
+        "use_mlock": os.environ.get("LLAMA_CPP_USE_MLOCK", "false").lower() in ("1", "true", "yes"),
+        "verbose": False,
+    }
+
+
+def load_llama_model(model_path: str):
+    """Loads (once per process) and returns the llama.cpp model at `model_path`."""
+    with _models_lock:
+        if model_path not in _models:
+            from llama_cpp import Llama # Optional dependency, only needed on llama.cpp nodes
+
+            settings = get_llama_cpp_settings()
+            print(f"Loading GGUF model {model_path} with {settings}...")
+            _models[model_path] = Llama(model_path=model_path, **settings)
+            _model_locks[model_path] = threading.Lock()
+        return _models[model_path]
+
+
+class LlamaCppClient(ITextGenerator):
+    """Runs GGUF models in-process with llama.cpp, without the Ollama HTTP hop."""
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path or os.environ.get("LLAMA_CPP_MODEL_PATH", "/app/models/model.gguf")
+
+    def resolve_model_path(self, model: Optional[str]) -> str:
+        """
+        A model name ending in .gguf names a file in the default model's directory;
+        anything else ('llama_cpp') means the default model. Names come from API
+        clients, so paths outside that directory are rejected.
+        """
+        if not (model and model.lower().endswith(".gguf")):
+            return self.model_path
+        models_dir = os.path.dirname(os.path.abspath(self.model_path))
+        path = os.path.abspath(os.path.join(models_dir, model))
+        if os.path.dirname(path) != models_dir or not os.path.isfile(path):
+            raise ValueError(f"Unknown llama.cpp model {model}: models must be .gguf files in {models_dir}")
+        return path
+
+    def generate_text(self, prompt: str, model: Optional[str] = None, options: Optional[GenerationOptions] = None) -> str:
+        """Generates text with the local GGUF model."""
+        return self.generate(prompt, model, options).text
+
+    def generate(self, prompt: str, model: Optional[str] = None, options: Optional[GenerationOptions] = None) -> GenerationResult:
+        model_path = self.resolve_model_path(model)
+        kwargs = {}
+        if options is not None:
+            values = {"max_tokens": options.max_output_tokens, "stop": options.stop, "temperature": options.temperature, "seed": options.seed}
+            kwargs = {name: value for name, value in values.items() if value is not None}
+        try:
+            llm = load_llama_model(model_path)
+            # A llama.cpp context is not thread-safe; serialize calls per model.
+            with _model_locks[model_path]:
+                response = llm.create_chat_completion(
+                    messages=[{'role': 'user', 'content': prompt}],
+                    **kwargs
+                )
+            choice = response['choices'][0]
+            return GenerationResult(
+                text=choice['message']['content'],
+                output_tokens=response.get('usage', {}).get('completion_tokens'),
+                finish_reason=choice.get('finish_reason'),
+            )
+        except Exception as e:
+            print(f"Error during llama.cpp text generation: {e}")
+            raise RuntimeError(f"Failed to generate text with llama.cpp model {model_path}: {e}")
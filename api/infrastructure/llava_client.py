@@ -1,20 +1,114 @@
 import os
+import mmap
 import requests
 import json
 import base64
 import time
-from typing import List
+import threading
+from datetime import datetime
+from typing import Iterator, List, Optional, Set, Tuple
+
+from requests.adapters import HTTPAdapter
+
+from .ollama_pool import HOST_ERRORS, OllamaEndpointPool, get_ollama_pool, get_ollama_urls
+from .ollama_warmup import get_keep_alive
+from .deadlines import DeadlineExceeded, check_deadline
+from .ollama_client import ollama_options
+from ..domain.models import GenerationOptions, GenerationResult
+
+# Bytes of image read per base64 chunk; a multiple of 3, so the encoded chunks
+# concatenate into the encoding of the whole file.
+IMAGE_CHUNK_SIZE = 3 * 64 * 1024
+IMAGE_PLACEHOLDER = "__llava_image__"
+
+
+class ImageChatBody:
+    """
+    JSON body of an /api/chat request whose single image is base64-encoded
+    from a memory-mapped file while requests sends it, instead of holding the
+    file, its base64 string and the serialized payload in memory at once.
+    """
+
+    def __init__(self, payload: dict, image_path: str):
+        head, _, tail = json.dumps(payload).rpartition(json.dumps(IMAGE_PLACEHOLDER))
+        self.head = (head + '"').encode("utf-8")
+        self.tail = ('"' + tail).encode("utf-8")
+        self.image_path = image_path
+        self.image_size = os.path.getsize(image_path)
+
+    def __len__(self) -> int:
+        # Lets requests send a Content-Length instead of a chunked body.
+        return len(self.head) + 4 * ((self.image_size + 2) // 3) + len(self.tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.head
+        if self.image_size:
+            with open(self.image_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+                for start in range(0, len(image), IMAGE_CHUNK_SIZE):
+                    yield base64.b64encode(image[start:start + IMAGE_CHUNK_SIZE])
+        yield self.tail
+
+
+class LlavaStreamError(RuntimeError):
+    """An error object sent by Ollama in the middle of a streamed reply."""
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide keep-alive session for Ollama, with room for
+    OLLAMA_MAX_CONCURRENCY_PER_HOST open connections to each host.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=len(get_ollama_urls()),
+                pool_maxsize=int(os.environ.get("OLLAMA_MAX_CONCURRENCY_PER_HOST", "4")),
+            )
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_http_timeout() -> Tuple[float, float]:
+    """(connect, read) timeouts; the read timeout bounds the wait between streamed lines."""
+    return (
+        float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5")),
+        float(os.environ.get("OLLAMA_READ_TIMEOUT", "300")),
+    )
+
 
 class LlavaClient:
-    def __init__(self):
-        self.api_url = "http://ollama:11434"
+    # (host, model) pairs already confirmed as downloaded in this process, so
+    # concurrent tasks don't each re-check /api/tags (or start parallel pulls).
+    _downloaded: Set[Tuple[str, str]] = set()
+    _download_lock = threading.Lock()
+
+    def __init__(self, pool: Optional[OllamaEndpointPool] = None, session: Optional[requests.Session] = None):
+        self.pool = pool or get_ollama_pool()
+        self.session = session or get_http_session()
+        self.timeout = get_http_timeout()
         self.model_name = "llava:7b"
 
-    def _ensure_model_downloaded(self):
-        print(f"Ensuring Ollama model {self.model_name} is downloaded...")
+    def _ensure_model_downloaded(self, api_url: str):
+        if (api_url, self.model_name) in self._downloaded:
+            return
+        with self._download_lock:
+            if (api_url, self.model_name) in self._downloaded:
+                return
+            self._download_model(api_url)
+            self._downloaded.add((api_url, self.model_name))
+
+    def _download_model(self, api_url: str):
+        print(f"Ensuring Ollama model {self.model_name} is downloaded on {api_url}...")
         try:
             # Check if model is already available
-            response = requests.get(f"{self.api_url}/api/tags")
+            response = self.session.get(f"{api_url}/api/tags", timeout=self.timeout)
             response.raise_for_status()
             models = response.json().get("models", [])
             if any(m.get("name") == self.model_name for m in models):
@@ -24,27 +118,20 @@ class LlavaClient:
             print(f"Ollama model {self.model_name} not found. Pulling...")
             # Pull the model
             pull_payload = {"name": self.model_name}
-            pull_response = requests.post(f"{self.api_url}/api/pull", json=pull_payload, stream=True)
-            pull_response.raise_for_status()
-
-            for chunk in pull_response.iter_content(chunk_size=8192):
-                if chunk:
-                    try:
-                        # Ollama streams JSON objects, one per line
-                        for line in chunk.decode('utf-8').splitlines():
-                            if line.strip():
-                                data = json.loads(line)
-                                if "status" in data:
-                                    print(f"Pulling {self.model_name}: {data['status']}")
-                                if "error" in data:
-                                    raise Exception(f"Error pulling model: {data['error']}")
-                    except json.JSONDecodeError:
-                        # Sometimes a chunk might not be a complete JSON line
-                        pass
+            with self.session.post(f"{api_url}/api/pull", json=pull_payload, stream=True, timeout=self.timeout) as pull_response:
+                pull_response.raise_for_status()
+                # Ollama streams JSON objects, one per line
+                for data in iter_ndjson(pull_response):
+                    if "status" in data:
+                        print(f"Pulling {self.model_name}: {data['status']}")
+                    if "error" in data:
+                        raise Exception(f"Error pulling model: {data['error']}")
             print(f"Ollama model {self.model_name} pulled successfully.")
             # Give Ollama a moment to load the model after pulling
             time.sleep(5)
 
+        except HOST_ERRORS:
+            raise # Let the pool count the host as failing
         except requests.exceptions.RequestException as e:
             print(f"Error ensuring Ollama model {self.model_name} is downloaded: {e}")
             raise RuntimeError(f"Failed to ensure Ollama model {self.model_name} is downloaded: {e}")
@@ -52,48 +139,93 @@ class LlavaClient:
             print(f"An unexpected error occurred during model download: {e}")
             raise RuntimeError(f"An unexpected error occurred during model download: {e}")
 
-    def analyze_image(self, image_path: str, prompt: str, model: str = "llava") -> dict:
-        """Analyzes an image using the Ollama LLaVA model."""
-        self._ensure_model_downloaded() # Ensure model is downloaded before analysis
-
+    def analyze_image(self, image_path: str, prompt: str, model: str = "llava", deadline: Optional[datetime] = None,
+                      options: Optional[GenerationOptions] = None) -> dict:
+        """
+        Analyzes an image using the Ollama LLaVA model on the least busy pooled host.
+        Past the `deadline`, the reply stops being read and DeadlineExceeded is raised.
+        """
         if not os.path.exists(image_path):
             return {"status": "FAILURE", "error": f"Image file not found: {image_path}"}
 
-        try:
-            with open(image_path, "rb") as f:
-                image_data = base64.b64encode(f.read()).decode("utf-8")
-        except Exception as e:
-            return {"status": "FAILURE", "error": f"Failed to read or encode image: {e}"}
-
         payload = {
             "model": self.model_name, # Use the ensured model name
             "messages": [
                 {
                     "role": "user",
                     "content": prompt,
-                    "images": [image_data]
+                    "images": [IMAGE_PLACEHOLDER]
                 }
             ],
-            "stream": False
+            "stream": True,
+            "keep_alive": get_keep_alive(self.model_name)
         }
+        if ollama_options(options):
+            payload["options"] = ollama_options(options) # e.g. num_ctx, the window the prompt was budgeted for
 
         try:
-            response = requests.post(
-                f"{self.api_url}/api/chat",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            
-            lines = response.text.strip().split('\n')
-            last_line = json.loads(lines[-1])
-            
-            llava_response_content = last_line.get("message", {}).get("content", "")
+            body = ImageChatBody(payload, image_path)
+        except Exception as e:
+            return {"status": "FAILURE", "error": f"Failed to read or encode image: {e}"}
+
+        try:
+            with self.pool.lease(self.model_name) as endpoint:
+                self._ensure_model_downloaded(endpoint.url) # Ensure model is downloaded before analysis
+                with self.session.post(
+                    f"{endpoint.url}/api/chat",
+                    data=body,
+                    headers={"Content-Type": "application/json"},
+                    stream=True,
+                    timeout=self.timeout
+                ) as response:
+                    response.raise_for_status()
+                    generation = read_chat_stream(response, deadline)
 
-            return {"status": "SUCCESS", "response": llava_response_content}
+            return {
+                "status": "SUCCESS",
+                "response": generation.text,
+                "usage": {"output_tokens": generation.output_tokens, "finish_reason": generation.finish_reason},
+            }
         except requests.exceptions.RequestException as e:
             print(f"Error calling Ollama LLaVA API: {e}")
             return {"status": "FAILURE", "error": str(e)}
         except json.JSONDecodeError as e:
             print(f"Error decoding LLaVA response: {e}")
-            return {"status": "FAILURE", "error": f"Failed to decode response: {response.text}"}
+            return {"status": "FAILURE", "error": f"Failed to decode response: {e.doc}"}
+        except LlavaStreamError as e:
+            print(f"LLaVA reported an error: {e}")
+            return {"status": "FAILURE", "error": str(e)}
+
+
+def iter_ndjson(response: requests.Response) -> Iterator[dict]:
+    """Parses a streamed NDJSON response line by line as it arrives."""
+    for line in response.iter_lines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_chat_stream(response: requests.Response, deadline: Optional[datetime] = None) -> GenerationResult:
+    """
+    Joins the message pieces of a streamed /api/chat reply; the final message
+    carries the token count and why generation stopped. Once the deadline
+    passes, the connection is closed, which makes Ollama stop generating.
+    """
+    pieces: List[str] = []
+    final = {}
+    for data in iter_ndjson(response):
+        try:
+            check_deadline(deadline, "inference")
+        except DeadlineExceeded:
+            response.close()
+            raise
+        if "error" in data:
+            raise LlavaStreamError(data["error"])
+        pieces.append(data.get("message", {}).get("content", ""))
+        if data.get("done"):
+            final = data
+            break
+    return GenerationResult(
+        text="".join(pieces),
+        output_tokens=final.get("eval_count"),
+        finish_reason=final.get("done_reason"), # "length" when num_predict cut the answer
+    )
@@ -1,22 +1,45 @@
+import threading
+from importlib import import_module
+
 from ..domain.ports import ITextGenerator
-from .gemini_client import GeminiClient
-from .ollama_client import OllamaClient
+
+LLAMA_CPP_MODEL_NAMES = ("llama_cpp", "llama.cpp")
+
+def is_llama_cpp_model(model_name: str) -> bool:
+    return model_name.lower() in LLAMA_CPP_MODEL_NAMES or model_name.lower().endswith(".gguf")
 
 class ModelFactory:
     def __init__(self):
-        # Cache instances to avoid re-creating them on every request
-        self._clients = {
-            "gemini": GeminiClient(),
-            "ollama": OllamaClient()
+        # Cache instances to avoid re-creating them on every request.
+        # Clients (and their SDKs) are imported and created on first use, so a
+        # process only needs the dependencies and configuration (e.g.
+        # GEMINI_API_KEY) of the backends it actually uses.
+        self._constructors = {
+            "gemini": ".gemini_client:GeminiClient",
+            "ollama": ".ollama_client:OllamaClient",
+            "llama_cpp": ".llama_cpp_client:LlamaCppClient"
         }
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _get_client(self, name: str) -> ITextGenerator:
+        with self._lock: # Worker threads share one factory
+            if name not in self._clients:
+                module_name, class_name = self._constructors[name].split(":")
+                client_class = getattr(import_module(module_name, __package__), class_name)
+                self._clients[name] = client_class()
+            return self._clients[name]
 
     def get_text_generator(self, model_name: str) -> ITextGenerator:
         """Gets the appropriate text generator client based on the model name."""
         # Simple logic: if the model is 'gemini', use GeminiClient.
+        # 'llama_cpp' (or a .gguf file in the models directory) runs in-process with llama.cpp.
         # Otherwise, assume it's an Ollama model.
         if model_name.lower() == 'gemini':
-            return self._clients["gemini"]
+            return self._get_client("gemini")
+        elif is_llama_cpp_model(model_name):
+            return self._get_client("llama_cpp")
         else:
             # For any other model name (e.g., 'codellama', 'gemma'), use the Ollama client.
             # The Ollama client itself will handle which specific model to call.
-            return self._clients["ollama"]
+            return self._get_client("ollama")
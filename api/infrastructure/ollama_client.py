@@ -1,25 +1,76 @@
 import os
+import threading
+from typing import Dict, List, Optional
+
 import ollama # Import the official ollama library
 
-from ..domain.ports import ITextGenerator
+from ..domain.models import GenerationOptions, GenerationResult
+from ..domain.ports import ITextGenerator, ITextEmbedder
+from .ollama_pool import OllamaEndpoint, OllamaEndpointPool, get_ollama_pool
+from .ollama_warmup import get_keep_alive
+
+def ollama_options(options: Optional[GenerationOptions]) -> Optional[dict]:
+    """Ollama's names for the options that are set."""
+    if options is None:
+        return None
+    values = {
+        "num_predict": options.max_output_tokens,
+        "stop": options.stop,
+        "temperature": options.temperature,
+        "seed": options.seed,
+        "num_ctx": options.context_window,
+    }
+    return {name: value for name, value in values.items() if value is not None} or None
 
-class OllamaClient(ITextGenerator):
-    def __init__(self):
-        self.api_url = os.environ.get("OLLAMA_API_URL", "http://ollama:11434")
-        self.client = ollama.Client(host=self.api_url) # Initialize the official client
+class OllamaClient(ITextGenerator, ITextEmbedder):
+    def __init__(self, pool: Optional[OllamaEndpointPool] = None):
+        self.pool = pool or get_ollama_pool()
+        self._clients: Dict[str, ollama.Client] = {} # One official client per Ollama host
+        self._clients_lock = threading.Lock() # Shared by every thread of a threads-pool worker
 
-    def generate_text(self, prompt: str, model: str = "gemma:2b") -> str:
+    def _client_for(self, endpoint: OllamaEndpoint) -> ollama.Client:
+        with self._clients_lock:
+            if endpoint.url not in self._clients:
+                self._clients[endpoint.url] = ollama.Client(host=endpoint.url)
+            return self._clients[endpoint.url]
+
+    def generate_text(self, prompt: str, model: str = "gemma:2b", options: Optional[GenerationOptions] = None) -> str:
         """Generates text using the Ollama API with a specified model."""
+        return self.generate(prompt, model, options).text
+
+    def generate(self, prompt: str, model: str = "gemma:2b", options: Optional[GenerationOptions] = None) -> GenerationResult:
         try:
-            response = self.client.chat(
-                model=model,
-                messages=[{'role': 'user', 'content': prompt}],
-                stream=False
+            with self.pool.lease(model) as endpoint:
+                response = self._client_for(endpoint).chat(
+                    model=model,
+                    messages=[{'role': 'user', 'content': prompt}],
+                    stream=False,
+                    keep_alive=get_keep_alive(model),
+                    options=ollama_options(options)
+                )
+            return GenerationResult(
+                text=response['message']['content'],
+                output_tokens=response.get('eval_count'),
+                finish_reason=response.get('done_reason'),
             )
-            return response['message']['content']
         except ollama.ResponseError as e:
             print(f"Error calling Ollama API: {e}")
             raise RuntimeError(f"Failed to generate text with Ollama model {model}: {e}")
         except Exception as e:
             print(f"Error during Ollama text generation: {e}")
-            raise RuntimeError(f"Failed to generate text with Ollama model {model}: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Failed to generate text with Ollama model {model}: {e}")
+
+    def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """Embeds texts with OLLAMA_EMBEDDING_MODEL (or `model`)."""
+        model = model or os.environ.get("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+        try:
+            with self.pool.lease(model) as endpoint:
+                response = self._client_for(endpoint).embed(
+                    model=model,
+                    input=texts,
+                    keep_alive=get_keep_alive(model)
+                )
+            return [list(vector) for vector in response['embeddings']]
+        except Exception as e:
+            print(f"Error during Ollama embedding: {e}")
+            raise RuntimeError(f"Failed to embed text with Ollama model {model}: {e}")
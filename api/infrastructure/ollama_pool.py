@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+import httpx
+import requests
+
+# Errors that mean the host itself is unreachable or unhealthy (as opposed to
+# a bad request or an unknown model), and therefore count towards ejection.
+HOST_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    httpx.TransportError,
+)
+
+
+def normalize_model_name(model: str) -> str:
+    """Ollama reports untagged models as '<name>:latest'."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class OllamaEndpoint:
+    """Runtime state for a single Ollama host in the pool."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.resident_models: Set[str] = set()
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_acquired = 0.0
+
+    def is_ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def has_model(self, model: str) -> bool:
+        return normalize_model_name(model) in self.resident_models
+
+
+class OllamaEndpointPool:
+    """
+    Balances Ollama calls across several hosts.
+
+    Hosts are picked by least outstanding requests, preferring hosts that
+    already have the requested model resident in memory. Hosts that fail
+    `max_failures` times in a row are ejected for `ejection_seconds` and are
+    re-probed by the periodic health check.
+
+    With `max_concurrency_per_host`, a host never has more than that many
+    requests in flight; callers (e.g. the threads of a Celery worker) block in
+    `acquire` until a slot frees up, for at most `acquire_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        max_failures: int = 3,
+        ejection_seconds: float = 30.0,
+        health_check_interval: float = 15.0,
+        health_check_timeout: float = 2.0,
+        max_concurrency_per_host: Optional[int] = None,
+        acquire_timeout: float = 300.0,
+    ):
+        if not urls:
+            raise ValueError("OllamaEndpointPool requires at least one URL")
+        self.endpoints = [OllamaEndpoint(url) for url in urls]
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.max_concurrency_per_host = max_concurrency_per_host or None # 0/None = unbounded
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._last_health_check = 0.0
+        self._health_check_running = False
+
+    def acquire(self, model: Optional[str] = None) -> OllamaEndpoint:
+        """Picks the best endpoint for `model` and counts a new outstanding request on it."""
+        self._maybe_check_health()
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                candidates = [e for e in self.endpoints if not e.is_ejected(now)]
+                if not candidates:
+                    # Every host is ejected: try the one whose ejection ends first
+                    # instead of failing outright.
+                    candidates = [min(self.endpoints, key=lambda e: e.ejected_until)]
+                candidates = [e for e in candidates if self._has_free_slot(e)]
+                if candidates:
+                    break
+                if now >= deadline:
+                    raise TimeoutError(
+                        f"No Ollama host had a free slot within {self.acquire_timeout}s "
+                        f"(max {self.max_concurrency_per_host} requests per host)"
+                    )
+                # Re-check at least every second: an ejection may have expired meanwhile.
+                self._slot_freed.wait(min(deadline - now, 1.0))
+
+            endpoint = min(
+                candidates,
+                key=lambda e: (
+                    not (model and e.has_model(model)),
+                    e.outstanding,
+                    e.last_acquired,
+                ),
+            )
+            endpoint.outstanding += 1
+            endpoint.last_acquired = now
+            return endpoint
+
+    def release(self, endpoint: OllamaEndpoint, model: Optional[str] = None, success: bool = True) -> None:
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            self._slot_freed.notify()
+            if success:
+                endpoint.consecutive_failures = 0
+                if model:
+                    endpoint.resident_models.add(normalize_model_name(model))
+            else:
+                self._record_failure(endpoint)
+
+    @contextmanager
+    def lease(self, model: Optional[str] = None) -> Iterator[OllamaEndpoint]:
+        """
+        Context manager around acquire/release. Host-level errors raised inside
+        the block count as failures for the endpoint; other errors (bad request,
+        unknown model) do not.
+        """
+        endpoint = self.acquire(model)
+        try:
+            yield endpoint
+        except HOST_ERRORS:
+            self.release(endpoint, model, success=False)
+            raise
+        except Exception:
+            self.release(endpoint, None, success=True)
+            raise
+        else:
+            self.release(endpoint, model, success=True)
+
+    def check_health(self) -> None:
+        """Probes every endpoint, refreshing resident models and ejection state."""
+        for endpoint in self.endpoints:
+            try:
+                response = requests.get(f"{endpoint.url}/api/ps", timeout=self.health_check_timeout)
+                response.raise_for_status()
+                models = {
+                    normalize_model_name(m.get("name", ""))
+                    for m in response.json().get("models", [])
+                }
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Ollama health check failed for {endpoint.url}: {e}")
+                with self._lock:
+                    self._record_failure(endpoint)
+                continue
+
+            with self._lock:
+                endpoint.resident_models = models
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = 0.0
+                self._slot_freed.notify_all()
+
+    def snapshot(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": e.url,
+                    "outstanding": e.outstanding,
+                    "max_concurrency": self.max_concurrency_per_host,
+                    "resident_models": sorted(e.resident_models),
+                    "consecutive_failures": e.consecutive_failures,
+                    "ejected": e.is_ejected(now),
+                }
+                for e in self.endpoints
+            ]
+
+    def _has_free_slot(self, endpoint: OllamaEndpoint) -> bool:
+        return self.max_concurrency_per_host is None or endpoint.outstanding < self.max_concurrency_per_host
+
+    def _record_failure(self, endpoint: OllamaEndpoint) -> None:
+        # Caller must hold self._lock.
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.max_failures:
+            endpoint.ejected_until = time.monotonic() + self.ejection_seconds
+            endpoint.resident_models = set()
+            print(f"Ejecting Ollama endpoint {endpoint.url} for {self.ejection_seconds}s "
+                  f"after {endpoint.consecutive_failures} consecutive failures.")
+
+    def _maybe_check_health(self) -> None:
+        if len(self.endpoints) == 1 and not self.endpoints[0].consecutive_failures:
+            # Nothing to balance; health only matters once the host starts failing.
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._health_check_running or now - self._last_health_check < self.health_check_interval:
+                return
+            self._health_check_running = True
+            self._last_health_check = now
+        try:
+            self.check_health()
+        finally:
+            with self._lock:
+                self._health_check_running = False
+
+
+def get_ollama_urls() -> List[str]:
+    """Reads the host list from OLLAMA_API_URLS (comma separated), falling back to OLLAMA_API_URL."""
+    urls = os.environ.get("OLLAMA_API_URLS") or os.environ.get("OLLAMA_API_URL", "http://ollama:11434")
+    return [url.strip() for url in urls.split(",") if url.strip()]
+
+
+_pool: Optional[OllamaEndpointPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ollama_pool() -> OllamaEndpointPool:
+    """Returns the process-wide pool shared by OllamaClient and LlavaClient."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OllamaEndpointPool(
+                get_ollama_urls(),
+                max_failures=int(os.environ.get("OLLAMA_MAX_FAILURES", "3")),
+                ejection_seconds=float(os.environ.get("OLLAMA_EJECTION_SECONDS", "30")),
+                health_check_interval=float(os.environ.get("OLLAMA_HEALTH_CHECK_INTERVAL", "15")),
+                max_concurrency_per_host=int(os.environ.get("OLLAMA_MAX_CONCURRENCY_PER_HOST", "4")),
+                acquire_timeout=float(os.environ.get("OLLAMA_ACQUIRE_TIMEOUT", "300")),
+            )
+        return _pool
@@ -0,0 +1,96 @@
+import os
+import time
+from typing import Dict, List, Optional, Union
+
+import requests
+
+from .ollama_pool import HOST_ERRORS, OllamaEndpointPool, get_ollama_pool
+from .prompts import get_context_window
+
+DEFAULT_KEEP_ALIVE = "10m"
+
+# Models each worker queue depends on; warm-up only loads what the worker uses
+# so the text and vision workers don't evict each other's models.
+QUEUE_MODEL_ENV = {
+    "text_queue": ("OLLAMA_TEXT_MODELS", "gemma:2b"),
+    "vision_queue": ("OLLAMA_VISION_MODELS", "llava:7b"),
+}
+
+
+def _parse_keep_alive(value: str) -> Union[str, int]:
+    # Ollama accepts durations ("10m") or seconds; -1 keeps the model loaded forever.
+    value = value.strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def get_keep_alive_policies() -> Dict[str, Union[str, int]]:
+    """Parses OLLAMA_KEEP_ALIVE, e.g. 'gemma:2b=30m,llava:7b=-1'."""
+    policies = {}
+    for item in os.environ.get("OLLAMA_KEEP_ALIVE", "").split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            policies[model.strip()] = _parse_keep_alive(value)
+    return policies
+
+
+def get_keep_alive(model: str) -> Union[str, int]:
+    """Returns the keep-alive policy for `model`, falling back to OLLAMA_DEFAULT_KEEP_ALIVE."""
+    policies = get_keep_alive_policies()
+    if model in policies:
+        return policies[model]
+    return _parse_keep_alive(os.environ.get("OLLAMA_DEFAULT_KEEP_ALIVE", DEFAULT_KEEP_ALIVE))
+
+
+def get_models_for_queues(queues: List[str]) -> List[str]:
+    models = []
+    for queue in queues:
+        if queue not in QUEUE_MODEL_ENV:
+            continue
+        env_name, default = QUEUE_MODEL_ENV[queue]
+        for model in os.environ.get(env_name, default).split(","):
+            if model.strip() and model.strip() not in models:
+                models.append(model.strip())
+    return models
+
+
+class OllamaWarmer:
+    """Pre-loads models on every healthy pooled host and reports what is resident."""
+
+    def __init__(self, pool: Optional[OllamaEndpointPool] = None, timeout: float = 600.0):
+        self.pool = pool or get_ollama_pool()
+        self.timeout = timeout # Loading a model from disk can take minutes on CPU boxes
+
+    def warm_up(self, models: List[str]) -> Dict[str, dict]:
+        report = {}
+        for endpoint in self.pool.endpoints:
+            loaded, errors = [], {}
+            if endpoint.is_ejected(time.monotonic()):
+                report[endpoint.url] = {"loaded": loaded, "errors": {"*": "endpoint ejected"}}
+                continue
+            for model in models:
+                try:
+                    # A generate call without a prompt only loads the model and
+                    # (re)sets its keep-alive timer. It uses the same num_ctx as the
+                    # requests, or Ollama would reload the model for the first one.
+                    response = requests.post(
+                        f"{endpoint.url}/api/generate",
+                        json={"model": model, "keep_alive": get_keep_alive(model), "stream": False,
+                              "options": {"num_ctx": get_context_window(model)}},
+                        timeout=self.timeout,
+                    )
+                    response.raise_for_status()
+                    loaded.append(model)
+                except HOST_ERRORS as e:
+                    errors[model] = str(e)
+                    break # Host unreachable, don't wait on the remaining models
+                except requests.exceptions.RequestException as e:
+                    errors[model] = str(e)
+            report[endpoint.url] = {"loaded": loaded, "errors": errors}
+
+        self.pool.check_health()
+        for state in self.pool.snapshot():
+            report[state["url"]]["resident_models"] = state["resident_models"]
+            report[state["url"]]["ejected"] = state["ejected"]
+
+        print(f"Ollama warm-up report: {report}")
+        return report
@@ -0,0 +1,144 @@
+import os
+import re
+import sys
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+PROFILE_SUFFIX = ".folded"
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for a thread (plus any thread that joins
+    it with sampling_current_thread).
+
+    A background thread reads the target thread's stack every `interval`
+    seconds, so time spent waiting (on Ollama, Redis, the database) shows up
+    as well as CPU time. Samples are aggregated as "collapsed" stacks, the
+    format flamegraph.pl and speedscope read. Nothing runs unless a profile
+    was started.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.01, max_depth: int = 128):
+        self.thread_id = thread_id or threading.get_ident()
+        self._thread_ids = {self.thread_id}
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.monotonic() - self.started_at
+        return self
+
+    @contextmanager
+    def sampling_current_thread(self):
+        """Also samples the calling thread while the block runs, e.g. a threadpool thread doing a request's work."""
+        thread_id = threading.get_ident()
+        self._thread_ids.add(thread_id)
+        try:
+            yield
+        finally:
+            self._thread_ids.discard(thread_id)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self._thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue # The thread is gone
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """One "frame;frame;frame count" line per distinct stack, root first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """Profiles saved as <id>.folded files, keeping the newest `max_files`."""
+
+    def __init__(self, directory: Path, max_files: int = 200):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def save(self, profile_id: str, content: str) -> Path:
+        path = self.path(profile_id)
+        if path is None:
+            raise ValueError(f"Invalid profile id: {profile_id}")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f".{path.name}.tmp"
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._prune()
+        return path
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        if not PROFILE_ID_PATTERN.match(profile_id) or profile_id.startswith("."):
+            return None
+        return self.directory / f"{profile_id}{PROFILE_SUFFIX}"
+
+    def list(self) -> List[Dict]:
+        """Saved profiles, newest first."""
+        if not self.directory.is_dir():
+            return []
+        entries = []
+        for path in self.directory.glob(f"*{PROFILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append({"profile_id": path.name[:-len(PROFILE_SUFFIX)], "size": stat.st_size, "created_at": stat.st_mtime})
+        return sorted(entries, key=lambda entry: entry["created_at"], reverse=True)
+
+    def _prune(self) -> None:
+        for entry in self.list()[self.max_files:]:
+            try:
+                (self.directory / f"{entry['profile_id']}{PROFILE_SUFFIX}").unlink()
+            except FileNotFoundError:
+                pass # Another process pruned it first
+
+
+def get_profile_store() -> ProfileStore:
+    return ProfileStore(
+        Path(os.environ.get("PROFILE_DIR", "/app/profiles")),
+        max_files=int(os.environ.get("PROFILE_MAX_FILES", "200")),
+    )
+
+
+def get_profile_interval() -> float:
+    return float(os.environ.get("PROFILE_INTERVAL_MS", "10")) / 1000
+
+
+def should_profile_task(task_name: str, random_source=random.random) -> bool:
+    """Samples TASK_PROFILE_SAMPLE_RATE of the tasks named in TASK_PROFILE_TASKS (all tasks if unset)."""
+    rate = float(os.environ.get("TASK_PROFILE_SAMPLE_RATE", "0"))
+    if rate <= 0:
+        return False
+    names = [name.strip() for name in os.environ.get("TASK_PROFILE_TASKS", "").split(",") if name.strip()]
+    if names and task_name not in names:
+        return False
+    return random_source() < rate
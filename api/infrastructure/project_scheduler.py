@@ -0,0 +1,266 @@
+import os
+import math
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from .ollama_pool import get_ollama_urls
+from .redis_client import get_redis_client
+
+KEY_PREFIX = "project_scheduler"
+DEFAULT_PROJECT = "default" # Tasks sent without a project_id
+THROUGHPUT_WINDOW_MINUTES = 5
+DEFERRED_QUEUE = "vision_queue" # Deferred tasks are held aside from, and go back to, this queue
+
+
+def project_scheduling_enabled() -> bool:
+    return os.environ.get("PROJECT_SCHEDULING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def parse_project_map(value: str) -> Dict[str, float]:
+    """Parses 'loja-a=3,loja-b=1' into {'loja-a': 3.0, 'loja-b': 1.0}."""
+    parsed = {}
+    for item in value.split(","):
+        if "=" in item:
+            project_id, number = item.rsplit("=", 1)
+            parsed[project_id.strip()] = float(number)
+    return parsed
+
+
+class ProjectScheduler:
+    """
+    Shares the vision workers' inference capacity between projects.
+
+    Every project that started (or tried to start) a task in the last
+    `active_seconds` is active, and active projects split `capacity`
+    concurrent tasks in proportion to their weights. A project alone gets all
+    of it. A task whose project is already at its share, or at its own
+    concurrency cap, is deferred: its message is held aside in a per-project
+    Redis list, so the other projects' tasks queued behind it run first, and
+    it is published again once its project has a free slot. A task deferred
+    `max_deferrals` times runs anyway. Counters live in Redis and are shared
+    by every worker; a Redis error never blocks a task.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        capacity: int = 4,
+        weights: Optional[Dict[str, float]] = None,
+        max_concurrency: Optional[Dict[str, float]] = None,
+        default_max_concurrency: int = 0,
+        active_seconds: float = 60.0,
+        max_deferrals: int = 20,
+        lease_seconds: int = 3600,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.redis = redis_client or get_redis_client()
+        self.capacity = max(1, capacity)
+        self.weights = weights or {}
+        self.max_concurrency = max_concurrency or {}
+        self.default_max_concurrency = default_max_concurrency
+        self.active_seconds = active_seconds
+        self.max_deferrals = max_deferrals
+        self.lease_seconds = lease_seconds # Running counters of crashed workers expire after this
+        self.clock = clock
+
+    def weight(self, project_id: str) -> float:
+        return max(self.weights.get(project_id, 1.0), 0.001)
+
+    def active_projects(self, now: float) -> Dict[str, float]:
+        """Weights of the active projects; drops the ones idle for longer than active_seconds."""
+        active = {}
+        for project_id, seen in self.redis.hgetall(f"{KEY_PREFIX}:active").items():
+            if now - float(seen) <= self.active_seconds:
+                active[project_id] = self.weight(project_id)
+            else:
+                self.redis.hdel(f"{KEY_PREFIX}:active", project_id)
+        return active
+
+    def limit(self, project_id: str, now: Optional[float] = None) -> int:
+        """Concurrent tasks the project may run right now."""
+        active = self.active_projects(self.clock() if now is None else now)
+        active[project_id] = self.weight(project_id)
+        # Rounded up, so the shares never leave capacity idle.
+        share = max(1, math.ceil(self.capacity * active[project_id] / sum(active.values())))
+        cap = int(self.max_concurrency.get(project_id, self.default_max_concurrency))
+        return min(share, cap) if cap > 0 else share
+
+    def try_acquire(self, project_id: Optional[str], force: bool = False) -> bool:
+        """
+        Takes a slot for a task of the project; False means the task should be deferred.
+        With `force`, the slot is taken even above the project's limit.
+        """
+        project_id = project_id or DEFAULT_PROJECT
+        try:
+            now = self.clock()
+            self.redis.hset(f"{KEY_PREFIX}:active", project_id, now)
+            limit = self.limit(project_id, now)
+            key = f"{KEY_PREFIX}:running:{project_id}"
+            running = self.redis.incr(key)
+            self.redis.expire(key, self.lease_seconds)
+            if running > limit and not force:
+                # Give the slot back, so the counter stays exact.
+                self.redis.decr(key)
+                self.redis.hincrby(f"{KEY_PREFIX}:deferred", project_id, 1)
+                return False
+            self.redis.hincrby(f"{KEY_PREFIX}:started", project_id, 1)
+            return True
+        except redis.RedisError as e:
+            print(f"Project scheduler unavailable, running the task anyway: {e}")
+            return True
+
+    def release(self, project_id: Optional[str], seconds: float, success: bool) -> None:
+        """Frees the task's slot and records its outcome."""
+        project_id = project_id or DEFAULT_PROJECT
+        try:
+            key = f"{KEY_PREFIX}:running:{project_id}"
+            if self.redis.decr(key) < 0:
+                self.redis.set(key, 0, ex=self.lease_seconds)
+            self.redis.hincrby(f"{KEY_PREFIX}:{'completed' if success else 'failed'}", project_id, 1)
+            self.redis.hincrbyfloat(f"{KEY_PREFIX}:busy_seconds", project_id, seconds)
+            if success:
+                minute_key = f"{KEY_PREFIX}:throughput:{int(self.clock() // 60)}"
+                self.redis.hincrby(minute_key, project_id, 1)
+                self.redis.expire(minute_key, 60 * (THROUGHPUT_WINDOW_MINUTES + 1))
+        except redis.RedisError as e:
+            print(f"Could not release the project's slot: {e}")
+
+    def defer(self, project_id: Optional[str], message: str) -> bool:
+        """Holds a deferred task's message until pop_deferred hands it back; False if Redis failed."""
+        project_id = project_id or DEFAULT_PROJECT
+        try:
+            self.redis.sadd(f"{KEY_PREFIX}:deferred_projects", project_id)
+            self.redis.rpush(f"{KEY_PREFIX}:deferred_tasks:{project_id}", message)
+            return True
+        except redis.RedisError as e:
+            print(f"Could not defer the task, running it anyway: {e}")
+            return False
+
+    def pop_deferred(self, max_messages: int = 1) -> List[Tuple[str, str]]:
+        """
+        (project_id, message) of deferred tasks whose projects have a free slot,
+        at most one per project, starting with the projects using the least of
+        their share. Each message is moved to its project's dispatching list
+        until ack_deferred (published) or return_deferred (publish failed).
+        """
+        try:
+            now = self.clock()
+            candidates = []
+            for project_id in self.redis.smembers(f"{KEY_PREFIX}:deferred_projects"):
+                running = int(self.redis.get(f"{KEY_PREFIX}:running:{project_id}") or 0)
+                if running < self.limit(project_id, now):
+                    candidates.append((running / self.weight(project_id), project_id))
+            messages = []
+            for _, project_id in sorted(candidates):
+                if len(messages) >= max_messages:
+                    break
+                message = self.redis.lmove(f"{KEY_PREFIX}:deferred_tasks:{project_id}",
+                                           f"{KEY_PREFIX}:dispatching:{project_id}", "LEFT", "RIGHT")
+                if message is not None:
+                    messages.append((project_id, message))
+            return messages
+        except redis.RedisError as e:
+            print(f"Could not read the deferred tasks: {e}")
+            return []
+
+    def ack_deferred(self, project_id: str, message: str) -> None:
+        """Forgets a deferred task's message once it has been published again."""
+        try:
+            self.redis.lrem(f"{KEY_PREFIX}:dispatching:{project_id}", 1, message)
+        except redis.RedisError as e:
+            print(f"Could not acknowledge a dispatched task, it may be published twice: {e}")
+
+    def return_deferred(self, project_id: str, message: str) -> bool:
+        """Puts a message back at the head of its project's list, e.g. when publishing it failed."""
+        try:
+            pipeline = self.redis.pipeline(transaction=True)
+            pipeline.lrem(f"{KEY_PREFIX}:dispatching:{project_id}", 1, message)
+            pipeline.lpush(f"{KEY_PREFIX}:deferred_tasks:{project_id}", message)
+            pipeline.execute()
+            return True
+        except redis.RedisError as e:
+            print(f"Could not return a deferred task, the sweep will retry: {e}")
+            return False
+
+    def recover_dispatching(self) -> int:
+        """
+        Returns to their lists the messages a dispatcher took but never
+        acknowledged (it died while publishing). Only messages already there at
+        the previous sweep are moved, so publishes in progress are left alone.
+        """
+        recovered = 0
+        try:
+            for project_id in self.redis.smembers(f"{KEY_PREFIX}:deferred_projects"):
+                dispatching_key = f"{KEY_PREFIX}:dispatching:{project_id}"
+                seen_key = f"{dispatching_key}:seen"
+                seen = self.redis.smembers(seen_key)
+                for message in self.redis.lrange(dispatching_key, 0, -1):
+                    if message in seen and self.return_deferred(project_id, message):
+                        recovered += 1
+                remaining = self.redis.lrange(dispatching_key, 0, -1)
+                self.redis.delete(seen_key)
+                if remaining:
+                    self.redis.sadd(seen_key, *remaining)
+        except redis.RedisError as e:
+            print(f"Could not recover stalled deferred tasks: {e}")
+        return recovered
+
+    def deferred_waiting(self, project_id: str) -> int:
+        return self.redis.llen(f"{KEY_PREFIX}:deferred_tasks:{project_id}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per-project counters, running tasks, current limit and completions per minute."""
+        now = self.clock()
+        projects: Dict[str, Dict[str, float]] = {}
+        for project_id in self.redis.smembers(f"{KEY_PREFIX}:deferred_projects"):
+            projects.setdefault(project_id, {})
+        for name in ("started", "completed", "failed", "deferred", "busy_seconds"):
+            for project_id, value in self.redis.hgetall(f"{KEY_PREFIX}:{name}").items():
+                projects.setdefault(project_id, {})[name] = float(value) if name == "busy_seconds" else int(value)
+        # The current minute is still filling up, so only whole minutes count.
+        current_minute = int(now // 60)
+        completed_in_window: Dict[str, int] = {}
+        for minute in range(current_minute - THROUGHPUT_WINDOW_MINUTES, current_minute):
+            for project_id, value in self.redis.hgetall(f"{KEY_PREFIX}:throughput:{minute}").items():
+                completed_in_window[project_id] = completed_in_window.get(project_id, 0) + int(value)
+        for project_id, entry in projects.items():
+            entry["running"] = int(self.redis.get(f"{KEY_PREFIX}:running:{project_id}") or 0)
+            entry["waiting"] = self.deferred_waiting(project_id)
+            entry["weight"] = self.weight(project_id)
+            entry["limit"] = self.limit(project_id, now)
+            entry["completed_per_minute"] = completed_in_window.get(project_id, 0) / THROUGHPUT_WINDOW_MINUTES
+        return projects
+
+
+def deferred_depth(redis_client: redis.Redis) -> int:
+    """Deferred tasks of every project, waiting to go back to DEFERRED_QUEUE."""
+    projects = redis_client.smembers(f"{KEY_PREFIX}:deferred_projects")
+    return sum(
+        redis_client.llen(f"{KEY_PREFIX}:deferred_tasks:{project_id}") + redis_client.llen(f"{KEY_PREFIX}:dispatching:{project_id}")
+        for project_id in projects
+    )
+
+
+_scheduler: Optional[ProjectScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_project_scheduler() -> ProjectScheduler:
+    """Returns the process-wide scheduler configured from the environment."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            # By default, as many tasks run at once as the Ollama pool allows.
+            default_capacity = len(get_ollama_urls()) * int(os.environ.get("OLLAMA_MAX_CONCURRENCY_PER_HOST", "4"))
+            _scheduler = ProjectScheduler(
+                capacity=int(os.environ.get("PROJECT_SCHEDULER_CAPACITY", str(default_capacity or 1))),
+                weights=parse_project_map(os.environ.get("PROJECT_WEIGHTS", "")),
+                max_concurrency=parse_project_map(os.environ.get("PROJECT_MAX_CONCURRENCY", "")),
+                default_max_concurrency=int(os.environ.get("PROJECT_DEFAULT_MAX_CONCURRENCY", "0")),
+                active_seconds=float(os.environ.get("PROJECT_ACTIVE_SECONDS", "60")),
+                max_deferrals=int(os.environ.get("PROJECT_MAX_DEFERRALS", "20")),
+            )
+        return _scheduler
@@ -0,0 +1,370 @@
+import os
+import re
+import math
+import string
+import threading
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from ..domain.models import GenerationOptions, GenerationResult
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    import redis
+
+# Pre-tokenizer pieces: words, numbers and single punctuation marks. Subword
+# tokenizers split most Portuguese words into one or two tokens, so a count of
+# pieces times a per-model ratio is a close, fast estimate.
+PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+TRUNCATION_MARKER = " […] "
+MARKER_PIECES = len(PIECE_PATTERN.findall(TRUNCATION_MARKER))
+
+# Tokens per piece, by model family (first prefix that matches the model name).
+DEFAULT_TOKENS_PER_PIECE = {"gemma": 1.4, "gemini": 1.3, "llava": 1.6, "llama": 1.6}
+FALLBACK_TOKENS_PER_PIECE = 1.5
+
+# Context windows, by model family.
+DEFAULT_CONTEXT_WINDOWS = {"gemma": 8192, "gemini": 32768, "llava": 4096, "llama": 4096}
+FALLBACK_CONTEXT_WINDOW = 4096
+
+SHARED_METRICS_KEY = "prompt_metrics"
+
+
+class PromptTooLongError(ValueError):
+    """Even with every variable section truncated, the prompt exceeds the model's budget."""
+
+
+def _parse_model_map(value: str) -> Dict[str, float]:
+    """Parses "gemma:2b=8192,llava=4096"."""
+    parsed = {}
+    for item in value.split(","):
+        name, _, number = item.strip().rpartition("=")
+        if name and number:
+            parsed[name.strip()] = float(number)
+    return parsed
+
+
+def _lookup(model: str, table: Dict[str, float], fallback: float) -> float:
+    model = (model or "").lower()
+    # Longest prefix first, so "gemma:7b" can override "gemma".
+    for prefix in sorted(table, key=len, reverse=True):
+        if model.startswith(prefix.lower()):
+            return table[prefix]
+    return fallback
+
+
+class TokenCounter:
+    """
+    Token counts per model: exact for llama.cpp models already loaded in this
+    process, otherwise the piece-based estimate.
+    """
+
+    def __init__(self, tokens_per_piece: Optional[Dict[str, float]] = None, context_windows: Optional[Dict[str, float]] = None):
+        self.tokens_per_piece = {**DEFAULT_TOKENS_PER_PIECE, **(tokens_per_piece or {})}
+        self.context_windows = {**DEFAULT_CONTEXT_WINDOWS, **(context_windows or {})}
+
+    def ratio(self, model: str) -> float:
+        return _lookup(model, self.tokens_per_piece, FALLBACK_TOKENS_PER_PIECE)
+
+    def context_window(self, model: str) -> int:
+        llm = _loaded_llama_model(model)
+        if llm is not None:
+            return llm.n_ctx()
+        return int(_lookup(model, self.context_windows, FALLBACK_CONTEXT_WINDOW))
+
+    def count(self, text: str, model: str) -> int:
+        llm = _loaded_llama_model(model)
+        if llm is not None:
+            return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+        return self.estimate(text, model)
+
+    def estimate(self, text: str, model: str) -> int:
+        return math.ceil(sum(1 for _ in PIECE_PATTERN.finditer(text)) * self.ratio(model))
+
+    def truncate(self, text: str, max_tokens: int, model: str, keep: str = "head") -> str:
+        """Cuts `text` at a piece boundary to about `max_tokens` tokens, keeping its head or both ends."""
+        if max_tokens <= 0:
+            return ""
+        pieces = list(PIECE_PATTERN.finditer(text))
+        if math.ceil(len(pieces) * self.ratio(model)) <= max_tokens:
+            return text
+        keep_pieces = max(0, int(max_tokens / self.ratio(model)) - MARKER_PIECES)
+        if keep == "middle":
+            half = keep_pieces // 2
+            if half == 0:
+                return ""
+            return text[:pieces[half - 1].end()] + TRUNCATION_MARKER + text[pieces[len(pieces) - half].start():]
+        if keep_pieces == 0:
+            return ""
+        return text[:pieces[keep_pieces - 1].end()] + TRUNCATION_MARKER.rstrip()
+
+
+def _loaded_llama_model(model: str):
+    from .model_factory import is_llama_cpp_model
+    if not model or not is_llama_cpp_model(model):
+        return None
+    from .llama_cpp_client import LlamaCppClient, _models
+    return _models.get(LlamaCppClient().resolve_model_path(model))
+
+
+def compress_whitespace(text: str) -> str:
+    """Collapses runs of spaces and blank lines, which cost tokens without adding meaning."""
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+class RenderedPrompt(NamedTuple):
+    text: str
+    tokens: int
+    truncated: bool
+    template: str # "<name>@v<version>"
+    options: GenerationOptions = GenerationOptions() # Template defaults and request options, within the server caps
+
+
+class PromptTemplate:
+    """
+    A versioned prompt, parsed once into literal text and named fields.
+
+    `truncatable` lists the variable sections that may be shortened to fit the
+    model's context window, in the order they are shortened, each with what to
+    keep: "head" (the start) or "middle" (both ends, cutting the middle).
+    `generation` holds the template's default generation options.
+    """
+
+    def __init__(self, name: str, version: int, template: str, truncatable: Sequence[Tuple[str, str]] = (),
+                 generation: Optional[GenerationOptions] = None):
+        self.name = name
+        self.version = version
+        self.generation = generation or GenerationOptions()
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(template):
+            if field is not None and (not field.isidentifier() or format_spec or conversion):
+                raise ValueError(f"Prompt template {name} v{version}: only plain {{name}} fields are supported, got {{{field}}}")
+            self._parts.append((literal, field))
+        self.fields = {field for _, field in self._parts if field}
+        self.truncatable = list(truncatable)
+        unknown = {field for field, _ in self.truncatable} - self.fields
+        if unknown:
+            raise ValueError(f"Prompt template {name} v{version} has no fields {sorted(unknown)}")
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def format(self, values: Dict[str, str]) -> str:
+        return "".join(literal + (str(values.get(field) or "") if field else "") for literal, field in self._parts)
+
+
+class PromptRegistry:
+    """
+    Versioned prompt templates, rendered within a model's token budget.
+
+    The budget is the model's context window minus `output_reserve` tokens
+    for the answer. An oversized prompt first has whitespace compressed in its
+    truncatable sections, then those sections are cut in order until it fits.
+    Token counts and truncations are recorded per template in the process
+    metrics and, with `redis_client`, in a Redis hash shared by all processes.
+
+    Generation options are the template's defaults overridden by the
+    request's, within server-side caps: at most `max_output_tokens` (and
+    never more than the context window leaves after the prompt), at most
+    `max_stop_sequences` stop sequences and a temperature in [0, 2].
+    """
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        output_reserve: int = 512,
+        pinned_versions: Optional[Dict[str, int]] = None,
+        redis_client: Optional["redis.Redis"] = None,
+        max_output_tokens: int = 1024,
+        max_stop_sequences: int = 4,
+    ):
+        self.counter = counter or TokenCounter()
+        self.output_reserve = output_reserve
+        self.max_output_tokens = max_output_tokens
+        self.max_stop_sequences = max_stop_sequences
+        self.pinned_versions = pinned_versions or {}
+        self.redis = redis_client
+        self._templates: Dict[str, Dict[int, PromptTemplate]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        with self._lock:
+            self._templates.setdefault(template.name, {})[template.version] = template
+        return template
+
+    def get(self, name: str, version: Optional[int] = None) -> PromptTemplate:
+        """The requested version, else the pinned one (PROMPT_TEMPLATE_VERSIONS), else the latest."""
+        versions = self._templates.get(name)
+        if not versions:
+            raise KeyError(f"Unknown prompt template: {name}")
+        version = version or self.pinned_versions.get(name) or max(versions)
+        if version not in versions:
+            raise KeyError(f"Unknown version {version} of prompt template {name}")
+        return versions[version]
+
+    def budget(self, model: str) -> int:
+        return self.counter.context_window(model) - self.output_reserve
+
+    def render(self, name: str, model: str, /, version: Optional[int] = None,
+               options: Optional[GenerationOptions] = None, **values) -> RenderedPrompt:
+        template = self.get(name, version)
+        budget = self.budget(model)
+        text = template.format(values)
+        tokens = self.counter.count(text, model)
+        truncated = False
+
+        if tokens > budget and template.truncatable:
+            values = dict(values)
+            for field, _ in template.truncatable:
+                values[field] = compress_whitespace(str(values.get(field) or ""))
+            text = template.format(values)
+            tokens = self.counter.count(text, model)
+
+            for field, keep in template.truncatable:
+                # Cut from the original value, a bit more each time the estimate falls short.
+                original = values[field]
+                limit = self.counter.count(original, model)
+                while tokens > budget and values[field]:
+                    limit -= tokens - budget
+                    values[field] = self.counter.truncate(original, limit, model, keep)
+                    text = template.format(values)
+                    tokens = self.counter.count(text, model)
+                    truncated = True
+
+        if tokens > budget:
+            raise PromptTooLongError(f"Prompt {template.id} needs ~{tokens} tokens, {model} allows {budget}")
+        if truncated:
+            print(f"Prompt {template.id} truncated to ~{tokens} tokens to fit {model}.")
+        self._record(template.id, tokens, truncated)
+        return RenderedPrompt(text, tokens, truncated, template.id, self.generation_options(template, options, model, tokens))
+
+    def generation_options(self, template: PromptTemplate, options: Optional[GenerationOptions], model: str, prompt_tokens: int) -> GenerationOptions:
+        merged = template.generation.model_copy(update=options.model_dump(exclude_none=True) if options else {})
+        # The window the prompt was budgeted for, so Ollama doesn't cut it to its own default.
+        merged.context_window = self.counter.context_window(model)
+        # Room left in the context window, but never less than the reserve the budget kept free.
+        room = max(merged.context_window - prompt_tokens, self.output_reserve)
+        merged.max_output_tokens = max(1, min(merged.max_output_tokens or self.max_output_tokens, self.max_output_tokens, room))
+        if merged.stop:
+            merged.stop = merged.stop[:self.max_stop_sequences]
+        if merged.temperature is not None:
+            merged.temperature = min(max(merged.temperature, 0.0), 2.0)
+        return merged
+
+    def record_generation(self, prompt: RenderedPrompt, result: GenerationResult) -> None:
+        """Records the tokens generated for a rendered prompt and whether max_output_tokens cut it."""
+        length_limited = result.finish_reason == "length"
+        if result.output_tokens is not None:
+            metrics.observe("generated_tokens", result.output_tokens, template=prompt.template)
+        if length_limited:
+            metrics.incr("generation_length_limited", template=prompt.template)
+        if self.redis is None:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.hincrby(SHARED_METRICS_KEY, f"{prompt.template}|generations", 1)
+            pipeline.hincrby(SHARED_METRICS_KEY, f"{prompt.template}|output_tokens", result.output_tokens or 0)
+            pipeline.hincrby(SHARED_METRICS_KEY, f"{prompt.template}|length_limited", int(length_limited))
+            pipeline.execute()
+        except Exception as e:
+            print(f"Could not record generation metrics: {e}")
+
+    def _record(self, template_id: str, tokens: int, truncated: bool) -> None:
+        metrics.observe("prompt_tokens", tokens, template=template_id)
+        if truncated:
+            metrics.incr("prompt_truncations", template=template_id)
+        if self.redis is None:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.hincrby(SHARED_METRICS_KEY, f"{template_id}|count", 1)
+            pipeline.hincrby(SHARED_METRICS_KEY, f"{template_id}|tokens", tokens)
+            pipeline.hincrby(SHARED_METRICS_KEY, f"{template_id}|truncated", int(truncated))
+            pipeline.execute()
+        except Exception as e:
+            print(f"Could not record prompt metrics: {e}")
+
+
+def shared_prompt_metrics(redis_client: "redis.Redis") -> Dict[str, Dict[str, float]]:
+    """Per-template prompt and generated token counts, totals and averages recorded by every process."""
+    stats: Dict[str, Dict[str, float]] = {}
+    for field, value in redis_client.hgetall(SHARED_METRICS_KEY).items():
+        template_id, _, name = field.rpartition("|")
+        stats.setdefault(template_id, {})[name] = int(value)
+    for entry in stats.values():
+        entry["avg_tokens"] = entry.get("tokens", 0) / entry["count"] if entry.get("count") else 0.0
+        entry["avg_output_tokens"] = entry.get("output_tokens", 0) / entry["generations"] if entry.get("generations") else 0.0
+    return stats
+
+
+PRODUCT_DESCRIPTION = PromptTemplate("product_description", 1, """Você é um assistente de IA. Sua tarefa é gerar um nome de produto, uma descrição e uma categoria, com base nas informações fornecidas. Sua resposta DEVE ser um objeto JSON válido com as chaves 'nome', 'descrição' e 'categoria'.
+
+Gere um nome, descrição e categoria para um produto com base nas seguintes informações:
+Nome/Palavras-chave: {product_name_input}
+{category_section}
+{context_section}
+Responda APENAS com o objeto JSON, sem nenhum texto ou explicação adicional.""",
+    truncatable=[("context_section", "head"), ("product_name_input", "head")])
+
+# v2 asks for a target description length (the request's description_length).
+PRODUCT_DESCRIPTION_V2 = PromptTemplate("product_description", 2, """Você é um assistente de IA. Sua tarefa é gerar um nome de produto, uma descrição e uma categoria, com base nas informações fornecidas. Sua resposta DEVE ser um objeto JSON válido com as chaves 'nome', 'descrição' e 'categoria'.
+
+Gere um nome, descrição e categoria para um produto com base nas seguintes informações:
+Nome/Palavras-chave: {product_name_input}
+{category_section}
+{length_section}
+{context_section}
+Responda APENAS com o objeto JSON, sem nenhum texto ou explicação adicional.""",
+    truncatable=[("context_section", "head"), ("product_name_input", "head")],
+    generation=GenerationOptions(max_output_tokens=512, temperature=0.4))
+
+PRODUCT_IMAGE_ANALYSIS = PromptTemplate("product_image_analysis", 1, (
+    "You are an expert product cataloger. Analyze the following image of a product "
+    "and generate the structured data based on the Pydantic schema. "
+    "Provide a concise, SEO-friendly product name, a standard high-level category, "
+    "a detailed description of at least 50 words, and a list of 3-5 key features."
+), generation=GenerationOptions(max_output_tokens=512))
+
+# Free-form prompts from /api/ai/generate-text: keep the start (instructions)
+# and the end (usually the actual question) of an oversized prompt.
+CHAT = PromptTemplate("chat", 1, "{prompt}", truncatable=[("prompt", "middle")])
+
+BUILTIN_TEMPLATES = (PRODUCT_DESCRIPTION, PRODUCT_DESCRIPTION_V2, PRODUCT_IMAGE_ANALYSIS, CHAT)
+
+
+def build_prompt_registry(redis_client: Optional["redis.Redis"] = None) -> PromptRegistry:
+    """A registry with the built-in templates, configured from the environment."""
+    registry = PromptRegistry(
+        TokenCounter(
+            tokens_per_piece=_parse_model_map(os.environ.get("PROMPT_TOKENS_PER_WORD", "")),
+            context_windows=_parse_model_map(os.environ.get("MODEL_CONTEXT_WINDOWS", "")),
+        ),
+        output_reserve=int(os.environ.get("PROMPT_OUTPUT_RESERVE_TOKENS", "512")),
+        pinned_versions={name: int(version) for name, version in _parse_model_map(os.environ.get("PROMPT_TEMPLATE_VERSIONS", "")).items()},
+        redis_client=redis_client,
+        max_output_tokens=int(os.environ.get("GENERATION_MAX_OUTPUT_TOKENS", "1024")),
+        max_stop_sequences=int(os.environ.get("GENERATION_MAX_STOP_SEQUENCES", "4")),
+    )
+    for template in BUILTIN_TEMPLATES:
+        registry.register(template)
+    return registry
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Returns the process-wide registry; its metrics are shared through Redis."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            from .redis_client import get_redis_client
+            _registry = build_prompt_registry(get_redis_client())
+        return _registry
+
+
+def get_context_window(model: str) -> int:
+    """The context window prompts for `model` are budgeted for (MODEL_CONTEXT_WINDOWS)."""
+    return get_prompt_registry().counter.context_window(model)
@@ -0,0 +1,36 @@
+from typing import Dict, Iterable, Optional
+
+import redis
+
+from .redis_client import get_redis_client
+from .project_scheduler import DEFERRED_QUEUE, deferred_depth
+
+# kombu's Redis transport keeps one list per queue and priority step:
+# "<queue>" for priority 0 and "<queue>\x06\x16<priority>" for the others.
+PRIORITY_STEPS = (0, 3, 6, 9)
+PRIORITY_SEPARATOR = "\x06\x16"
+
+
+def _priority_keys(queue: str):
+    return [queue if step == 0 else f"{queue}{PRIORITY_SEPARATOR}{step}" for step in PRIORITY_STEPS]
+
+
+def get_queue_depth(queue: str, client: Optional[redis.Redis] = None) -> int:
+    """Number of messages waiting in a Celery queue on the Redis broker."""
+    return get_queue_depths([queue], client)[queue]
+
+
+def get_queue_depths(queues: Iterable[str], client: Optional[redis.Redis] = None) -> Dict[str, int]:
+    client = client or get_redis_client()
+    queues = list(queues)
+    pipeline = client.pipeline(transaction=False)
+    for queue in queues:
+        for key in _priority_keys(queue):
+            pipeline.llen(key)
+    lengths = pipeline.execute()
+    steps = len(PRIORITY_STEPS)
+    depths = {queue: sum(lengths[i * steps:(i + 1) * steps]) for i, queue in enumerate(queues)}
+    if DEFERRED_QUEUE in depths:
+        # Tasks the project scheduler holds aside are still waiting for a worker.
+        depths[DEFERRED_QUEUE] += deferred_depth(client)
+    return depths
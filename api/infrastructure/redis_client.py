@@ -0,0 +1,19 @@
+import os
+from typing import Optional
+
+import redis
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis_client() -> redis.Redis:
+    """Returns a process-wide Redis client for the same instance Celery uses."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            os.environ.get("REDIS_URL", "redis://redis:6379/0"),
+            socket_connect_timeout=1.0,
+            socket_timeout=1.0,
+            decode_responses=True,
+        )
+    return _client
@@ -0,0 +1,85 @@
+import os
+import time
+import uuid
+import zlib
+from pathlib import Path
+
+from celery.backends.redis import RedisBackend
+from kombu.serialization import loads
+
+# Payload prefixes. Neither JSON nor msgpack payloads can start with a NUL byte.
+COMPRESSED_PREFIX = b"\x00zlib:"
+REFERENCE_PREFIX = b"\x00ref:"
+
+
+class OffloadingRedisBackend(RedisBackend):
+    """
+    Redis result backend that keeps large results out of Redis.
+
+    Serialized results of at least `compression_threshold` bytes are stored
+    zlib-compressed. Results of at least `offload_threshold` bytes (after
+    compression) are written to `storage_dir`, and Redis only holds a
+    reference to the file. Decoding is transparent to AsyncResult callers, as
+    long as every reader mounts the same storage directory.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.storage_dir = Path(os.environ.get("RESULT_STORAGE_DIR", "/app/results"))
+        self.compression_threshold = int(os.environ.get("RESULT_COMPRESSION_THRESHOLD_BYTES", "1024"))
+        self.offload_threshold = int(os.environ.get("RESULT_OFFLOAD_THRESHOLD_BYTES", "262144"))
+
+    def encode(self, data):
+        payload = super().encode(data)
+        raw = payload.encode("utf-8") if isinstance(payload, str) else payload
+        if len(raw) < self.compression_threshold:
+            return payload
+        compressed = zlib.compress(raw)
+        if len(compressed) < self.offload_threshold:
+            return COMPRESSED_PREFIX + compressed
+        return REFERENCE_PREFIX + self._write_offloaded(compressed).encode("utf-8")
+
+    def decode(self, payload):
+        if isinstance(payload, str) and payload.startswith("\x00"):
+            payload = payload.encode("utf-8")
+        if isinstance(payload, bytes):
+            if payload.startswith(COMPRESSED_PREFIX):
+                payload = zlib.decompress(payload[len(COMPRESSED_PREFIX):])
+            elif payload.startswith(REFERENCE_PREFIX):
+                payload = zlib.decompress(self._read_offloaded(payload[len(REFERENCE_PREFIX):].decode("utf-8")))
+        if self.content_type != "application/json" and isinstance(payload, (bytes, str)) and payload[:1] in (b"{", b"[", "{", "["):
+            # Stored as JSON before the switch to msgpack (meta is always a dict or a list).
+            return loads(payload, content_type="application/json", content_encoding="utf-8", accept=self.accept)
+        return super().decode(payload)
+
+    def cleanup(self):
+        """Deletes offloaded results older than result_expires (Redis expires the references itself)."""
+        super().cleanup()
+        expires = self.prepare_expires(None, type=float)
+        if not expires or not self.storage_dir.is_dir():
+            return
+        cutoff = time.time() - expires
+        removed = 0
+        for path in self.storage_dir.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass # Another worker got there first
+        if removed:
+            print(f"Removed {removed} expired offloaded results from {self.storage_dir}.")
+
+    def _write_offloaded(self, data: bytes) -> str:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{uuid.uuid4().hex}.bin"
+        tmp_path = self.storage_dir / f".{name}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.storage_dir / name)
+        return name
+
+    def _read_offloaded(self, name: str) -> bytes:
+        # References are written by us, but never let one point outside storage_dir.
+        with open(self.storage_dir / Path(name).name, "rb") as f:
+            return f.read()
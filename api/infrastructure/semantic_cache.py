@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from ..domain.ports import ITextEmbedder
+from ..schemas import GeneratedProductDescription
+from .metrics import metrics
+from .ollama_client import OllamaClient
+from .vector_index import VectorIndex
+
+
+def _normalize_hint(category_hint: Optional[str]) -> str:
+    return (category_hint or "").strip().lower()
+
+
+class SemanticCache:
+    """
+    Embedding cache for product description requests.
+
+    Near-duplicate product names ("carro de corrida vermelho" / "carro corrida
+    vermelho") with the same category hint reuse a previous
+    GeneratedProductDescription when their cosine similarity is at least
+    `threshold`. Entries are recorded when the API sees a queued task succeed.
+    Past `max_entries`, the oldest entries are evicted in batches of
+    `evict_batch`, so the matrix is compacted once per batch instead of on
+    every insert.
+    """
+
+    def __init__(
+        self,
+        embedder: ITextEmbedder,
+        directory: Path,
+        threshold: float = 0.92,
+        max_entries: int = 10000,
+        max_pending: int = 1000,
+        save_interval: float = 30.0,
+        evict_batch: Optional[int] = None,
+    ):
+        self.embedder = embedder
+        self.directory = Path(directory)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_pending = max_pending
+        self.save_interval = save_interval
+        self.evict_batch = evict_batch or max(1, max_entries // 10)
+        self.index = VectorIndex.load(self.directory)
+        self._pending: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def lookup(self, product_name_input: str, category_hint: Optional[str]) -> Tuple[Optional[dict], List[float]]:
+        """Returns (cached result or None, query embedding). The embedding is reused by add_pending."""
+        vector = self.embedder.embed([product_name_input.strip().lower()])[0]
+        hint = _normalize_hint(category_hint)
+        with self._lock:
+            matches = self.index.search(vector, k=1, where=lambda m: m["category_hint"] == hint)
+        if matches and matches[0][0] >= self.threshold:
+            score, _, entry = matches[0]
+            metrics.incr("semantic_cache_hits")
+            metrics.incr("semantic_cache_saved_seconds", entry.get("inference_seconds", 0.0))
+            print(f"Semantic cache hit ({score:.3f}) for '{product_name_input}' -> '{entry['product_name_input']}'")
+            return entry["result"], vector
+        metrics.incr("semantic_cache_misses")
+        return None, vector
+
+    def add_pending(self, task_id: str, vector: List[float], product_name_input: str, category_hint: Optional[str]) -> None:
+        """Remembers a queued task so its result can be cached once it succeeds."""
+        with self._lock:
+            self._pending[task_id] = {
+                "vector": vector,
+                "product_name_input": product_name_input,
+                "category_hint": _normalize_hint(category_hint),
+                "enqueued_at": time.time(),
+            }
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+
+    def complete(self, task_id: str, result) -> bool:
+        """Caches the result of a pending task. Returns True if it was added."""
+        with self._lock:
+            pending = self._pending.pop(task_id, None)
+        if pending is None:
+            return False
+        try:
+            result = GeneratedProductDescription.model_validate(result).model_dump()
+        except ValidationError:
+            return False
+
+        # Measured from enqueue to the first successful status poll, i.e. the
+        # wait a cache hit spares the caller.
+        inference_seconds = time.time() - pending["enqueued_at"]
+        with self._lock:
+            self.index.add(pending["vector"], {
+                "product_name_input": pending["product_name_input"],
+                "category_hint": pending["category_hint"],
+                "result": result,
+                "inference_seconds": inference_seconds,
+            })
+            if len(self.index) >= self.max_entries + self.evict_batch:
+                self.index.remove(list(range(len(self.index) - self.max_entries)))
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.save_interval:
+                self._save()
+        return True
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def stats(self) -> dict:
+        hits = metrics.counter("semantic_cache_hits")
+        misses = metrics.counter("semantic_cache_misses")
+        return {
+            "entries": len(self.index),
+            "pending": len(self._pending),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "saved_inference_seconds": metrics.counter("semantic_cache_saved_seconds"),
+        }
+
+    def _save(self) -> None:
+        # Caller must hold self._lock.
+        self.index.save(self.directory)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def semantic_cache_enabled() -> bool:
+    # Off by default: it needs OLLAMA_EMBEDDING_MODEL pulled on the Ollama hosts.
+    return os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Returns the process-wide semantic cache, or None when disabled."""
+    global _cache
+    if not semantic_cache_enabled():
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache(
+                OllamaClient(),
+                Path(os.environ.get("SEMANTIC_CACHE_DIR", "semantic_cache")),
+                threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+                max_entries=int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "10000")),
+            )
+        return _cache
+
+
+def flush_semantic_cache() -> None:
+    """Persists pending index changes; called on API shutdown."""
+    if _cache is not None:
+        _cache.flush()
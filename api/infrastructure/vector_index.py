@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import uuid
+import shutil
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+VECTORS_FILENAME = "vectors.npy"
+METADATA_FILENAME = "metadata.jsonl"
+CURRENT_FILENAME = "CURRENT"
+
+
+class VectorIndex:
+    """
+    Brute-force cosine-similarity index over a NumPy matrix.
+
+    Vectors are L2-normalised on insert, so a search is one matrix-vector
+    product. Rows live in a buffer that doubles when full, so inserts don't
+    copy the whole matrix. Persisted as vectors.npy plus one JSON metadata
+    line per row, in a version directory named by the CURRENT file.
+    """
+
+    def __init__(self, vectors: Optional[np.ndarray] = None, metadata: Optional[List[dict]] = None):
+        self._buffer = vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        self.metadata = metadata or []
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._buffer[:len(self)]
+
+    def _reserve(self, rows: int, dimension: int) -> None:
+        """Makes room for `rows` more vectors, reallocating (and copying) only when the buffer is full."""
+        if len(self) == 0 and self._buffer.shape[1:] != (dimension,):
+            self._buffer = np.empty((max(rows, 16), dimension), dtype=np.float32)
+        elif dimension != self._buffer.shape[1]:
+            raise ValueError(f"Vector has dimension {dimension}, index expects {self._buffer.shape[1]}")
+        elif len(self) + rows > self._buffer.shape[0]:
+            grown = np.empty((max(len(self) + rows, 2 * self._buffer.shape[0], 16), dimension), dtype=np.float32)
+            grown[:len(self)] = self.vectors
+            self._buffer = grown # Also replaces a read-only memory map
+
+    @staticmethod
+    def normalize(vector) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array, axis=-1, keepdims=True)
+        return array / np.where(norm == 0, 1, norm)
+
+    def add(self, vector, metadata: dict) -> int:
+        row = self.normalize(vector).reshape(-1)
+        self._reserve(1, row.shape[0])
+        self._buffer[len(self)] = row
+        self.metadata.append(metadata)
+        return len(self) - 1
+
+    def add_many(self, vectors, metadata: List[dict]) -> None:
+        """Adds a batch of vectors with a single copy into the buffer."""
+        if not metadata:
+            return
+        rows = self.normalize(vectors).reshape(len(metadata), -1)
+        self._reserve(len(rows), rows.shape[1])
+        self._buffer[len(self):len(self) + len(rows)] = rows
+        self.metadata.extend(metadata)
+
+    def remove(self, rows: List[int]) -> None:
+        keep = np.setdiff1d(np.arange(len(self)), np.asarray(rows, dtype=np.int64))
+        self._buffer = self.vectors[keep]
+        self.metadata = [self.metadata[i] for i in keep]
+
+    def search(self, vector, k: int = 1, where: Optional[Callable[[dict], bool]] = None) -> List[Tuple[float, int, dict]]:
+        """Returns up to k (score, row, metadata) tuples, best first."""
+        if len(self) == 0:
+            return []
+        scores = self.vectors @ self.normalize(vector).reshape(-1)
+        if where is not None:
+            mask = np.fromiter((where(m) for m in self.metadata), dtype=bool, count=len(self))
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i), self.metadata[i]) for i in top if np.isfinite(scores[i])]
+
+    def save(self, directory: Path) -> None:
+        """
+        Writes the matrix and metadata into a new version directory, then
+        points CURRENT at it with one atomic rename, so a reader never pairs
+        the vectors of one save with the metadata of another.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        previous = self.current_version(directory)
+        version = f"v{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        (directory / version).mkdir()
+        with open(directory / version / VECTORS_FILENAME, "wb") as f:
+            np.save(f, self.vectors)
+        with open(directory / version / METADATA_FILENAME, "w", encoding="utf-8") as f:
+            for item in self.metadata:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        pointer_tmp = directory / f".{CURRENT_FILENAME}.tmp"
+        pointer_tmp.write_text(version, encoding="utf-8")
+        os.replace(pointer_tmp, directory / CURRENT_FILENAME)
+
+        # Keep the previous version for readers that resolved CURRENT just before the switch.
+        for path in directory.iterdir():
+            if path.is_dir() and path.name.startswith("v") and path.name not in (version, previous):
+                shutil.rmtree(path, ignore_errors=True)
+        for name in (VECTORS_FILENAME, METADATA_FILENAME): # Unversioned layout of older saves
+            (directory / name).unlink(missing_ok=True)
+
+    @staticmethod
+    def current_version(directory: Path) -> Optional[str]:
+        """The version CURRENT points at, or None for an unversioned or missing index."""
+        try:
+            return (Path(directory) / CURRENT_FILENAME).read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = False, strict: bool = False) -> "VectorIndex":
+        """
+        Loads the current version of a saved index; with mmap=True the matrix is
+        memory-mapped read-only. An inconsistent index loads as empty, or raises
+        ValueError with strict=True.
+        """
+        directory = Path(directory)
+        for attempt in range(2):
+            version = cls.current_version(directory)
+            base = directory / version if version else directory
+            try:
+                return cls._load_files(base, mmap)
+            except FileNotFoundError:
+                if version is None:
+                    return cls() # Never saved
+                if attempt == 0:
+                    continue # Pruned by two saves since CURRENT was read: read it again
+                error = f"version {version} is missing"
+            except ValueError as e:
+                error = str(e)
+            break
+        print(f"Vector index at {directory} is inconsistent ({error}); ignoring it.")
+        if strict:
+            raise ValueError(f"Vector index at {directory} is inconsistent: {error}")
+        return cls()
+
+    @classmethod
+    def _load_files(cls, base: Path, mmap: bool) -> "VectorIndex":
+        vectors = np.load(base / VECTORS_FILENAME, mmap_mode="r" if mmap else None)
+        with open(base / METADATA_FILENAME, "r", encoding="utf-8") as f:
+            metadata = [json.loads(line) for line in f if line.strip()]
+        if len(metadata) != len(vectors):
+            raise ValueError(f"{len(vectors)} vectors, {len(metadata)} rows")
+        return cls(vectors, metadata)
@@ -0,0 +1,138 @@
+import os
+import time
+import random
+import threading
+from typing import Callable, Optional
+
+import redis
+
+from .ollama_pool import get_ollama_urls
+from .queue_depth import get_queue_depth
+from .redis_client import get_redis_client
+
+KEY_PREFIX = "vision_spillover"
+
+
+def vision_spillover_enabled() -> bool:
+    return os.environ.get("VISION_SPILLOVER_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+class VisionSpilloverPolicy:
+    """
+    Decides when a vision task should go to Gemini instead of the local LLaVA.
+
+    The expected wait for a new task is the vision_queue depth times the
+    average local inference time, divided by the number of local inferences
+    that run in parallel. Above `sla_seconds`, a `share` of tasks spill over
+    to Gemini, within per-minute and per-day request quotas. A 429 from Gemini
+    pauses spillover for `cooldown_seconds`. State lives in Redis, so every
+    vision worker shares the same estimate and quota.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        queue: str = "vision_queue",
+        sla_seconds: float = 300.0,
+        share: float = 0.5,
+        requests_per_minute: int = 60,
+        requests_per_day: int = 1000,
+        cooldown_seconds: float = 60.0,
+        local_concurrency: int = 1,
+        initial_local_seconds: float = 30.0,
+        smoothing: float = 0.2,
+        random_source: Callable[[], float] = random.random,
+    ):
+        self.redis = redis_client or get_redis_client()
+        self.queue = queue
+        self.sla_seconds = sla_seconds
+        self.share = share
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.cooldown_seconds = cooldown_seconds
+        self.local_concurrency = max(1, local_concurrency)
+        self.initial_local_seconds = initial_local_seconds
+        self.smoothing = smoothing
+        self.random_source = random_source
+
+    def local_seconds_per_task(self) -> float:
+        value = self.redis.get(f"{KEY_PREFIX}:local_seconds")
+        return float(value) if value is not None else self.initial_local_seconds
+
+    def estimated_wait_seconds(self) -> float:
+        depth = get_queue_depth(self.queue, self.redis)
+        return depth * self.local_seconds_per_task() / self.local_concurrency
+
+    def should_spill(self) -> bool:
+        """True if this task should run on Gemini. Any Redis error keeps the task local."""
+        try:
+            if self.redis.get(f"{KEY_PREFIX}:cooldown") is not None:
+                return False
+            wait = self.estimated_wait_seconds()
+            if wait <= self.sla_seconds or self.random_source() >= self.share:
+                return False
+            if not self._take_quota():
+                return False
+            print(f"Vision backlog ~{wait:.0f}s exceeds the {self.sla_seconds:.0f}s SLA, spilling over to Gemini.")
+            return True
+        except redis.RedisError as e:
+            print(f"Spillover policy unavailable, keeping the task local: {e}")
+            return False
+
+    def record_local_duration(self, seconds: float) -> None:
+        """Folds a finished local inference into the shared moving average."""
+        try:
+            average = self.local_seconds_per_task()
+            average += self.smoothing * (seconds - average)
+            self.redis.set(f"{KEY_PREFIX}:local_seconds", average)
+        except redis.RedisError as e:
+            print(f"Could not record local inference time: {e}")
+
+    def pause(self) -> None:
+        """Stops spilling over for a while, e.g. after Gemini answered 429."""
+        try:
+            self.redis.set(f"{KEY_PREFIX}:cooldown", 1, ex=int(self.cooldown_seconds))
+        except redis.RedisError as e:
+            print(f"Could not pause spillover: {e}")
+
+    def _take_quota(self) -> bool:
+        now = time.time()
+        windows = [
+            (f"{KEY_PREFIX}:quota:minute:{int(now // 60)}", self.requests_per_minute, 120),
+            (f"{KEY_PREFIX}:quota:day:{int(now // 86400)}", self.requests_per_day, 2 * 86400),
+        ]
+        taken = []
+        for key, limit, ttl in windows:
+            count = self.redis.incr(key)
+            if count == 1:
+                self.redis.expire(key, ttl)
+            taken.append(key)
+            if count > limit:
+                # Give back what this attempt took, so the counters stay exact.
+                for taken_key in taken:
+                    self.redis.decr(taken_key)
+                return False
+        return True
+
+
+_policy: Optional[VisionSpilloverPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_vision_spillover_policy() -> VisionSpilloverPolicy:
+    """Returns the process-wide policy configured from the environment."""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            # By default, as many local inferences run at once as the Ollama pool allows.
+            default_concurrency = len(get_ollama_urls()) * int(os.environ.get("OLLAMA_MAX_CONCURRENCY_PER_HOST", "4"))
+            _policy = VisionSpilloverPolicy(
+                sla_seconds=float(os.environ.get("VISION_SPILLOVER_SLA_SECONDS", "300")),
+                share=float(os.environ.get("VISION_SPILLOVER_SHARE", "0.5")),
+                requests_per_minute=int(os.environ.get("GEMINI_VISION_REQUESTS_PER_MINUTE", "60")),
+                requests_per_day=int(os.environ.get("GEMINI_VISION_REQUESTS_PER_DAY", "1000")),
+                cooldown_seconds=float(os.environ.get("GEMINI_QUOTA_COOLDOWN_SECONDS", "60")),
+                local_concurrency=int(os.environ.get("VISION_LOCAL_CONCURRENCY", str(default_concurrency or 1))),
+                initial_local_seconds=float(os.environ.get("VISION_LOCAL_SECONDS_ESTIMATE", "30")),
+            )
+        return _policy
@@ -1,33 +1,90 @@
 # D:\Oficina\servico-ia-unificado\api\main.py
 
+from contextlib import asynccontextmanager
+from pathlib import Path
+import threading
+import sys
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from .presentation import endpoints
-import os
-import uvicorn
 
-from fastapi.staticfiles import StaticFiles
+from .presentation.static_files import CachedStaticFiles
+from .presentation.profiling import ProfileRequestMiddleware
+from .presentation.compression import CompressionMiddleware, get_compression_settings
+from .infrastructure.generated_image_cache import GENERATED_IMAGES_URL_PATH, flush_generated_image_caches
 
-# --- Ngrok Tunnel (for local development) ---
-# In a production environment, you would not use Ngrok.
-# This allows exposing the local Docker container to a public URL for Vercel.
-if os.environ.get("ENVIRONMENT") == "development":
-    from pyngrok import ngrok
-    
+GENERATED_IMAGES_DIR = Path(os.environ.get("GENERATED_IMAGES_DIR", "generated_images"))
+
+
+def preload_backends_enabled() -> bool:
+    return os.environ.get("API_PRELOAD_BACKENDS", "true").lower() in ("1", "true", "yes")
+
+
+def preload_backends() -> None:
+    """
+    Imports the backend clients and opens the database once, off the startup
+    path. The API is already serving /api/health while this runs; it only
+    spares the first real request the import and connection cost.
+    """
+    try:
+        from .infrastructure import celery_client, model_factory # noqa: F401 (imported for the side effect)
+        from .infrastructure.database.postgres_repository import get_session_factory
+        get_session_factory()
+        print("Backends preloaded.")
+    except Exception as e:
+        # Not fatal: every backend is initialized again on first use.
+        print(f"Backend preload failed, continuing lazily: {e}")
+
+
+def start_ngrok_tunnel():
+    # --- Ngrok Tunnel (for local development) ---
+    # In a production environment, you would not use Ngrok.
+    # This allows exposing the local Docker container to a public URL for Vercel.
     NGROK_AUTHTOKEN = os.environ.get("NGROK_AUTHTOKEN")
     if not NGROK_AUTHTOKEN:
         print("NGROK_AUTHTOKEN is not set, skipping ngrok tunnel.")
-    else:
-        ngrok.set_auth_token(NGROK_AUTHTOKEN)
-        # Open a tunnel to the port your FastAPI app is running on
-        public_url = ngrok.connect(8000, "http")
-        print(f" * Ngrok tunnel available at: {public_url}")
-# --------------------------------------------
+        return None
+    from pyngrok import ngrok
+
+    ngrok.set_auth_token(NGROK_AUTHTOKEN)
+    # Open a tunnel to the port your FastAPI app is running on
+    public_url = ngrok.connect(8000, "http")
+    print(f" * Ngrok tunnel available at: {public_url}")
+    return ngrok
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("API is starting up...")
+    ngrok = None
+    if os.environ.get("ENVIRONMENT") == "development":
+        ngrok = start_ngrok_tunnel()
+    if preload_backends_enabled():
+        threading.Thread(target=preload_backends, name="preload-backends", daemon=True).start()
+
+    yield
+
+    print("API is shutting down...")
+    # Nothing to flush if no request ever loaded the semantic cache.
+    semantic_cache = sys.modules.get(f"{__package__}.infrastructure.semantic_cache")
+    if semantic_cache is not None:
+        semantic_cache.flush_semantic_cache()
+    flush_generated_image_caches()
+    # Disconnect Ngrok tunnel if it's running
+    if ngrok is not None:
+        ngrok.kill()
+        print("Ngrok tunnels disconnected.")
+
 
 app = FastAPI(
     title="Serviço de Aprendizado de Máquina",
     description="Um serviço para orquestrar modelos de IA e workers.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse, # orjson serializes large payloads several times faster
 )
 
 app.add_middleware(
@@ -37,20 +94,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, **get_compression_settings())
+app.add_middleware(ProfileRequestMiddleware)
 
 # Mount static files directory for generated images
-app.mount("/generated_images", StaticFiles(directory="generated_images"), name="generated_images")
+GENERATED_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+app.mount(GENERATED_IMAGES_URL_PATH, CachedStaticFiles(directory=GENERATED_IMAGES_DIR), name="generated_images")
 
 app.include_router(endpoints.router)
-
-@app.on_event("startup")
-async def startup_event():
-    print("API is starting up...")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    print("API is shutting down...")
-    # Disconnect Ngrok tunnel if it's running
-    if os.environ.get("ENVIRONMENT") == "development" and os.environ.get("NGROK_AUTHTOKEN"):
-        ngrok.kill()
-        print("Ngrok tunnels disconnected.")
\ No newline at end of file
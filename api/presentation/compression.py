@@ -0,0 +1,85 @@
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError: # Optional: without it, responses are only gzip-compressed
+    brotli = None
+
+# Already compressed: recompressing only costs CPU.
+INCOMPRESSIBLE_CONTENT_TYPES = ("image/", "video/", "audio/", "application/gzip", "application/zip")
+
+
+def accepted_encodings(header: str) -> set:
+    """Encodings in an Accept-Encoding header, minus those refused with q=0."""
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class _SkipIncompressible:
+    async def send_with_compression(self, message) -> None:
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if content_type.startswith(INCOMPRESSIBLE_CONTENT_TYPES):
+                self.content_type_is_excluded = True
+
+
+class _GZipResponder(_SkipIncompressible, GZipResponder):
+    pass
+
+
+class _BrotliResponder(_SkipIncompressible, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = 4) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        compressed = self.compressor.process(body)
+        # Flush each chunk of a streamed response so clients get it right away.
+        return compressed + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least `minimum_size` bytes with brotli, when the
+    client accepts it and the brotli package is installed, or else gzip.
+    Streamed responses (e.g. NDJSON exports) are compressed chunk by chunk.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encodings = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        if brotli is not None and "br" in encodings:
+            responder = _BrotliResponder(self.app, self.minimum_size, quality=self.brotli_quality)
+        elif "gzip" in encodings:
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+def get_compression_settings() -> dict:
+    return {
+        "minimum_size": int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1024")),
+        "gzip_level": int(os.environ.get("RESPONSE_GZIP_LEVEL", "6")),
+        "brotli_quality": int(os.environ.get("RESPONSE_BROTLI_QUALITY", "4")),
+    }
@@ -2,17 +2,22 @@
 
 import os
 import traceback
+from datetime import datetime
 from pathlib import Path # Import Path
 
 from typing import Optional, List
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Security, status, Form, Body
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Security, status, Form, Body, Header, Query
+from fastapi.responses import FileResponse, StreamingResponse
 
 from fastapi.security import APIKeyHeader
 
-from ..infrastructure.celery_client import CeleryClient
+# Backend clients (Celery, Redis, SQLAlchemy, Gemini, PIL, NumPy...) are
+# imported inside their dependency providers, on first use, so importing the
+# API stays fast and needs none of those services to be configured.
 from ..infrastructure.file_storage import LocalFileStorage
-from ..infrastructure.llava_client import LlavaClient # Import LlavaClient
+from ..infrastructure.metrics import metrics
+from ..infrastructure.deadlines import DEADLINE_HEADER, parse_deadline
 
 
 
@@ -22,19 +27,19 @@ from ..application.use_cases import (
     TestTextWorkerUseCase
 )
 from ..application.gemini_use_cases import GenerateTextUseCase # Import new use case
+from ..application.chat_history_use_cases import GetChatHistoryPageUseCase, ExportChatHistoryUseCase
 
 from ..domain.models import (
     TaskTicket,
     TaskStatus,
-    GenerateProductDescriptionRequest
+    ChatHistoryPage,
+    GenerationOptions
 )
+from ..schemas import GenerateProductDescriptionRequest # The schema the use case and worker expect
 from ..domain.ports import IChatRepository # Import IChatRepository
+from ..domain.ports import IIdempotencyStore
 from ..domain.ports import ICeleryClient # Import ICeleryClient
-from ..infrastructure.database.postgres_repository import PostgresChatRepository # Import PostgresChatRepository
-
-from ..infrastructure.model_factory import ModelFactory # Import the factory
-
-from config.celery_config import celery_app # Import the global celery_app
+from ..domain.ports import ILlavaClient
 
 from pydantic import BaseModel # Import BaseModel for request body
 
@@ -64,12 +69,14 @@ async def get_api_key(api_key: str = Security(api_key_header)):
 
 
 from ..config import UPLOAD_DIR # Import UPLOAD_DIR from config.py
+from .profiling import run_blocking
 
 
 
 # --- Dependency Injection (Manual) ---
 
-def get_celery_client() -> CeleryClient:
+def get_celery_client() -> ICeleryClient:
+    from ..infrastructure.celery_client import CeleryClient
 
     return CeleryClient()
 
@@ -79,21 +86,46 @@ def get_file_storage() -> LocalFileStorage:
     return LocalFileStorage()
 
 
-def get_llava_client() -> LlavaClient:
+def get_llava_client() -> ILlavaClient:
+    from ..infrastructure.llava_client import LlavaClient
 
     return LlavaClient()
 
+def get_idempotency_store() -> IIdempotencyStore:
+    from ..infrastructure.idempotency_store import RedisIdempotencyStore
+    return RedisIdempotencyStore()
+
+def get_semantic_cache():
+    from ..infrastructure.semantic_cache import get_semantic_cache as get_cache
+    return get_cache()
+
 def get_chat_repository() -> IChatRepository: # Add dependency injector for Repository
+    from ..infrastructure.database.postgres_repository import PostgresChatRepository
     return PostgresChatRepository()
 
-def get_model_factory() -> ModelFactory: # Add dependency injector for Factory
+def get_model_factory(): # Add dependency injector for Factory
+    from ..infrastructure.model_factory import ModelFactory
     return ModelFactory()
 
+def get_prompt_registry():
+    from ..infrastructure.prompts import get_prompt_registry as get_registry
+    return get_registry()
+
+def get_request_deadline(deadline: Optional[str] = Header(None, alias=DEADLINE_HEADER)) -> Optional[datetime]:
+    """The X-Request-Deadline header (ISO 8601 or Unix seconds): the task is dropped once it passes."""
+    if deadline is None:
+        return None
+    try:
+        return parse_deadline(deadline)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid {DEADLINE_HEADER}: {deadline}")
+
 # --- Request Models ---
 class GenerateTextRequest(BaseModel):
     prompt: str
     model: str # Add model field
     session_id: Optional[str] = None
+    options: Optional[GenerationOptions] = None # Capped server-side (GENERATION_MAX_OUTPUT_TOKENS...)
 
 # --- API Endpoints ---
 
@@ -139,6 +171,8 @@ def celery_ping_endpoint():
 
 
 
+    from config.celery_config import celery_app # Import the global celery_app
+
     try:
 
         with celery_app.connection() as connection:
@@ -181,21 +215,44 @@ def health_check():
 
 
 
-from ..application.use_cases import ProcessCatalogIntakeUseCase # Import the new use case
+from ..application.use_cases import ProcessCatalogIntakeUseCase, ProcessProductListingUseCase
 
 @router.post("/api/ai/catalog-intake", response_model=TaskTicket, status_code=status.HTTP_202_ACCEPTED)
 async def catalog_intake_endpoint(
     file: UploadFile = File(...),
     project_id: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    deadline: Optional[datetime] = Depends(get_request_deadline),
     api_key: str = Depends(get_api_key),
     celery_client: ICeleryClient = Depends(get_celery_client),
-    file_storage: LocalFileStorage = Depends(get_file_storage)
+    file_storage: LocalFileStorage = Depends(get_file_storage),
+    idempotency_store: IIdempotencyStore = Depends(get_idempotency_store)
 ):
     """
     Receives a catalog file, saves it, and dispatches a task to process it.
+    Retries with the same Idempotency-Key (or the same file) return the original ticket.
     """
-    use_case = ProcessCatalogIntakeUseCase(celery_client, file_storage)
-    return use_case.execute(file.file, file.filename, project_id)
+    use_case = ProcessCatalogIntakeUseCase(celery_client, file_storage, idempotency_store)
+    return use_case.execute(file.file, file.filename, project_id, idempotency_key, deadline)
+
+@router.post("/api/ai/product-listing", response_model=TaskTicket, status_code=status.HTTP_202_ACCEPTED)
+async def product_listing_endpoint(
+    file: UploadFile = File(...),
+    project_id: Optional[str] = Form(None),
+    category_hint: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    deadline: Optional[datetime] = Depends(get_request_deadline),
+    api_key: str = Depends(get_api_key),
+    celery_client: ICeleryClient = Depends(get_celery_client),
+    file_storage: LocalFileStorage = Depends(get_file_storage),
+    idempotency_store: IIdempotencyStore = Depends(get_idempotency_store)
+):
+    """
+    Receives a product photo and runs image analysis and description generation
+    as one workflow. Poll /api/ai/status/<task_id> for the combined ProductData.
+    """
+    use_case = ProcessProductListingUseCase(celery_client, file_storage, idempotency_store)
+    return use_case.execute(file.file, file.filename, project_id, category_hint, idempotency_key, deadline)
 
 @router.post("/api/ai/generate-product-description", response_model=TaskTicket, status_code=status.HTTP_202_ACCEPTED)
 
@@ -203,32 +260,81 @@ async def generate_product_description_endpoint(
 
     request_data: GenerateProductDescriptionRequest,
 
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+
+    deadline: Optional[datetime] = Depends(get_request_deadline),
+
     api_key: str = Depends(get_api_key),
 
-    celery_client: ICeleryClient = Depends(get_celery_client)
+    celery_client: ICeleryClient = Depends(get_celery_client),
+
+    idempotency_store: IIdempotencyStore = Depends(get_idempotency_store),
+
+    semantic_cache = Depends(get_semantic_cache)
 
 ):
 
-    use_case = GenerateProductDescriptionUseCase(celery_client)
+    use_case = GenerateProductDescriptionUseCase(celery_client, idempotency_store, semantic_cache)
 
-    return use_case.execute(request_data)
+    # The semantic cache's embedding call (and the Redis/broker calls) block: keep them off the event loop.
+    return await run_blocking(use_case.execute, request_data, idempotency_key, deadline)
 
 @router.post("/api/ai/generate-text", tags=["AI"])
 async def generate_text_endpoint(
     request: GenerateTextRequest,
     api_key: str = Depends(get_api_key),
-    model_factory: ModelFactory = Depends(get_model_factory),
-    chat_repo: IChatRepository = Depends(get_chat_repository)
+    model_factory = Depends(get_model_factory),
+    chat_repo: IChatRepository = Depends(get_chat_repository),
+    prompt_registry = Depends(get_prompt_registry)
 ):
     """
     Generates text using a specified model (e.g., 'gemini', 'codellama').
+    Prompts longer than the model's context window are shortened in the middle.
+    `options` (max_output_tokens, stop, temperature, seed) are capped server-side;
+    the tokens generated come back in `usage`.
     """
-    use_case = GenerateTextUseCase(model_factory, chat_repo)
-    result = use_case.execute(request.prompt, request.model, request.session_id)
+    use_case = GenerateTextUseCase(model_factory, chat_repo, prompt_registry)
+    # Generation blocks (a llama.cpp completion, or waiting for a free Ollama slot): keep it off the event loop.
+    result = await run_blocking(use_case.execute, request.prompt, request.model, request.session_id, request.options)
     if result["status"] == "FAILURE":
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["error"])
     return result
 
+@router.get("/api/ai/chat-history/{session_id}", response_model=ChatHistoryPage, tags=["AI"])
+def get_chat_history_endpoint(
+    session_id: str,
+    after_id: Optional[int] = Query(None, ge=0, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    since: Optional[datetime] = Query(None, description="Only messages created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages created before this time"),
+    api_key: str = Depends(get_api_key),
+    chat_repo: IChatRepository = Depends(get_chat_repository)
+):
+    """
+    Returns one page of a session's messages, oldest first. A since/until
+    window lets the database skip monthly partitions outside it.
+    """
+    use_case = GetChatHistoryPageUseCase(chat_repo)
+    return use_case.execute(session_id, after_id, limit, since, until)
+
+@router.get("/api/ai/chat-history/{session_id}/export", tags=["AI"])
+def export_chat_history_endpoint(
+    session_id: str,
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    api_key: str = Depends(get_api_key),
+    chat_repo: IChatRepository = Depends(get_chat_repository)
+):
+    """
+    Streams the whole session as NDJSON without loading it into memory.
+    """
+    use_case = ExportChatHistoryUseCase(chat_repo)
+    return StreamingResponse(
+        use_case.execute(session_id, since, until),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="chat-history.ndjson"'}
+    )
+
 @router.get("/api/ai/status/{task_id}", response_model=TaskStatus)
 
 async def get_task_status(
@@ -237,19 +343,73 @@ async def get_task_status(
 
     api_key: str = Depends(get_api_key),
 
-    celery_client: ICeleryClient = Depends(get_celery_client)
+    celery_client: ICeleryClient = Depends(get_celery_client),
+
+    semantic_cache = Depends(get_semantic_cache)
 
 ):
 
-    use_case = GetTaskStatusUseCase(celery_client)
+    use_case = GetTaskStatusUseCase(celery_client, semantic_cache)
+
+    # The result backend read and the semantic cache insert block: keep them off the event loop.
+    return await run_blocking(use_case.execute, task_id)
 
-    return use_case.execute(task_id)
+@router.get("/api/metrics", tags=["Monitoring"])
+def metrics_endpoint(
+    api_key: str = Depends(get_api_key),
+    semantic_cache = Depends(get_semantic_cache),
+    prompt_registry = Depends(get_prompt_registry)
+):
+    """
+    Returns this API process's counters and summaries, plus semantic cache
+    statistics, the prompt token counts, the per-project task throughput and
+    the tasks dropped past their deadline, recorded by every process.
+    """
+    snapshot = metrics.snapshot()
+    if semantic_cache is not None:
+        snapshot["semantic_cache"] = semantic_cache.stats()
+    from ..infrastructure.prompts import shared_prompt_metrics
+    try:
+        snapshot["prompts"] = shared_prompt_metrics(prompt_registry.redis)
+    except Exception as e:
+        print(f"Could not read shared prompt metrics: {e}")
+    from ..infrastructure.project_scheduler import get_project_scheduler
+    try:
+        snapshot["projects"] = get_project_scheduler().snapshot()
+    except Exception as e:
+        print(f"Could not read per-project metrics: {e}")
+    from ..infrastructure.deadlines import shared_deadline_metrics
+    from ..infrastructure.redis_client import get_redis_client
+    try:
+        snapshot["deadlines"] = shared_deadline_metrics(get_redis_client())
+    except Exception as e:
+        print(f"Could not read deadline metrics: {e}")
+    return snapshot
+
+@router.get("/api/profiles", tags=["Monitoring"])
+def list_profiles_endpoint(api_key: str = Depends(get_api_key)):
+    """
+    Lists saved request and task profiles, newest first.
+    """
+    from ..infrastructure.profiling import get_profile_store
+    return get_profile_store().list()
+
+@router.get("/api/profiles/{profile_id}", tags=["Monitoring"])
+def download_profile_endpoint(profile_id: str, api_key: str = Depends(get_api_key)):
+    """
+    Downloads a profile as collapsed stacks (open with speedscope or flamegraph.pl).
+    """
+    from ..infrastructure.profiling import get_profile_store
+    path = get_profile_store().path(profile_id)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
 
 from ..application.image_use_cases import GenerateImageUseCase
 from ..domain.ports import IImageGenerator
-from ..infrastructure.gemini_image_client import GeminiImageClient
 
 def get_image_generator() -> IImageGenerator:
+    from ..infrastructure.gemini_image_client import GeminiImageClient
     return GeminiImageClient()
 
 class GenerateImageRequest(BaseModel):
@@ -0,0 +1,80 @@
+import os
+import re
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..infrastructure.profiling import SamplingProfiler, get_profile_interval, get_profile_store
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_request_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar("request_profiler", default=None)
+
+
+def profiling_requested(headers: Headers) -> bool:
+    if headers.get(PROFILE_HEADER, "").lower() not in ("1", "true", "yes"):
+        return False
+    expected_api_key = os.environ.get("INTERNAL_SERVICE_SECRET")
+    return bool(expected_api_key) and headers.get("X-API-KEY") == expected_api_key
+
+
+class ProfileRequestMiddleware:
+    """
+    Profiles a request when it carries `X-Profile: true` and the internal API
+    key. The profile covers the event loop thread and the threads running
+    the request's work handed to run_blocking, until the response starts; it is
+    downloadable from /api/profiles/<id>, and the id comes back in the
+    X-Profile-Id header. Other requests go straight to the app after the
+    header lookup.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiling_requested(Headers(scope=scope)):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(threading.get_ident(), get_profile_interval()).start()
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profiler.stop()
+                path = re.sub(r"[^A-Za-z0-9_.-]", "_", scope["path"].strip("/"))[:80]
+                profile_id = f"request-{path}-{uuid.uuid4().hex[:12]}"
+                try:
+                    get_profile_store().save(profile_id, profiler.folded())
+                    MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile_id
+                except OSError as e:
+                    print(f"Could not save the request profile: {e}")
+            await send(message)
+
+        token = _request_profiler.set(profiler)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _request_profiler.reset(token)
+            profiler.stop()
+
+
+async def run_blocking(func, *args):
+    """
+    run_in_threadpool for an endpoint's blocking work. When the request is
+    being profiled, the worker thread is sampled too.
+    """
+    profiler = _request_profiler.get()
+    if profiler is None:
+        return await run_in_threadpool(func, *args)
+
+    def sampled():
+        with profiler.sampling_current_thread():
+            return func(*args)
+
+    return await run_in_threadpool(sampled)
@@ -0,0 +1,24 @@
+from fastapi.staticfiles import StaticFiles
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles for generated content. Every generated file gets a unique name
+    and is never rewritten, so clients may cache it indefinitely; Starlette
+    already answers If-None-Match / If-Modified-Since with 304 using its ETag.
+    Dotfiles (such as the cache index) are never served.
+    """
+
+    def __init__(self, *args, cache_control: str = "public, max-age=31536000, immutable", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def lookup_path(self, path: str):
+        if any(part.startswith(".") for part in path.replace("\\", "/").split("/")):
+            return "", None # Treated as not found
+        return super().lookup_path(path)
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
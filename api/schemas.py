@@ -1,5 +1,6 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import List, Optional, Union, Any
+from typing import List, Optional, Union, Any, Literal
 
 # --- Schemas para Projeto PrecoReal (Catálogo de Produtos) ---
 class ProductData(BaseModel):
@@ -11,6 +12,8 @@ class ProductData(BaseModel):
 class GenerateProductDescriptionRequest(BaseModel):
     product_name_input: str = Field(..., description="Nome ou palavras-chave do produto fornecidas pelo lojista.")
     category_hint: Optional[str] = Field(None, description="Sugestão de categoria para a IA.")
+    description_length: Optional[int] = Field(None, ge=10, le=1000, description="Tamanho aproximado da descrição, em palavras.")
+    deadline: Optional[datetime] = Field(None, description="Horário limite para o resultado; depois dele, a tarefa é descartada.")
 
 class GeneratedProductDescription(BaseModel):
     suggested_name: str = Field(..., description="Nome de produto sugerido pela IA.")
@@ -27,3 +30,19 @@ class TaskStatus(BaseModel):
     status: str
     result: Optional[Union[ProductData, GeneratedProductDescription]] = None
     error: Optional[str] = None
+
+# --- Schemas para Ingestão via Kafka ---
+class CatalogEvent(BaseModel):
+    event_id: str = Field(..., description="Identificador único do evento; reentregas com o mesmo id não geram nova tarefa.")
+    type: Literal["product_description", "product_image"]
+    product_name_input: Optional[str] = None
+    category_hint: Optional[str] = None
+    image_path: Optional[str] = Field(None, description="Caminho da imagem no volume de uploads compartilhado.")
+    project_id: Optional[str] = None
+
+class CatalogEventResult(BaseModel):
+    event_id: str
+    task_id: Optional[str] = None
+    status: str
+    result: Optional[Any] = None
+    error: Optional[str] = None
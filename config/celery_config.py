@@ -2,11 +2,21 @@ import os
 from celery import Celery
 from kombu import Queue
 
+# Re-load models well before the default Ollama keep-alive (10m) expires
+OLLAMA_WARMUP_INTERVAL = float(os.environ.get("OLLAMA_WARMUP_INTERVAL", "240"))
+KNOWLEDGE_BASE_REFRESH_INTERVAL = float(os.environ.get("KNOWLEDGE_BASE_REFRESH_INTERVAL", "600"))
+# How often deferred vision tasks are checked for a free slot (api/infrastructure/project_scheduler.py).
+PROJECT_DEFER_SECONDS = float(os.environ.get("PROJECT_DEFER_SECONDS", "5"))
+
+RESULT_EXPIRES = int(os.environ.get("RESULT_EXPIRES", "86400"))
+
 # Configure Celery
 celery_app = Celery(
     "unified_ai_tasks",
     broker=os.environ.get("REDIS_URL", "redis://redis:6379/0"),
-    backend=os.environ.get("REDIS_URL", "redis://redis:6379/0"),
+    # Redis backend that compresses large results and moves the largest ones
+    # to RESULT_STORAGE_DIR, keeping only a reference in Redis.
+    backend="api.infrastructure.result_backend:OffloadingRedisBackend+" + os.environ.get("REDIS_URL", "redis://redis:6379/0"),
     task_default_queue='default'
 )
 
@@ -17,20 +27,72 @@ celery_app.conf.task_queues = (
 
 celery_app.conf.task_routes = {
     'workers.text_worker.generate_product_description': {'queue': 'text_queue', 'routing_key': 'text_task'},
+    'workers.text_worker.generate_product_listing': {'queue': 'text_queue', 'routing_key': 'text_task'},
+    'workers.text_worker.refresh_knowledge_base': {'queue': 'text_queue', 'routing_key': 'text_task'},
     'workers.vision_worker.process_product_image': {'queue': 'vision_queue', 'routing_key': 'vision_task'},
+    'workers.vision_worker.dispatch_deferred_tasks': {'queue': 'text_queue', 'routing_key': 'text_task'},
+    'workers.maintenance.archive_chat_history': {'queue': 'text_queue', 'routing_key': 'text_task'},
 }
 
 celery_app.conf.update(
-    task_serializer='json',
-    result_serializer='json',
-    accept_content=['json'],
+    task_serializer=os.environ.get("CELERY_SERIALIZER", "msgpack"),
+    result_serializer=os.environ.get("CELERY_SERIALIZER", "msgpack"),
+    # JSON stays accepted so messages and results from before the switch still decode.
+    accept_content=['msgpack', 'json'],
+    result_accept_content=['msgpack', 'json'],
+    result_expires=RESULT_EXPIRES,
     timezone='UTC',
     enable_utc=True,
+    # Inference tasks are long: reserve one message per thread/process so an
+    # idle worker isn't left waiting while another holds a prefetched backlog.
+    worker_prefetch_multiplier=int(os.environ.get("CELERY_PREFETCH_MULTIPLIER", "1")),
+    # Threads pool that can grow and shrink, and an autoscaler that sizes it from
+    # the queue depth, task latency and Ollama load (active with --autoscale=max,min).
+    worker_pool=os.environ.get("CELERY_WORKER_POOL", "workers.autoscaling:ResizableThreadPool"),
+    worker_autoscaler="workers.autoscaling:QueueDepthAutoscaler",
     beat_schedule={
+        'warm-up-text-models': {
+            'task': 'workers.warmup.warm_up_models',
+            'schedule': OLLAMA_WARMUP_INTERVAL,
+            'kwargs': {'queue': 'text_queue'},
+            'options': {'queue': 'text_queue', 'routing_key': 'text_task', 'expires': OLLAMA_WARMUP_INTERVAL},
+        },
+        'warm-up-vision-models': {
+            'task': 'workers.warmup.warm_up_models',
+            'schedule': OLLAMA_WARMUP_INTERVAL,
+            'kwargs': {'queue': 'vision_queue'},
+            'options': {'queue': 'vision_queue', 'routing_key': 'vision_task', 'expires': OLLAMA_WARMUP_INTERVAL},
+        },
+        'clean-up-offloaded-results': {
+            'task': 'celery.backend_cleanup',
+            'schedule': 3600.0,
+            'options': {'queue': 'text_queue', 'routing_key': 'text_task', 'expires': 3600.0},
+        },
+        'archive-chat-history': {
+            'task': 'workers.maintenance.archive_chat_history',
+            'schedule': 86400.0,
+            'options': {'queue': 'text_queue', 'routing_key': 'text_task', 'expires': 86400.0},
+        },
+        # Deferred vision tasks are published again by the releases of their project's
+        # slots; this sweep catches the ones no release handed on.
+        'dispatch-deferred-vision-tasks': {
+            'task': 'workers.vision_worker.dispatch_deferred_tasks',
+            'schedule': PROJECT_DEFER_SECONDS,
+            'options': {'queue': 'text_queue', 'routing_key': 'text_task', 'expires': PROJECT_DEFER_SECONDS},
+        },
+        'refresh-knowledge-base': {
+            'task': 'workers.text_worker.refresh_knowledge_base',
+            'schedule': KNOWLEDGE_BASE_REFRESH_INTERVAL,
+            'options': {'queue': 'text_queue', 'routing_key': 'text_task', 'expires': KNOWLEDGE_BASE_REFRESH_INTERVAL},
+        },
     },
 )
 
 celery_app.conf.imports = (
     'workers.text_worker',
     'workers.vision_worker',
+    'workers.warmup',
+    'workers.maintenance',
+    'workers.profiling',
+    'workers.deadlines',
 )
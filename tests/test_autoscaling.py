@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import time
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from workers.autoscaling import (
+    SHARED_OLLAMA_LOAD_KEY, AutoscalePolicy, ResizableThreadPool, ScalingSignals, ollama_share, share_ollama_load,
+)
+from workers.autoscale_simulation import load_trace, simulate
+
+class FakeRedis:
+    """The Redis hash commands the shared Ollama load uses, pipelined or not."""
+    def __init__(self):
+        self.hashes = {}
+        self.results = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+        self.results.append(1)
+
+    def hgetall(self, key):
+        self.results.append(dict(self.hashes.get(key, {})))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+def signals(queue_depth=0, busy=0, task_seconds=30.0, **kwargs):
+    return ScalingSignals(queue_depth=queue_depth, busy=busy, task_seconds=task_seconds, **kwargs)
+
+def test_scales_up_in_steps_up_to_the_cap():
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=10, drain_seconds=60, max_step_up=4)
+    # 2 running + 40 queued * 30s / 60s = 22 slots needed
+    assert policy.decide(2, signals(queue_depth=40, busy=2), now=0) == 6
+    assert policy.decide(6, signals(queue_depth=40, busy=6), now=5) == 10
+    assert policy.decide(10, signals(queue_depth=40, busy=10), now=10) == 10
+
+def test_scales_down_only_after_the_delay():
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=10, scale_down_delay=60, max_step_down=2)
+    idle = signals(queue_depth=0, busy=1)
+    assert policy.decide(8, idle, now=0) == 8
+    assert policy.decide(8, idle, now=30) == 8
+    assert policy.decide(8, idle, now=60) == 6
+
+    # Busy again in between: the timer restarts
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=10, scale_down_delay=60)
+    assert policy.decide(8, idle, now=0) == 8
+    assert policy.decide(8, signals(busy=7), now=30) == 8
+    assert policy.decide(8, idle, now=70) == 8
+
+def test_small_dips_stay_within_the_hysteresis_band():
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=10, scale_down_ratio=0.7, scale_down_delay=0)
+    assert policy.decide(8, signals(busy=6), now=0) == 8
+    assert policy.decide(8, signals(busy=5), now=1) == 7
+
+def test_never_exceeds_the_ollama_slots():
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=16)
+    backlog = dict(queue_depth=100, busy=4)
+    assert policy.decide(4, signals(ollama_in_flight=2, ollama_capacity=6, **backlog), now=0) == 6
+    # Every slot is busy: more threads would only wait for Ollama
+    assert policy.decide(4, signals(ollama_in_flight=6, ollama_capacity=6, **backlog), now=0) == 4
+    # A host was ejected
+    assert policy.decide(6, signals(ollama_in_flight=2, ollama_capacity=2, **backlog), now=0) == 2
+
+def test_workers_sharing_the_ollama_hosts_split_the_slots():
+    redis_client = FakeRedis()
+    assert share_ollama_load(redis_client, "text@a", 3, stale_after=15) == (3, 1)
+    assert share_ollama_load(redis_client, "vision@b", 5, stale_after=15) == (8, 2)
+    redis_client.hashes[SHARED_OLLAMA_LOAD_KEY]["gone@c"] = f"4 {time.time() - 60}"
+    assert share_ollama_load(redis_client, "text@a", 3, stale_after=15) == (8, 2)
+    assert "gone@c" not in redis_client.hashes[SHARED_OLLAMA_LOAD_KEY]
+
+    # 8 slots: each worker gets half, plus whatever the other leaves idle
+    assert ollama_share(8, shared_in_flight=8, own_in_flight=3, workers=2) == 4
+    assert ollama_share(8, shared_in_flight=3, own_in_flight=3, workers=2) == 8
+
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=16)
+    backlog = dict(queue_depth=100, busy=3)
+    # The other worker holds the remaining slots: Ollama is saturated, so hold
+    assert policy.decide(3, signals(ollama_in_flight=8, ollama_capacity=8, ollama_share=4, **backlog), now=0) == 3
+    assert policy.decide(6, signals(ollama_in_flight=8, ollama_capacity=8, ollama_share=4, **backlog), now=0) == 4
+
+def test_resizable_pool_limits_running_tasks():
+    pool = ResizableThreadPool(1)
+    pool.reserve_threads(4) # The autoscale maximum
+    release = threading.Event()
+    running = []
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            running.append(1)
+        release.wait(5)
+
+    try:
+        for _ in range(3):
+            pool.on_apply(task, (), {}, callback=lambda result: None)
+        time.sleep(0.2)
+        assert len(running) == 1
+
+        pool.grow(1)
+        time.sleep(0.2)
+        assert len(running) == 2 and pool.num_processes == 2
+
+        pool.shrink(1) # Running tasks finish; the next waits for the smaller limit
+        assert pool.num_processes == 1
+    finally:
+        release.set()
+        pool.on_stop()
+
+def test_simulation_replays_a_trace(tmp_path):
+    trace_path = tmp_path / "trace.jsonl"
+    # A burst of 60 tasks, then a trickle
+    lines = [f'{{"arrival": {i * 0.5}, "duration": 20}}' for i in range(60)]
+    lines += [f'{{"arrival": {600 + i * 60}}}' for i in range(5)]
+    trace_path.write_text("\n".join(lines))
+    trace = load_trace(str(trace_path), default_duration=20)
+    assert len(trace) == 65
+
+    policy = AutoscalePolicy(min_concurrency=1, max_concurrency=12, drain_seconds=60, scale_down_delay=60)
+    autoscaled = simulate(trace, policy, initial_concurrency=1, task_seconds_estimate=20)
+    small = simulate(trace, None, initial_concurrency=1)
+    large = simulate(trace, None, initial_concurrency=12)
+
+    assert autoscaled["tasks"] == 65
+    assert autoscaled["peak_concurrency"] == 12
+    assert autoscaled["wait_p95"] < small["wait_p95"] / 4
+    assert autoscaled["mean_concurrency"] < large["mean_concurrency"] / 2
+    # Back at the minimum once the burst is over
+    assert autoscaled["scaling_decisions"][-1][2] == 1
@@ -0,0 +1,57 @@
+import pytest
+import json
+import os
+import sys
+import threading
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from workers.bulk_catalog import Checkpoint, JsonlSink, read_manifest, run, walk_images
+
+@pytest.fixture
+def catalog(tmp_path):
+    photos = tmp_path / "fotos"
+    (photos / "carros").mkdir(parents=True)
+    for name in ("carros/vermelho.jpg", "carros/azul.PNG", "boneca.jpeg", "leia-me.txt"):
+        (photos / name).write_bytes(b"image")
+    return photos
+
+def test_walks_images_and_reads_manifests(catalog, tmp_path):
+    assert [item["id"] for item in walk_images(str(catalog))] == ["boneca.jpeg", "carros/azul.PNG", "carros/vermelho.jpg"]
+
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("image_path,product_name_input,category_hint\nfotos/boneca.jpeg,,Brinquedos\n,carro de corrida,\n")
+    items = list(read_manifest(str(manifest)))
+    assert items == [
+        {"id": "fotos/boneca.jpeg", "image_path": str(tmp_path / "fotos/boneca.jpeg"), "category_hint": "Brinquedos"},
+        {"id": "carro de corrida", "product_name_input": "carro de corrida"},
+    ]
+
+def test_resumes_from_the_checkpoint(catalog, tmp_path):
+    output, checkpoint_path = tmp_path / "out.jsonl", str(tmp_path / "out.jsonl.checkpoint")
+    calls = []
+    calls_lock = threading.Lock()
+
+    def process(item):
+        with calls_lock:
+            calls.append(item["id"])
+        if item["id"] == "carros/azul.PNG":
+            raise RuntimeError("Ollama unavailable")
+        return {"product_name": item["id"]}
+
+    checkpoint = Checkpoint(checkpoint_path)
+    counts = run(walk_images(str(catalog)), process, JsonlSink(str(output)), checkpoint, concurrency=2, log=lambda message: None)
+    checkpoint.close()
+    assert counts == {"processed": 2, "failed": 1, "skipped": 0}
+
+    calls.clear()
+    checkpoint = Checkpoint(checkpoint_path)
+    counts = run(walk_images(str(catalog)), lambda item: {"product_name": item["id"]}, JsonlSink(str(output)), checkpoint, concurrency=2)
+    checkpoint.close()
+    assert counts == {"processed": 1, "failed": 0, "skipped": 2}
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(record["id"] for record in records) == ["boneca.jpeg", "carros/azul.PNG", "carros/vermelho.jpg"]
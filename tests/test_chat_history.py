@@ -0,0 +1,97 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.main import app
+from api.domain.models import ChatHistory
+from api.presentation.endpoints import get_chat_repository
+from api.infrastructure.database.postgres_repository import Base, PostgresChatRepository
+from api.infrastructure.database.partitions import add_months, expired_partitions, partition_name, write_archive
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for i in range(5):
+        PostgresChatRepository(factory).add(ChatHistory(session_id="s1", human_message=f"pergunta {i}", ai_message=f"resposta {i}"))
+    PostgresChatRepository(factory).add(ChatHistory(session_id="s2", human_message="outra", ai_message="sessão"))
+    return factory
+
+@pytest.fixture
+def client(session_factory):
+    app.dependency_overrides[get_chat_repository] = lambda: PostgresChatRepository(session_factory)
+    with patch.dict(os.environ, {"INTERNAL_SERVICE_SECRET": "test-secret-key"}):
+        yield TestClient(app)
+    app.dependency_overrides.pop(get_chat_repository, None)
+
+HEADERS = {"X-API-KEY": "test-secret-key"}
+
+def test_history_pages_follow_the_cursor(client):
+    first = client.get("/api/ai/chat-history/s1?limit=2", headers=HEADERS).json()
+    assert [item["human_message"] for item in first["items"]] == ["pergunta 0", "pergunta 1"]
+    assert first["next_cursor"] == first["items"][-1]["id"]
+
+    messages = [item["human_message"] for item in first["items"]]
+    cursor = first["next_cursor"]
+    while cursor is not None:
+        page = client.get(f"/api/ai/chat-history/s1?limit=2&after_id={cursor}", headers=HEADERS).json()
+        messages += [item["human_message"] for item in page["items"]]
+        cursor = page["next_cursor"]
+    assert messages == [f"pergunta {i}" for i in range(5)]
+
+def test_history_requires_api_key(client):
+    assert client.get("/api/ai/chat-history/s1").status_code == 401
+
+def test_export_streams_ndjson(client):
+    response = client.get("/api/ai/chat-history/s1/export", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["ai_message"] for line in lines] == [f"resposta {i}" for i in range(5)]
+    assert all(line["session_id"] == "s1" for line in lines)
+
+def test_iter_by_session_id_reads_in_batches(session_factory):
+    chats = list(PostgresChatRepository(session_factory).iter_by_session_id("s1", batch_size=2))
+    assert [chat.id for chat in chats] == sorted(chat.id for chat in chats)
+    assert len(chats) == 5
+
+def test_history_window_filters_by_created_at(client):
+    page = client.get("/api/ai/chat-history/s1?since=2000-01-01T00:00:00Z", headers=HEADERS).json()
+    assert len(page["items"]) == 5 and page["items"][0]["created_at"] is not None
+    page = client.get("/api/ai/chat-history/s1?until=2000-01-01T00:00:00Z", headers=HEADERS).json()
+    assert page["items"] == []
+
+def test_expired_partitions_respect_retention():
+    now = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    names = ["chat_history_y2025m09", "chat_history_y2025m10", "chat_history_y2024m12", "chat_history_default", "chat_history_y2026m10"]
+    assert expired_partitions(names, retention_months=12, now=now) == ["chat_history_y2024m12", "chat_history_y2025m09"]
+    assert partition_name(add_months(datetime(2026, 11, 1, tzinfo=timezone.utc), 2)) == "chat_history_y2027m01"
+
+def test_write_archive_produces_gzipped_ndjson(tmp_path, session_factory):
+    engine = session_factory.kw["bind"]
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, session_id, human_message, ai_message, created_at FROM chat_history ORDER BY id"))
+        rows = [row for row in rows]
+    # SQLite returns timestamps as text; Postgres returns datetimes.
+    rows = [SimpleNamespace(_mapping={**row._mapping, "created_at": datetime.fromisoformat(str(row.created_at))}) for row in rows]
+    path = tmp_path / "archive" / "chat_history_y2025m01.ndjson.gz"
+
+    assert write_archive(rows, path) == 6
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["session_id"] for r in records] == ["s1"] * 5 + ["s2"]
@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.presentation.endpoints import get_idempotency_store, get_semantic_cache
+from api.infrastructure.deadlines import (
+    DeadlineExceeded, check_deadline, parse_deadline, record_deadline_miss, resolve_deadline, shared_deadline_metrics,
+)
+from api.infrastructure.llava_client import read_chat_stream
+
+class FakeRedis:
+    """The Redis hash commands the deadline metrics use."""
+    def __init__(self):
+        self.hashes = {}
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + amount)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_idempotency_store] = lambda: None
+    app.dependency_overrides[get_semantic_cache] = lambda: None
+    with patch.dict(os.environ, {"INTERNAL_SERVICE_SECRET": "test-secret-key"}), TestClient(app) as c:
+        yield c
+    app.dependency_overrides.pop(get_idempotency_store, None)
+    app.dependency_overrides.pop(get_semantic_cache, None)
+
+@pytest.fixture
+def send_task():
+    with patch("api.infrastructure.celery_client.CeleryClient.send_task") as mock_send_task:
+        mock_send_task.return_value = MagicMock(id="task-1")
+        yield mock_send_task
+
+def test_parse_deadline():
+    assert parse_deadline("2026-10-19T12:00:00Z") == datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+    assert parse_deadline("2026-10-19T12:00:00") == datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+    assert parse_deadline("1792411200") == datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        parse_deadline("amanhã")
+
+def test_resolve_deadline_defaults_to_the_max_age():
+    with patch.dict(os.environ, {"TASK_MAX_AGE_SECONDS": "0"}):
+        assert resolve_deadline() is None
+    with patch.dict(os.environ, {"TASK_MAX_AGE_SECONDS": "60"}):
+        remaining = resolve_deadline() - datetime.now(timezone.utc)
+        assert timedelta(seconds=55) < remaining <= timedelta(seconds=60)
+    assert resolve_deadline(datetime(2026, 10, 19, 12)) == datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+def test_the_header_becomes_the_task_expiry(client, send_task):
+    headers = {"X-API-KEY": "test-secret-key", "X-Request-Deadline": "2026-10-19T12:00:00Z"}
+    response = client.post("/api/ai/generate-product-description", json={"product_name_input": "carro"}, headers=headers)
+    assert response.status_code == 202
+    assert send_task.call_args.kwargs["expires"] == datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+def test_the_deadline_can_be_sent_in_the_body(client, send_task):
+    payload = {"product_name_input": "carro", "deadline": "2026-10-19T12:00:00+00:00"}
+    response = client.post("/api/ai/generate-product-description", json=payload, headers={"X-API-KEY": "test-secret-key"})
+    assert response.status_code == 202
+    assert send_task.call_args.kwargs["expires"] == datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+def test_an_invalid_header_is_rejected(client, send_task):
+    headers = {"X-API-KEY": "test-secret-key", "X-Request-Deadline": "tomorrow"}
+    response = client.post("/api/ai/generate-product-description", json={"product_name_input": "carro"}, headers=headers)
+    assert response.status_code == 400
+    send_task.assert_not_called()
+
+def test_check_deadline():
+    check_deadline(None, "generation")
+    check_deadline(datetime.now(timezone.utc) + timedelta(minutes=1), "generation")
+    with pytest.raises(DeadlineExceeded) as raised:
+        check_deadline(datetime.now(timezone.utc) - timedelta(seconds=1), "generation")
+    assert raised.value.stage == "generation"
+
+def test_the_stream_is_abandoned_once_the_deadline_passes():
+    deadline = datetime.now(timezone.utc) + timedelta(minutes=1)
+    lines = [{"message": {"content": "Carro "}, "done": False}, {"message": {"content": "vermelho"}, "done": True}]
+    response = MagicMock()
+    response.iter_lines.return_value = [json.dumps(line).encode() for line in lines]
+    assert read_chat_stream(response, deadline).text == "Carro vermelho"
+
+    with pytest.raises(DeadlineExceeded):
+        read_chat_stream(response, datetime.now(timezone.utc) - timedelta(seconds=1))
+    response.close.assert_called_once()
+
+def test_deadline_misses_are_counted_by_task_and_stage():
+    from workers.deadlines import count_abandoned_task, count_expired_task
+    redis_client = FakeRedis()
+    with patch("api.infrastructure.redis_client.get_redis_client", return_value=redis_client):
+        task = SimpleNamespace(name="workers.vision_worker.process_product_image")
+        count_expired_task(request=None, expired=True, sender=task)
+        count_expired_task(request=None, expired=False, sender=task) # Revoked by hand
+        count_abandoned_task(exception=DeadlineExceeded("late", "inference"), sender=task)
+        count_abandoned_task(exception=RuntimeError("boom"), sender=task)
+    record_deadline_miss("workers.text_worker.generate_product_description", "generation", redis_client)
+
+    assert shared_deadline_metrics(redis_client) == {
+        "workers.vision_worker.process_product_image": {"queued": 1, "inference": 1},
+        "workers.text_worker.generate_product_description": {"generation": 1},
+    }
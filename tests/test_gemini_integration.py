@@ -3,6 +3,7 @@ from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 import os
 import sys
+from pathlib import Path
 
 # Add the service's root directory to the path to allow for relative imports
 service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -22,6 +23,10 @@ def mock_env_vars():
 from api.main import app
 from api.infrastructure.gemini_client import GeminiClient
 from api.infrastructure.gemini_image_client import GeminiImageClient
+from api.infrastructure.generated_image_cache import GeneratedImageCache
+from api.domain.models import GenerationOptions, GenerationResult
+from api.infrastructure.prompts import build_prompt_registry
+from api.presentation.endpoints import get_chat_repository, get_prompt_registry
 
 @pytest.fixture
 def client():
@@ -51,9 +56,8 @@ def test_gemini_text_generation_success(mock_genai_client):
     assert response == "Generated text response"
 
 @patch('api.infrastructure.gemini_image_client.genai.Client')
-@patch('api.infrastructure.gemini_image_client.Image')
 @patch('api.infrastructure.gemini_image_client.uuid')
-def test_gemini_image_generation_success(mock_uuid, mock_image, mock_genai_client):
+def test_gemini_image_generation_success(mock_uuid, mock_genai_client, tmp_path):
     mock_client_instance = mock_genai_client.return_value
     mock_models_instance = MagicMock()
     mock_client_instance.models = mock_models_instance
@@ -61,32 +65,84 @@ def test_gemini_image_generation_success(mock_uuid, mock_image, mock_genai_clien
     mock_response = MagicMock()
     mock_part = MagicMock()
     mock_part.inline_data.data = b"fake_image_bytes"
+    mock_part.inline_data.mime_type = "image/jpeg"
     mock_response.candidates = [MagicMock(content=MagicMock(parts=[mock_part]))]
     mock_models_instance.generate_content.return_value = mock_response
 
     mock_uuid.uuid4.return_value.hex = "testhex"
-    mock_image_open = mock_image.open.return_value
     
-    gemini_image_client = GeminiImageClient()
+    # The URL follows the mount path, not the directory's name on disk
+    gemini_image_client = GeminiImageClient(output_dir=tmp_path / "imagens")
     prompt = "Test image prompt"
     response = gemini_image_client.generate_image(prompt)
 
     mock_models_instance.generate_content.assert_called_once_with(model='gemini-pro-vision', contents=[f"Generate an image of: {prompt}"])
-    mock_image.open.assert_called_once() # Check if Image.open was called
-    mock_image_open.save.assert_called_once() # Check if save was called
-    assert "gemini_image_testhex.png" in response
+    assert response == "/generated_images/gemini_image_testhex.jpg"
+    # The returned bytes are written unchanged, in the format given by the mime type
+    assert (tmp_path / "imagens" / "gemini_image_testhex.jpg").read_bytes() == b"fake_image_bytes"
 
-@patch('api.infrastructure.gemini_client.GeminiClient.generate_text')
-def test_generate_text_endpoint_success(mock_generate_text, client, auth_headers):
-    mock_generate_text.return_value = "API Generated Text"
+    # The same prompt is served from the on-disk cache without calling the API again
+    assert gemini_image_client.generate_image(prompt) == response
+    mock_models_instance.generate_content.assert_called_once()
+
+def test_generated_image_cache_evicts_least_recently_used(tmp_path):
+    cache = GeneratedImageCache(tmp_path, max_bytes=10)
+    cache.store("old", b"123456", "old.png")
+    cache.store("new", b"abcdef", "new.png")
+
+    assert cache.lookup("old") is None
+    assert not (tmp_path / "old.png").exists()
+    assert cache.lookup("new") == "new.png"
+    # The index survives a restart
+    assert GeneratedImageCache(tmp_path, max_bytes=10).lookup("new") == "new.png"
+
+def test_generated_image_cache_batches_access_time_writes(tmp_path):
+    cache = GeneratedImageCache(tmp_path, save_interval=3600)
+    cache.store("key", b"123456", "image.png")
+    saved = (tmp_path / ".cache_index.json").read_text()
+
+    assert cache.lookup("key") == "image.png"
+    assert (tmp_path / ".cache_index.json").read_text() == saved # Hits stay in memory
+    cache.flush()
+    assert (tmp_path / ".cache_index.json").read_text() != saved
+
+def test_generated_images_are_served_with_cache_headers(client, tmp_path):
+    image_path = Path("generated_images") / "cache_header_test.png"
+    image_path.write_bytes(b"png")
+    try:
+        response = client.get("/generated_images/cache_header_test.png")
+        assert response.status_code == 200
+        assert "immutable" in response.headers["cache-control"]
+        etag = response.headers["etag"]
+        assert client.get("/generated_images/cache_header_test.png", headers={"If-None-Match": etag}).status_code == 304
+        assert client.get("/generated_images/.cache_index.json").status_code == 404
+    finally:
+        image_path.unlink()
+
+@pytest.fixture
+def no_database():
+    """The chat history repository is mocked and prompt metrics stay local, so no Postgres or Redis is needed."""
+    chat_repo = MagicMock()
+    app.dependency_overrides[get_chat_repository] = lambda: chat_repo
+    prompt_registry = build_prompt_registry()
+    app.dependency_overrides[get_prompt_registry] = lambda: prompt_registry
+    yield chat_repo
+    app.dependency_overrides.pop(get_chat_repository, None)
+    app.dependency_overrides.pop(get_prompt_registry, None)
+
+@patch('api.infrastructure.gemini_client.GeminiClient.generate')
+def test_generate_text_endpoint_success(mock_generate, client, auth_headers, no_database):
+    mock_generate.return_value = GenerationResult(text="API Generated Text", output_tokens=4, finish_reason="stop")
     response = client.post(
         "/api/ai/generate-text",
         headers=auth_headers,
-        json={"prompt": "Hello", "model": "gemini"}
+        json={"prompt": "Hello", "model": "gemini", "options": {"max_output_tokens": 1000000, "temperature": 0.2}}
     )
     assert response.status_code == 200
     assert response.json()["result"] == "API Generated Text"
-    mock_generate_text.assert_called_once_with("Hello", "gemini")
+    assert response.json()["usage"] == {"output_tokens": 4, "finish_reason": "stop"}
+    no_database.add.assert_called_once()
+    mock_generate.assert_called_once_with("Hello", "gemini", GenerationOptions(max_output_tokens=1024, temperature=0.2, context_window=32768))
 
 @patch('api.infrastructure.gemini_image_client.GeminiImageClient.generate_image')
 def test_generate_image_endpoint_success(mock_generate_image, client, auth_headers):
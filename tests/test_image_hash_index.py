@@ -0,0 +1,109 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.infrastructure.image_hash_index import (
+    ImageHashIndex,
+    get_dedup_max_distance,
+    hamming_distances,
+    perceptual_hash,
+)
+
+def write_product_photo(path, seed):
+    """A synthetic 'photo': smooth background plus a few random shapes."""
+    rng = np.random.default_rng(seed)
+    image = np.tile(np.linspace(40, 200, 256, dtype=np.uint8), (256, 1))
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    for _ in range(6):
+        center = tuple(int(v) for v in rng.integers(20, 236, size=2))
+        color = tuple(int(v) for v in rng.integers(0, 255, size=3))
+        cv2.circle(image, center, int(rng.integers(10, 50)), color, -1)
+    cv2.imwrite(str(path), image)
+    return image
+
+@pytest.fixture
+def photos(tmp_path):
+    original = write_product_photo(tmp_path / "original.png", seed=1)
+    # Same item re-exported: smaller and JPEG-compressed
+    resized = cv2.resize(original, (200, 200), interpolation=cv2.INTER_AREA)
+    cv2.imwrite(str(tmp_path / "copy.jpg"), resized, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    write_product_photo(tmp_path / "other.png", seed=2)
+    return {name: str(tmp_path / file) for name, file in
+            [("original", "original.png"), ("copy", "copy.jpg"), ("other", "other.png")]}
+
+def distance(a, b):
+    return int(hamming_distances(np.array([a], dtype=np.uint64), b)[0])
+
+def test_perceptual_hash_is_close_for_near_duplicates(photos):
+    original, copy, other = (perceptual_hash(photos[name]) for name in ("original", "copy", "other"))
+    assert distance(original, copy) <= 6
+    assert distance(original, other) > 12
+
+def test_claim_reuses_finished_analysis_per_project(tmp_path, photos):
+    index = ImageHashIndex(tmp_path / "index")
+    original, copy, other = (perceptual_hash(photos[name]) for name in ("original", "copy", "other"))
+
+    assert index.claim("loja-a", original, 6, "task-1") is None
+    index.complete("loja-a", "task-1", original, "Tênis de corrida azul")
+
+    entry = index.claim("loja-a", copy, 6, "task-2")
+    assert entry["task_id"] == "task-1" and entry["result"] == "Tênis de corrida azul"
+    assert index.claim("loja-a", other, 6, "task-3") is None # Different product
+    assert index.claim("loja-b", copy, 6, "task-4") is None # Projects never share analyses
+
+    # Persisted: a new process sees the same index
+    reloaded = ImageHashIndex(tmp_path / "index")
+    assert reloaded.claim("loja-a", copy, 6, "task-5")["task_id"] == "task-1"
+
+def test_pending_claim_groups_near_duplicates(tmp_path, photos):
+    index = ImageHashIndex(tmp_path / "index")
+    original, copy = perceptual_hash(photos["original"]), perceptual_hash(photos["copy"])
+
+    assert index.claim(None, original, 6, "task-1") is None
+    entry = index.claim(None, copy, 6, "task-2")
+    assert entry["status"] == "PENDING" and entry["task_id"] == "task-1"
+    assert index.wait_for_result(None, "task-1", timeout=0) is None
+
+    index.complete(None, "task-1", original, "resultado")
+    assert index.wait_for_result(None, "task-1", timeout=0) == "resultado"
+
+    # A failed analysis releases its claim
+    index.claim(None, perceptual_hash(photos["other"]), 6, "task-3")
+    index.discard(None, "task-3")
+    assert index.wait_for_result(None, "task-3", timeout=0) is None
+    assert index.claim(None, perceptual_hash(photos["other"]), 6, "task-4") is None
+
+def test_dedup_thresholds_per_project():
+    with patch.dict(os.environ, {"IMAGE_DEDUP_MAX_DISTANCE": "6", "IMAGE_DEDUP_THRESHOLDS": "loja-a=2,loja-b=-1"}):
+        assert get_dedup_max_distance("loja-a") == 2
+        assert get_dedup_max_distance("loja-b") is None
+        assert get_dedup_max_distance("loja-c") == 6
+        assert get_dedup_max_distance(None) == 6
+
+def test_updates_are_appended_and_the_log_is_compacted(tmp_path):
+    index = ImageHashIndex(tmp_path / "index", compact_min_records=10)
+    other_process = ImageHashIndex(tmp_path / "index", compact_min_records=10)
+    log_path = index._partition("loja-a") / "entries.log"
+
+    index.claim("loja-a", 0, 0, "task-0")
+    claimed = log_path.read_bytes()
+    index.complete("loja-a", "task-0", 0, "resultado")
+    assert log_path.read_bytes().startswith(claimed) # Appended, not rewritten
+    assert other_process.wait_for_result("loja-a", "task-0", timeout=0) == "resultado"
+
+    for task in range(1, 8):
+        index.claim("loja-a", 1 << task, 0, f"task-{task}")
+        index.discard("loja-a", f"task-{task}")
+    assert len(log_path.read_text().splitlines()) < 10 # Compacted to the live entries
+    assert other_process.claim("loja-a", 0, 0, "task-9")["result"] == "resultado"
+    assert other_process.claim("loja-a", 1 << 3, 0, "task-10") is None
+    assert ImageHashIndex(tmp_path / "index").claim("loja-a", 1 << 3, 0, "task-11")["task_id"] == "task-10"
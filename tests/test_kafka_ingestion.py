@@ -0,0 +1,137 @@
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from workers.kafka_ingestion import KafkaIngestionService, INFLIGHT_KEY
+
+class FakeRedis:
+    """The handful of Redis commands the ingestion service uses."""
+    def __init__(self):
+        self.values, self.hashes = {}, {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def hlen(self, key):
+        return len(self.hashes.get(key, {}))
+
+class FakeResultBackend:
+    """Celery result backend holding already decoded task metas."""
+    def __init__(self):
+        self.metas, self.mget_calls = {}, []
+
+    def get_key_for_task(self, task_id):
+        return f"celery-task-meta-{task_id}"
+
+    def mget(self, keys):
+        self.mget_calls.append(keys)
+        return [self.metas.get(key) for key in keys]
+
+    def decode_result(self, value):
+        return value
+
+def kafka_message(value):
+    message = MagicMock()
+    message.error.return_value = None
+    message.value.return_value = json.dumps(value).encode("utf-8")
+    return message
+
+@pytest.fixture
+def queue_depths():
+    with patch('workers.kafka_ingestion.get_queue_depths') as mock_depths:
+        mock_depths.return_value = {"text_queue": 0, "vision_queue": 0}
+        yield mock_depths
+
+@pytest.fixture
+def service(queue_depths):
+    return KafkaIngestionService(MagicMock(), MagicMock(), "catalog-results", celery_client=MagicMock(), redis_client=FakeRedis(), max_queue_depth=10, result_backend=FakeResultBackend())
+
+def test_batch_is_enqueued_before_offsets_are_committed(service):
+    events = [
+        {"event_id": "e1", "type": "product_description", "product_name_input": "carro vermelho"},
+        {"event_id": "e2", "type": "product_image", "image_path": "/app/uploads/a.jpg", "project_id": "p1"},
+    ]
+    service.consumer.consume.return_value = [kafka_message(e) for e in events]
+    order = []
+    service.celery_client.send_task.side_effect = lambda *a, **k: order.append("enqueue")
+    service.consumer.commit.side_effect = lambda **k: order.append("commit")
+
+    assert service.run_once() == 2
+
+    assert order == ["enqueue", "enqueue", "commit"]
+    queues = [c.kwargs["queue"] for c in service.celery_client.send_task.call_args_list]
+    assert queues == ["text_queue", "vision_queue"]
+
+def test_redelivered_event_is_not_enqueued_twice(service):
+    event = {"event_id": "e1", "type": "product_description", "product_name_input": "carro"}
+    service.consumer.consume.return_value = [kafka_message(event)]
+    service.run_once()
+    service.run_once()
+    assert service.celery_client.send_task.call_count == 1
+
+def test_invalid_event_is_rejected_to_output_topic(service):
+    service.consumer.consume.return_value = [kafka_message({"event_id": "bad", "type": "unknown"})]
+    service.run_once()
+    service.celery_client.send_task.assert_not_called()
+    topic = service.producer.produce.call_args.args[0]
+    assert topic == "catalog-results"
+    assert json.loads(service.producer.produce.call_args.kwargs["value"])["status"] == "REJECTED"
+
+def test_backlog_pauses_and_resumes_consumption(service, queue_depths):
+    queue_depths.return_value = {"text_queue": 50, "vision_queue": 0}
+    service.consumer.poll.return_value = None
+    assert service.run_once() == 0
+    assert service.run_once() == 0
+    service.consumer.consume.assert_not_called()
+    # Still polling, so the consumer keeps its place in the group.
+    assert service.consumer.poll.call_count == 2 and service.consumer.pause.call_count == 2
+
+    queue_depths.return_value = {"text_queue": 0, "vision_queue": 0}
+    service.consumer.consume.return_value = []
+    service.run_once()
+    service.consumer.resume.assert_called_once()
+
+def test_finished_tasks_are_published(service):
+    for task_id in ("task-1", "task-2", "task-3", "task-4"):
+        service.redis.hset(INFLIGHT_KEY, task_id, task_id.replace("task-", "e"))
+    backend = service.result_backend
+    backend.metas["celery-task-meta-task-1"] = {"status": "SUCCESS", "result": {"suggested_name": "Carro"}}
+    backend.metas["celery-task-meta-task-2"] = {"status": "FAILURE", "result": ValueError("imagem inválida")}
+    backend.metas["celery-task-meta-task-3"] = {"status": "STARTED", "result": None}
+
+    assert service.publish_results() == 2
+
+    published = [json.loads(c.kwargs["value"]) for c in service.producer.produce.call_args_list]
+    assert published == [
+        {"event_id": "e1", "task_id": "task-1", "status": "SUCCESS", "result": {"suggested_name": "Carro"}, "error": None},
+        {"event_id": "e2", "task_id": "task-2", "status": "FAILURE", "result": None, "error": "imagem inválida"},
+    ]
+    # All in-flight results are read in a single round-trip.
+    assert len(backend.mget_calls) == 1
+    assert service.redis.hgetall(INFLIGHT_KEY) == {"task-3": "e3", "task-4": "e4"}
@@ -0,0 +1,78 @@
+import pytest
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.infrastructure.knowledge_base import KnowledgeBaseIndex, chunk_text
+
+VOCABULARY = ["brinquedo", "carro", "roupa", "camiseta", "comida", "arroz"]
+
+class CountingEmbedder:
+    """Deterministic bag-of-words embeddings that record how many texts were embedded."""
+    def __init__(self):
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return [[float(text.lower().count(word)) + 0.01 for word in VOCABULARY] for text in texts]
+
+@pytest.fixture
+def knowledge_base(tmp_path):
+    source = tmp_path / "knowledge_base"
+    source.mkdir()
+    (source / "brinquedos.md").write_text("Brinquedos: carro de controle remoto, carro de corrida.", encoding="utf-8")
+    (source / "vestuario.txt").write_text("Roupa: camiseta de algodão, camiseta polo.", encoding="utf-8")
+    return KnowledgeBaseIndex(source, tmp_path / "index", CountingEmbedder())
+
+def test_chunk_text_respects_size():
+    text = "\n\n".join(["a" * 300] * 5)
+    chunks = chunk_text(text, chunk_size=700, overlap=50)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 700 for chunk in chunks)
+
+def test_search_returns_relevant_passage(knowledge_base):
+    knowledge_base.refresh()
+    results = knowledge_base.search("carro de corrida vermelho", k=1)
+    assert results[0]["source"] == "brinquedos.md"
+
+def test_refresh_only_reindexes_changed_files(knowledge_base):
+    assert knowledge_base.refresh() == {"changed": 2, "removed": 0, "passages": 2}
+    embedder = knowledge_base.embedder
+    embedded_before = embedder.embedded
+
+    assert knowledge_base.refresh()["changed"] == 0
+    assert embedder.embedded == embedded_before
+
+    (knowledge_base.source_dir / "vestuario.txt").write_text("Camiseta de arroz? Não, comida: arroz integral.", encoding="utf-8")
+    (knowledge_base.source_dir / "brinquedos.md").unlink()
+    assert knowledge_base.refresh() == {"changed": 1, "removed": 1, "passages": 1}
+    assert embedder.embedded == embedded_before + 1
+    assert knowledge_base.search("arroz", k=3)[0]["source"] == "vestuario.txt"
+
+def test_readers_switch_versions_atomically_and_skip_broken_ones(knowledge_base):
+    from api.infrastructure.vector_index import VectorIndex
+    knowledge_base.refresh()
+    assert knowledge_base.search("carro", k=1)[0]["source"] == "brinquedos.md"
+    first = VectorIndex.current_version(knowledge_base.index_dir)
+
+    (knowledge_base.source_dir / "vestuario.txt").write_text("Comida: arroz integral.", encoding="utf-8")
+    knowledge_base.refresh()
+    second = VectorIndex.current_version(knowledge_base.index_dir)
+    assert second != first and (knowledge_base.index_dir / first).is_dir() # Kept for in-flight readers
+    assert knowledge_base.search("arroz", k=1)[0]["source"] == "vestuario.txt"
+
+    # A version whose files disagree is never cached: the previous index keeps serving
+    broken = knowledge_base.index_dir / second / "metadata.jsonl"
+    broken.write_text(broken.read_text(encoding="utf-8").splitlines()[0] + "\n", encoding="utf-8")
+    (knowledge_base.index_dir / "CURRENT").write_text(second, encoding="utf-8")
+    knowledge_base._loaded_version = None
+    assert knowledge_base.search("arroz", k=1)[0]["source"] == "vestuario.txt"
+    assert knowledge_base._loaded_version is None
+
+    # The next refresh rebuilds it from every file
+    assert knowledge_base.refresh()["changed"] == 2
+    assert len(knowledge_base.search("carro", k=3)) == 2
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import MagicMock
+import base64
+import json
+import os
+import sys
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.domain.models import GenerationOptions
+from api.infrastructure.llava_client import IMAGE_CHUNK_SIZE, IMAGE_PLACEHOLDER, ImageChatBody, LlavaClient
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "product.jpg"
+    path.write_bytes(os.urandom(IMAGE_CHUNK_SIZE * 2 + 7))
+    return path
+
+def make_client(lines):
+    response = MagicMock()
+    response.iter_lines.return_value = [json.dumps(line).encode() for line in lines]
+    response.__enter__.return_value = response
+    session = MagicMock()
+    session.post.return_value = response
+
+    @contextmanager
+    def lease(model):
+        yield SimpleNamespace(url="http://ollama:11434")
+
+    client = LlavaClient(pool=SimpleNamespace(lease=lease), session=session)
+    client._ensure_model_downloaded = MagicMock()
+    return client, session
+
+def test_body_streams_the_image_as_base64(image_path):
+    payload = {"model": "llava:7b", "messages": [{"role": "user", "content": 'say "__llava_image__"', "images": [IMAGE_PLACEHOLDER]}], "stream": True}
+    body = ImageChatBody(payload, str(image_path))
+    chunks = list(body)
+    assert len(chunks) == 5 and len(b"".join(chunks)) == len(body)
+
+    sent = json.loads(b"".join(chunks))
+    assert sent["messages"][0]["content"] == 'say "__llava_image__"'
+    assert base64.b64decode(sent["messages"][0]["images"][0]) == image_path.read_bytes()
+
+def test_body_of_an_empty_image(tmp_path):
+    (tmp_path / "empty.jpg").write_bytes(b"")
+    body = ImageChatBody({"images": [IMAGE_PLACEHOLDER]}, str(tmp_path / "empty.jpg"))
+    assert json.loads(b"".join(body)) == {"images": [""]} and len(b"".join(body)) == len(body)
+
+def test_analyze_image_joins_the_streamed_reply(image_path):
+    client, session = make_client([
+        {"message": {"content": "Carro "}, "done": False},
+        {"message": {"content": "vermelho"}, "done": False},
+        {"message": {"content": ""}, "done": True, "done_reason": "length", "eval_count": 512},
+    ])
+    assert client.analyze_image(str(image_path), "Descreva") == {
+        "status": "SUCCESS",
+        "response": "Carro vermelho",
+        "usage": {"output_tokens": 512, "finish_reason": "length"},
+    }
+    kwargs = session.post.call_args.kwargs
+    assert isinstance(kwargs["data"], ImageChatBody) and kwargs["stream"] is True and kwargs["timeout"] == (5.0, 300.0)
+
+def test_analyze_image_sends_the_generation_options(image_path):
+    client, session = make_client([{"message": {"content": "Carro"}, "done": True}])
+    client.analyze_image(str(image_path), "Descreva", options=GenerationOptions(max_output_tokens=512, context_window=4096))
+    sent = json.loads(b"".join(session.post.call_args.kwargs["data"]))
+    assert sent["options"] == {"num_predict": 512, "num_ctx": 4096}
+
+def test_analyze_image_reports_errors_in_the_stream(image_path):
+    client, _ = make_client([{"message": {"content": "Car"}, "done": False}, {"error": "model runner crashed"}])
+    assert client.analyze_image(str(image_path), "Descreva") == {"status": "FAILURE", "error": "model runner crashed"}
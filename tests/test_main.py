@@ -17,6 +17,7 @@ def mock_env_vars():
 
 # Now import the app
 from api.main import app
+from api.presentation.endpoints import get_idempotency_store, get_semantic_cache
 from config.celery_config import celery_app
 
 @pytest.fixture
@@ -39,6 +40,29 @@ def mock_celery_task():
         mock_send_task.return_value = mock_task
         yield mock_send_task
 
+@pytest.fixture(autouse=True)
+def mock_idempotency_store():
+    """Replace the Redis-backed idempotency store with an in-memory dict."""
+    keys = {}
+
+    def reserve(key, task_id):
+        existing = keys.get(key)
+        keys.setdefault(key, task_id)
+        return existing
+
+    store = MagicMock()
+    store.reserve.side_effect = reserve
+    app.dependency_overrides[get_idempotency_store] = lambda: store
+    yield store
+    app.dependency_overrides.pop(get_idempotency_store, None)
+
+@pytest.fixture(autouse=True)
+def disable_semantic_cache():
+    """Keep the API tests away from the Ollama embedding endpoint."""
+    app.dependency_overrides[get_semantic_cache] = lambda: None
+    yield
+    app.dependency_overrides.pop(get_semantic_cache, None)
+
 @pytest.fixture
 def mock_async_result():
     """Mock the AsyncResult from Celery."""
@@ -71,6 +95,23 @@ def test_catalog_intake_success(client, mock_celery_task, auth_headers):
     # Check that the task was sent to the correct queue
     assert mock_celery_task.call_args.kwargs['queue'] == 'vision_queue'
 
+def test_product_listing_runs_vision_then_text_as_one_workflow(client, auth_headers):
+    """The photo's analysis goes straight to the text worker; the client polls a single task id."""
+    files = {'file': ('test_image.jpg', b"listing bytes", 'image/jpeg')}
+    with patch('api.infrastructure.celery_client.CeleryClient.send_chain') as mock_send_chain, \
+         patch('api.infrastructure.file_storage.LocalFileStorage.save_file') as mock_save:
+        mock_save.return_value = "/app/uploads/dummy_path.jpg"
+        mock_send_chain.side_effect = lambda steps, task_id=None: MagicMock(id=task_id)
+        response = client.post("/api/ai/product-listing", files=files, data={"project_id": "p1", "category_hint": "Brinquedos"}, headers=auth_headers)
+
+    assert response.status_code == 202
+    steps = mock_send_chain.call_args.args[0]
+    assert steps == [
+        ('workers.vision_worker.process_product_image', ["/app/uploads/dummy_path.jpg", "p1"], 'vision_queue'),
+        ('workers.text_worker.generate_product_listing', ["Brinquedos"], 'text_queue'),
+    ]
+    assert response.json() == {"task_id": mock_send_chain.call_args.kwargs["task_id"], "status": "PENDING"}
+
 def test_catalog_intake_no_api_key(client):
     """Test the catalog intake endpoint without an API key."""
     dummy_content = b"this is a dummy image"
@@ -132,3 +173,40 @@ def test_get_task_status_failure(client, mock_async_result, auth_headers):
     assert json_response["result"] is None
     assert "Something went wrong" in json_response["error"]
     mock_async_result.assert_called_once_with(task_id, app=celery_app)
+
+def test_generate_product_description_idempotency_key(client, mock_celery_task, mock_async_result, auth_headers):
+    """Retrying with the same Idempotency-Key returns the original ticket without enqueueing again."""
+    mock_async_result.return_value.ready.return_value = False
+    headers = {**auth_headers, "Idempotency-Key": "retry-1"}
+    payload = {"product_name_input": "carro de corrida vermelho"}
+
+    first = client.post("/api/ai/generate-product-description", json=payload, headers=headers)
+    second = client.post("/api/ai/generate-product-description", json=payload, headers=headers)
+
+    assert first.status_code == 202 and second.status_code == 202
+    assert mock_celery_task.call_count == 1
+    assert second.json()["task_id"] == mock_celery_task.call_args.kwargs["task_id"]
+    assert second.json()["status"] == "PENDING"
+
+def test_description_length_is_passed_to_the_worker(client, mock_celery_task, auth_headers):
+    payload = {"product_name_input": "carro de corrida vermelho", "description_length": 80}
+    response = client.post("/api/ai/generate-product-description", json=payload, headers=auth_headers)
+    assert response.status_code == 202
+    assert mock_celery_task.call_args.kwargs["args"] == ["carro de corrida vermelho", None, 80]
+
+    payload["description_length"] = 5000
+    assert client.post("/api/ai/generate-product-description", json=payload, headers=auth_headers).status_code == 422
+
+def test_catalog_intake_deduplicates_identical_uploads(client, mock_celery_task, mock_async_result, auth_headers):
+    """Without a header, identical uploads for the same project map to the same task by content hash."""
+    mock_async_result.return_value.ready.return_value = False
+    files = {'file': ('test_image.jpg', b"same bytes", 'image/jpeg')}
+
+    with patch('api.infrastructure.file_storage.LocalFileStorage.save_file') as mock_save:
+        mock_save.return_value = "/app/uploads/dummy_path.jpg"
+        client.post("/api/ai/catalog-intake", files=files, data={"project_id": "p1"}, headers=auth_headers)
+        client.post("/api/ai/catalog-intake", files=files, data={"project_id": "p1"}, headers=auth_headers)
+        client.post("/api/ai/catalog-intake", files=files, data={"project_id": "p2"}, headers=auth_headers)
+
+    assert mock_celery_task.call_count == 2
+    assert mock_save.call_count == 2
@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.infrastructure import llama_cpp_client
+from api.infrastructure.gemini_client import GeminiClient
+from api.infrastructure.llama_cpp_client import LlamaCppClient
+from api.infrastructure.model_factory import ModelFactory
+from api.infrastructure.ollama_client import OllamaClient, ollama_options
+from api.domain.models import GenerationOptions
+
+@pytest.fixture
+def fake_llama_cpp():
+    """Stand-in for the optional llama_cpp package."""
+    module = MagicMock()
+    module.Llama.return_value.create_chat_completion.return_value = {
+        "choices": [{"message": {"content": "olá"}}]
+    }
+    with patch.dict(sys.modules, {"llama_cpp": module}), patch.dict(llama_cpp_client._models, clear=True):
+        yield module
+
+def test_factory_selects_backend_by_model_name():
+    factory = ModelFactory()
+    assert isinstance(factory.get_text_generator("llama_cpp"), LlamaCppClient)
+    assert isinstance(factory.get_text_generator("qwen.gguf"), LlamaCppClient)
+    assert isinstance(factory.get_text_generator("gemma:2b"), OllamaClient)
+    assert factory.get_text_generator("gemma:2b") is factory.get_text_generator("codellama")
+
+def test_factory_creates_gemini_client_only_when_used():
+    """A worker without GEMINI_API_KEY can still build the factory."""
+    with patch.dict(os.environ, {}, clear=True):
+        factory = ModelFactory()
+        factory.get_text_generator("gemma:2b")
+        with pytest.raises(ValueError):
+            factory.get_text_generator("gemini")
+
+def test_llama_cpp_model_is_loaded_once_per_process(fake_llama_cpp):
+    with patch.dict(os.environ, {"LLAMA_CPP_N_THREADS": "2", "LLAMA_CPP_N_CTX": "1024", "LLAMA_CPP_N_BATCH": "64"}):
+        client = LlamaCppClient(model_path="/models/test.gguf")
+        assert client.generate_text("oi", "llama_cpp") == "olá"
+        assert client.generate_text("oi de novo") == "olá"
+
+    fake_llama_cpp.Llama.assert_called_once()
+    kwargs = fake_llama_cpp.Llama.call_args.kwargs
+    assert kwargs["model_path"] == "/models/test.gguf"
+    assert (kwargs["n_threads"], kwargs["n_ctx"], kwargs["n_batch"]) == (2, 1024, 64)
+    assert kwargs["use_mmap"] is True
+
+def test_generation_options_reach_the_backends(fake_llama_cpp):
+    fake_llama_cpp.Llama.return_value.create_chat_completion.return_value = {
+        "choices": [{"message": {"content": "olá"}, "finish_reason": "length"}], "usage": {"completion_tokens": 50}
+    }
+    options = GenerationOptions(max_output_tokens=50, stop=["\n\n"], seed=7)
+    result = LlamaCppClient(model_path="/models/test.gguf").generate("oi", "llama_cpp", options)
+    assert (result.text, result.output_tokens, result.finish_reason) == ("olá", 50, "length")
+    assert fake_llama_cpp.Llama.return_value.create_chat_completion.call_args.kwargs == {
+        "messages": [{"role": "user", "content": "oi"}], "max_tokens": 50, "stop": ["\n\n"], "seed": 7,
+    }
+
+    assert ollama_options(options) == {"num_predict": 50, "stop": ["\n\n"], "seed": 7}
+    assert ollama_options(GenerationOptions()) is None
+
+def test_gguf_names_are_confined_to_the_models_directory(tmp_path):
+    (tmp_path / "qwen.gguf").write_bytes(b"gguf")
+    client = LlamaCppClient(model_path=str(tmp_path / "model.gguf"))
+    assert client.resolve_model_path("qwen.gguf") == str(tmp_path / "qwen.gguf")
+    assert client.resolve_model_path(str(tmp_path / "qwen.gguf")) == str(tmp_path / "qwen.gguf")
+    assert client.resolve_model_path("llama_cpp") == str(tmp_path / "model.gguf")
+    for model in ("../qwen.gguf", "/etc/secret.gguf", "sub/qwen.gguf", "missing.gguf"):
+        with pytest.raises(ValueError):
+            client.resolve_model_path(model)
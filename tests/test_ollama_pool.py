@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import time
+import threading
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.infrastructure.ollama_pool import OllamaEndpointPool, get_ollama_urls
+
+@pytest.fixture
+def pool():
+    # Disable the lazy health check so tests never touch the network
+    return OllamaEndpointPool(["http://ollama-1:11434", "http://ollama-2:11434"], max_failures=2, health_check_interval=float("inf"))
+
+def test_acquire_prefers_least_outstanding(pool):
+    """Consecutive acquires without release spread across hosts."""
+    first = pool.acquire("gemma:2b")
+    second = pool.acquire("gemma:2b")
+    assert first is not second
+    assert first.outstanding == 1 and second.outstanding == 1
+
+def test_acquire_prefers_resident_model(pool):
+    """A host that already has the model loaded wins even if it is busier."""
+    warm = pool.endpoints[1]
+    warm.resident_models.add("llava:7b")
+    warm.outstanding = 3
+    assert pool.acquire("llava:7b") is warm
+    assert pool.acquire("gemma:2b") is pool.endpoints[0]
+
+def test_release_marks_model_resident(pool):
+    endpoint = pool.acquire("llava")
+    pool.release(endpoint, "llava", success=True)
+    assert endpoint.outstanding == 0
+    assert endpoint.has_model("llava:latest")
+
+def test_host_errors_eject_endpoint(pool):
+    """Connection errors inside a lease eject the host after max_failures."""
+    bad, busy = pool.endpoints
+    busy.outstanding = 5
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            with pool.lease("gemma:2b") as endpoint:
+                assert endpoint is bad
+                raise ConnectionError("refused")
+    assert pool.snapshot()[0]["ejected"] is True
+    assert pool.acquire("gemma:2b") is busy
+
+def test_non_host_errors_do_not_eject(pool):
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            with pool.lease("gemma:2b") as endpoint:
+                raise ValueError("bad request")
+    assert all(not e["ejected"] and e["consecutive_failures"] == 0 for e in pool.snapshot())
+
+@patch('api.infrastructure.ollama_pool.requests.get')
+def test_check_health_refreshes_residency_and_reinstates(mock_get, pool):
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"models": [{"name": "gemma:2b"}]}
+    mock_get.return_value = mock_response
+    pool.endpoints[0].ejected_until = float("inf")
+
+    pool.check_health()
+
+    assert pool.endpoints[0].has_model("gemma:2b")
+    assert pool.snapshot()[0]["ejected"] is False
+
+def test_get_ollama_urls_prefers_url_list():
+    with patch.dict(os.environ, {"OLLAMA_API_URLS": "http://a:11434, http://b:11434", "OLLAMA_API_URL": "http://c:11434"}):
+        assert get_ollama_urls() == ["http://a:11434", "http://b:11434"]
+    with patch.dict(os.environ, {"OLLAMA_API_URL": "http://c:11434"}, clear=True):
+        assert get_ollama_urls() == ["http://c:11434"]
+
+def test_acquire_waits_for_a_free_slot():
+    pool = OllamaEndpointPool(["http://ollama-1:11434"], health_check_interval=float("inf"),
+                              max_concurrency_per_host=1, acquire_timeout=0.05)
+    endpoint = pool.acquire("gemma:2b")
+    with pytest.raises(TimeoutError):
+        pool.acquire("gemma:2b")
+    pool.release(endpoint, "gemma:2b")
+    assert pool.acquire("gemma:2b") is endpoint
+
+def test_concurrent_leases_respect_per_host_limit():
+    """Worker threads sharing the pool never exceed the per-host limit."""
+    pool = OllamaEndpointPool(["http://ollama-1:11434", "http://ollama-2:11434"], health_check_interval=float("inf"),
+                              max_concurrency_per_host=2, acquire_timeout=5)
+    peak = {e.url: 0 for e in pool.endpoints}
+    peak_lock = threading.Lock()
+
+    def call():
+        with pool.lease("gemma:2b") as endpoint:
+            with peak_lock:
+                peak[endpoint.url] = max(peak[endpoint.url], endpoint.outstanding)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak.values()) <= 2
+    assert all(e.outstanding == 0 for e in pool.endpoints)
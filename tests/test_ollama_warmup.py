@@ -0,0 +1,37 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.infrastructure.ollama_pool import OllamaEndpointPool
+from api.infrastructure.ollama_warmup import OllamaWarmer, get_keep_alive, get_models_for_queues
+
+def test_keep_alive_policies():
+    with patch.dict(os.environ, {"OLLAMA_KEEP_ALIVE": "gemma:2b=30m, llava:7b=-1", "OLLAMA_DEFAULT_KEEP_ALIVE": "5m"}):
+        assert get_keep_alive("gemma:2b") == "30m"
+        assert get_keep_alive("llava:7b") == -1
+        assert get_keep_alive("mistral") == "5m"
+
+def test_models_for_queues():
+    with patch.dict(os.environ, {"OLLAMA_TEXT_MODELS": "gemma:2b,qwen2:1.5b"}, clear=True):
+        assert get_models_for_queues(["text_queue"]) == ["gemma:2b", "qwen2:1.5b"]
+        assert get_models_for_queues(["vision_queue", "celery"]) == ["llava:7b"]
+
+@patch('api.infrastructure.ollama_warmup.requests.post')
+def test_warm_up_loads_models_on_every_host(mock_post):
+    pool = OllamaEndpointPool(["http://ollama-1:11434", "http://ollama-2:11434"], health_check_interval=float("inf"))
+    pool.check_health = MagicMock()
+
+    report = OllamaWarmer(pool).warm_up(["gemma:2b"])
+
+    assert mock_post.call_count == 2
+    assert mock_post.call_args.kwargs["json"]["model"] == "gemma:2b"
+    assert "keep_alive" in mock_post.call_args.kwargs["json"]
+    assert mock_post.call_args.kwargs["json"]["options"] == {"num_ctx": 8192} # Same as the requests, so no reload
+    assert report["http://ollama-1:11434"]["loaded"] == ["gemma:2b"]
+    pool.check_health.assert_called_once()
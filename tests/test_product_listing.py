@@ -0,0 +1,37 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.schemas import GeneratedProductDescription, ProductData
+from workers.text_worker import extract_features, generate_product_listing
+
+ANALYSIS = """Product: red die-cast race car, 1:18 scale.
+Key features:
+1. **Chrome details**
+2. Rubber tyres
+- Opening doors
+"""
+
+def test_extract_features_from_bullets_and_json():
+    assert extract_features(ANALYSIS) == ["Chrome details", "Rubber tyres", "Opening doors"]
+    assert extract_features('{"features_list": ["a", "b", "c", "d", "e", "f"]}') == ["a", "b", "c", "d", "e"]
+    assert extract_features("A plain paragraph.") == []
+
+def test_listing_combines_the_analysis_and_the_description():
+    description = GeneratedProductDescription(suggested_name="Carro de Corrida", suggested_description="Miniatura detalhada.", suggested_category="Brinquedos")
+    with patch("workers.text_worker.describe_product", return_value=description) as describe:
+        result = generate_product_listing(ANALYSIS, "Brinquedos")
+
+    describe.assert_called_once_with(ANALYSIS, "Brinquedos", None, deadline=None)
+    assert ProductData(**result) == ProductData(
+        product_name="Carro de Corrida",
+        category_standard="Brinquedos",
+        description_long="Miniatura detalhada.",
+        features_list=["Chrome details", "Rubber tyres", "Opening doors"],
+    )
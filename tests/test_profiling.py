@@ -0,0 +1,119 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.main import app
+from api.infrastructure.profiling import ProfileStore, SamplingProfiler, should_profile_task
+from api.presentation.profiling import ProfileRequestMiddleware
+
+@pytest.fixture
+def profile_env(tmp_path):
+    env = {"INTERNAL_SERVICE_SECRET": "test-secret-key", "PROFILE_DIR": str(tmp_path / "profiles"), "PROFILE_INTERVAL_MS": "1"}
+    with patch.dict(os.environ, env):
+        yield tmp_path / "profiles"
+
+def slow_function():
+    deadline = time.monotonic() + 0.1
+    while time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def test_sampler_records_the_target_thread():
+    profiler = SamplingProfiler(interval=0.001).start()
+    slow_function()
+    profiler.stop()
+    folded = profiler.folded()
+    assert "slow_function (test_profiling.py" in folded
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in folded.splitlines()) > 10
+
+def test_store_prunes_and_rejects_bad_ids(tmp_path):
+    store = ProfileStore(tmp_path, max_files=2)
+    for i in range(3):
+        store.save(f"task-{i}", "main 1\n")
+        os.utime(store.path(f"task-{i}"), (i, i))
+    assert [entry["profile_id"] for entry in store.list()] == ["task-2", "task-1"]
+    assert store.path("../etc/passwd") is None
+    with pytest.raises(ValueError):
+        store.save("../x", "")
+
+def test_profiles_a_request_on_demand(profile_env):
+    client = TestClient(app)
+    response = client.get("/api/health", headers={"X-Profile": "true", "X-API-KEY": "test-secret-key"})
+    profile_id = response.headers["X-Profile-Id"]
+    assert profile_id.startswith("request-api_health-")
+
+    listed = client.get("/api/profiles", headers={"X-API-KEY": "test-secret-key"}).json()
+    assert [entry["profile_id"] for entry in listed] == [profile_id]
+    download = client.get(f"/api/profiles/{profile_id}", headers={"X-API-KEY": "test-secret-key"})
+    assert download.status_code == 200 and download.headers["content-type"].startswith("text/plain")
+
+def test_the_profile_follows_work_moved_off_the_event_loop(profile_env):
+    from api.domain.models import GenerationResult
+    from api.presentation.endpoints import get_chat_repository, get_model_factory, get_prompt_registry
+
+    def generate(prompt, model, options):
+        slow_function()
+        return GenerationResult(text="ok")
+
+    model_factory = MagicMock()
+    model_factory.get_text_generator.return_value.generate.side_effect = generate
+    app.dependency_overrides[get_model_factory] = lambda: model_factory
+    app.dependency_overrides[get_chat_repository] = lambda: MagicMock()
+    app.dependency_overrides[get_prompt_registry] = lambda: None
+    try:
+        client = TestClient(app)
+        headers = {"X-Profile": "true", "X-API-KEY": "test-secret-key"}
+        response = client.post("/api/ai/generate-text", json={"prompt": "Olá", "model": "gemma:2b"}, headers=headers)
+    finally:
+        for dependency in (get_model_factory, get_chat_repository, get_prompt_registry):
+            app.dependency_overrides.pop(dependency, None)
+    assert response.status_code == 200
+    profile = client.get(f"/api/profiles/{response.headers['X-Profile-Id']}", headers={"X-API-KEY": "test-secret-key"}).text
+    assert "slow_function (test_profiling.py" in profile
+
+def test_requests_without_the_api_key_are_not_profiled(profile_env):
+    client = TestClient(app)
+    response = client.get("/api/health", headers={"X-Profile": "true"})
+    assert response.status_code == 200 and "X-Profile-Id" not in response.headers
+    assert not profile_env.exists()
+
+def test_unprofiled_requests_pass_straight_through(profile_env):
+    calls = []
+
+    async def inner(scope, receive, send):
+        calls.append((receive, send))
+
+    async def receive():
+        pass
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "path": "/api/health", "headers": [(b"x-profile", b"true")]}
+    asyncio.run(ProfileRequestMiddleware(inner)(scope, receive, send))
+    assert calls == [(receive, send)] # No wrapped channels, task or stream
+
+def test_tasks_are_sampled_by_rate_and_name(profile_env):
+    assert should_profile_task("workers.vision_worker.process_product_image") is False
+    with patch.dict(os.environ, {"TASK_PROFILE_SAMPLE_RATE": "0.1", "TASK_PROFILE_TASKS": "workers.vision_worker.process_product_image"}):
+        assert should_profile_task("workers.vision_worker.process_product_image", random_source=lambda: 0.05) is True
+        assert should_profile_task("workers.vision_worker.process_product_image", random_source=lambda: 0.5) is False
+        assert should_profile_task("workers.text_worker.generate_product_description", random_source=lambda: 0.0) is False
+
+def test_task_signals_save_a_profile(profile_env):
+    from workers.profiling import save_task_profile, start_task_profile
+    task = SimpleNamespace(name="workers.vision_worker.process_product_image")
+    with patch.dict(os.environ, {"TASK_PROFILE_SAMPLE_RATE": "1"}):
+        start_task_profile(task_id="abc", task=task)
+        slow_function()
+        save_task_profile(task_id="abc", task=task, state="SUCCESS")
+    assert "slow_function" in (profile_env / "task-abc.folded").read_text()
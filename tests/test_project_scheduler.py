@@ -0,0 +1,210 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+import json
+
+from api.infrastructure.project_scheduler import ProjectScheduler, parse_project_map
+
+class FakeRedis:
+    """The handful of Redis commands the project scheduler uses."""
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+        self.sets = {}
+        self.lists = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = str(value)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+        return int(self.values[key])
+
+    def decr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) - 1)
+        return int(self.values[key])
+
+    def expire(self, key, seconds):
+        pass
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + amount)
+
+    def hincrbyfloat(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = str(float(fields.get(field, 0)) + amount)
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    def lmove(self, source, destination, where_from, where_to):
+        values = self.lists.get(source)
+        if not values:
+            return None
+        value = values.pop(0) # LEFT -> RIGHT, the only direction the scheduler uses
+        self.rpush(destination, value)
+        return value
+
+    def lrem(self, key, count, value):
+        values = self.lists.get(key, [])
+        if value in values:
+            values.remove(value)
+            return 1
+        return 0
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def delete(self, key):
+        self.sets.pop(key, None)
+        self.lists.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    """Queues commands and runs them against the FakeRedis on execute()."""
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        return [getattr(self.redis_client, name)(*args) for name, args in self.commands]
+
+@pytest.fixture
+def clock():
+    return MagicMock(return_value=1000.0)
+
+def make_scheduler(clock, **kwargs):
+    options = dict(capacity=4, clock=clock)
+    options.update(kwargs)
+    return ProjectScheduler(FakeRedis(), **options)
+
+def acquire_all(scheduler, project_id, attempts):
+    return sum(scheduler.try_acquire(project_id) for _ in range(attempts))
+
+def test_a_project_alone_gets_the_whole_capacity(clock):
+    scheduler = make_scheduler(clock)
+    assert acquire_all(scheduler, "loja-a", 6) == 4
+
+def test_active_projects_share_capacity_by_weight(clock):
+    scheduler = make_scheduler(clock, capacity=8, weights={"loja-a": 3})
+    scheduler.try_acquire("loja-b") # loja-b has work queued too
+    assert acquire_all(scheduler, "loja-a", 10) == 6
+    assert acquire_all(scheduler, "loja-b", 10) == 1 # 2 slots in total
+
+    clock.return_value += 61 # loja-a went quiet
+    assert acquire_all(scheduler, "loja-b", 10) == 6 # its share is now the whole capacity
+
+def test_per_project_cap_and_release(clock):
+    scheduler = make_scheduler(clock, max_concurrency={"loja-a": 2})
+    assert acquire_all(scheduler, "loja-a", 3) == 2
+    scheduler.release("loja-a", 1.5, success=True)
+    assert scheduler.try_acquire("loja-a") is True
+
+    clock.return_value += 120
+    stats = scheduler.snapshot()["loja-a"]
+    assert stats["started"] == 3 and stats["completed"] == 1 and stats["deferred"] == 1
+    assert stats["running"] == 2 and stats["limit"] == 2 and stats["busy_seconds"] == 1.5
+    assert stats["completed_per_minute"] == 1 / 5
+
+def test_parse_project_map():
+    assert parse_project_map("loja-a=3, loja-b = 0.5,broken") == {"loja-a": 3.0, "loja-b": 0.5}
+
+def test_deferred_tasks_wait_for_a_free_slot_of_their_project(clock):
+    scheduler = make_scheduler(clock, max_concurrency={"loja-a": 1})
+    assert scheduler.try_acquire("loja-a") is True
+    assert scheduler.try_acquire("loja-a") is False
+    scheduler.defer("loja-a", "task-a1")
+    scheduler.defer("loja-a", "task-a2")
+    scheduler.defer("loja-b", "task-b1")
+    assert scheduler.pop_deferred(max_messages=4) == [("loja-b", "task-b1")] # loja-a is still at its cap
+
+    scheduler.release("loja-a", 1.0, success=True)
+    assert scheduler.pop_deferred() == [("loja-a", "task-a1")]
+    assert scheduler.snapshot()["loja-a"]["waiting"] == 1
+    assert scheduler.try_acquire("loja-a", force=True) and scheduler.try_acquire("loja-a", force=True)
+
+def test_vision_task_is_deferred_when_the_project_is_at_its_share(tmp_path):
+    from workers.vision_worker import dispatch_deferred_tasks, process_product_image
+    scheduler = MagicMock(max_deferrals=20)
+    scheduler.try_acquire.return_value = False
+    scheduler.defer.return_value = True
+    image = tmp_path / "product.jpg"
+    image.write_bytes(b"image")
+    with patch("workers.vision_worker.get_project_scheduler", return_value=scheduler):
+        result = process_product_image.apply(args=[str(image), "loja-a"], task_id="task-1")
+
+    assert result.state == "IGNORED" # No result, so the chain waits for the deferred message
+
+    scheduler.try_acquire.assert_called_once_with("loja-a", force=False)
+    scheduler.release.assert_not_called()
+    assert image.exists() # Kept for when the task runs
+    project_id, message = scheduler.defer.call_args.args
+    deferred = json.loads(message)
+    assert project_id == "loja-a" and deferred["args"] == [str(image), "loja-a"]
+    assert deferred["options"]["task_id"] == "task-1" and deferred["options"]["queue"] == "vision_queue"
+    assert deferred["options"]["retries"] == 1
+
+    # Published again, with the same task id, once the project has a free slot.
+    scheduler.pop_deferred.return_value = [("loja-a", message)]
+    with patch.object(process_product_image, "apply_async") as apply_async:
+        assert dispatch_deferred_tasks(scheduler) == 1
+    assert apply_async.call_args.kwargs["task_id"] == "task-1" and apply_async.call_args.kwargs["retries"] == 1
+    scheduler.ack_deferred.assert_called_once_with("loja-a", message)
+
+def test_deferred_tasks_survive_a_failed_publish(clock):
+    from workers.vision_worker import dispatch_deferred_tasks, process_product_image
+    scheduler = make_scheduler(clock)
+    message = json.dumps(dict(process_product_image.s("/app/uploads/a.jpg", "loja-a").set(task_id="task-1")))
+    scheduler.defer("loja-a", message)
+
+    with patch.object(process_product_image, "apply_async", side_effect=ConnectionError("broker down")):
+        assert dispatch_deferred_tasks(scheduler) == 0
+    assert scheduler.deferred_waiting("loja-a") == 1 # Back in its project's list
+
+    # A dispatcher that dies mid-publish leaves the message in the dispatching list...
+    assert scheduler.pop_deferred() == [("loja-a", message)]
+    assert scheduler.recover_dispatching() == 0 # ...which the next sweep leaves to it
+    assert scheduler.recover_dispatching() == 1 # and the one after returns
+    assert scheduler.deferred_waiting("loja-a") == 1
+
+    with patch.object(process_product_image, "apply_async") as apply_async:
+        assert dispatch_deferred_tasks(scheduler) == 1
+    assert apply_async.call_args.kwargs["task_id"] == "task-1"
+    assert scheduler.deferred_waiting("loja-a") == 0 and scheduler.recover_dispatching() == 0
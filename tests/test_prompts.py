@@ -0,0 +1,88 @@
+import pytest
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.domain.models import GenerationOptions, GenerationResult
+from api.infrastructure.metrics import metrics
+from api.infrastructure.prompts import (
+    BUILTIN_TEMPLATES, PromptRegistry, PromptTemplate, PromptTooLongError, TokenCounter, build_prompt_registry,
+)
+
+def small_registry(window=300, reserve=50):
+    registry = PromptRegistry(TokenCounter(context_windows={"tiny": window}), output_reserve=reserve)
+    for template in BUILTIN_TEMPLATES:
+        registry.register(template)
+    return registry
+
+def test_templates_render_like_the_original_prompts():
+    prompt = build_prompt_registry().render(
+        "product_description", "gemma:2b", version=1, product_name_input="carro vermelho", category_section="", context_section="",
+    )
+    assert "Nome/Palavras-chave: carro vermelho\n" in prompt.text
+    assert prompt.text.endswith("Responda APENAS com o objeto JSON, sem nenhum texto ou explicação adicional.")
+    assert prompt.template == "product_description@v1" and not prompt.truncated
+    assert 0 < prompt.tokens < 200
+
+def test_versions_are_pinned_or_latest():
+    registry = PromptRegistry()
+    registry.register(PromptTemplate("greeting", 1, "Olá {name}"))
+    registry.register(PromptTemplate("greeting", 2, "Oi {name}"))
+    assert registry.render("greeting", "gemma", name="Ana").text == "Oi Ana"
+    registry.pinned_versions = {"greeting": 1}
+    assert registry.render("greeting", "gemma", name="Ana").text == "Olá Ana"
+    with pytest.raises(ValueError):
+        PromptTemplate("bad", 1, "{value:>10}")
+
+def test_context_is_truncated_before_the_product_name():
+    metrics.reset()
+    registry = small_registry()
+    context = "\n\n\n".join(f"[manual.md]\nTrecho {i} sobre   carros   de corrida." for i in range(100))
+    prompt = registry.render("product_description", "tiny", product_name_input="carro vermelho", category_section="", context_section=context)
+
+    assert prompt.truncated and prompt.tokens <= registry.budget("tiny")
+    assert "Trecho 0 sobre carros de corrida." in prompt.text and "Trecho 99" not in prompt.text
+    assert "carro vermelho" in prompt.text
+    assert metrics.counter("prompt_truncations", template="product_description@v2") == 1
+    assert metrics.snapshot()["summaries"]["prompt_tokens{template=product_description@v2}"]["count"] == 1
+
+def test_chat_prompts_keep_both_ends():
+    registry = small_registry()
+    prompt = "Instruções iniciais. " + "texto irrelevante " * 500 + "Qual é a pergunta final?"
+    rendered = registry.render("chat", "tiny", prompt=prompt)
+    assert rendered.text.startswith("Instruções iniciais.")
+    assert rendered.text.endswith("Qual é a pergunta final?")
+    assert rendered.tokens <= registry.budget("tiny")
+
+def test_fixed_text_over_budget_raises():
+    registry = small_registry(window=60, reserve=10)
+    with pytest.raises(PromptTooLongError):
+        registry.render("product_image_analysis", "tiny")
+
+def test_generation_options_merge_template_defaults_within_caps():
+    registry = small_registry(window=300, reserve=50)
+    registry.max_output_tokens, registry.max_stop_sequences = 400, 2
+    values = dict(product_name_input="carro", category_section="", length_section="", context_section="")
+
+    defaults = registry.render("product_description", "gemma:2b", **values).options
+    assert defaults == GenerationOptions(max_output_tokens=400, temperature=0.4, context_window=8192) # Template asks for 512
+
+    requested = GenerationOptions(max_output_tokens=100, stop=["\n\n", "}", "###"], temperature=5, seed=7)
+    options = registry.render("product_description", "gemma:2b", options=requested, **values).options
+    assert options == GenerationOptions(max_output_tokens=100, stop=["\n\n", "}"], temperature=2.0, seed=7, context_window=8192)
+
+    rendered = registry.render("chat", "tiny", options=GenerationOptions(max_output_tokens=1000), prompt="oi " * 150)
+    assert rendered.options.max_output_tokens == 300 - rendered.tokens # What the context window has left
+    assert rendered.options.context_window == 300 # Sent as num_ctx, so Ollama keeps the whole prompt
+
+def test_generated_tokens_are_recorded_per_template():
+    metrics.reset()
+    registry = small_registry()
+    prompt = registry.render("chat", "tiny", prompt="oi")
+    registry.record_generation(prompt, GenerationResult(text="olá", output_tokens=12, finish_reason="length"))
+    assert metrics.snapshot()["summaries"]["generated_tokens{template=chat@v1}"]["count"] == 1
+    assert metrics.counter("generation_length_limited", template="chat@v1") == 1
@@ -0,0 +1,76 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+import gzip
+import os
+import sys
+import time
+
+import brotli
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.encoders import jsonable_encoder
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.main import app
+from api.presentation.compression import accepted_encodings
+from api.presentation.endpoints import get_semantic_cache
+
+LONG_DESCRIPTION = " ".join(["Miniatura de carro de corrida vermelho em escala 1:18, com detalhes cromados e rodas de borracha."] * 60)
+TASK_ID = "3f1c2a9e-0000-4000-8000-000000000000"
+TASK_RESULT = {"suggested_name": "Carro de Corrida Vermelho", "suggested_description": LONG_DESCRIPTION, "suggested_category": "Brinquedos"}
+TASK_STATUS = {"task_id": TASK_ID, "status": "SUCCESS", "result": TASK_RESULT, "error": None}
+GENERATED_TEXT = {"status": "SUCCESS", "result": LONG_DESCRIPTION, "session_id": "3f1c2a9e-0000-4000-8000-000000000001"}
+
+@pytest.fixture
+def client():
+    async_result = MagicMock()
+    async_result.ready.return_value = True
+    async_result.successful.return_value = True
+    async_result.get.return_value = TASK_RESULT
+    app.dependency_overrides[get_semantic_cache] = lambda: None
+    with patch.dict(os.environ, {"INTERNAL_SERVICE_SECRET": "test-secret-key"}), \
+         patch('api.infrastructure.celery_client.AsyncResult', return_value=async_result):
+        yield TestClient(app, headers={"X-API-KEY": "test-secret-key"})
+    app.dependency_overrides.clear()
+
+def test_large_responses_are_compressed(client):
+    url = f"/api/ai/status/{TASK_ID}"
+    response = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.json()["result"]["suggested_description"] == LONG_DESCRIPTION
+    assert int(response.headers["content-length"]) < len(LONG_DESCRIPTION) / 5
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"] == "application/json"
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get("/api/health", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in response.headers
+
+def test_accept_encoding_honors_q_zero():
+    assert accepted_encodings("gzip, br;q=0") == {"gzip"}
+    assert accepted_encodings("br;q=1.0, gzip;q=0.5") == {"br", "gzip"}
+
+@pytest.mark.skipif(os.environ.get("RESPONSE_SERIALIZATION_BENCHMARK") != "1", reason="set RESPONSE_SERIALIZATION_BENCHMARK=1 to run")
+def test_serialization_benchmark():
+    """Render time per response, stdlib json vs orjson, and bytes on the wire with gzip/brotli."""
+    rounds = 5000
+    payloads = [("task status", TASK_STATUS), ("generate-text", jsonable_encoder(GENERATED_TEXT))]
+    for name, content in payloads:
+        timings = {}
+        for response_class in (JSONResponse, ORJSONResponse):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                body = response_class(content).body
+            timings[response_class.__name__] = (time.perf_counter() - started) / rounds
+        print(f"\n{name}: {len(body)} B, gzip {len(gzip.compress(body, 6))} B, br {len(brotli.compress(body, quality=4))} B; "
+              + ", ".join(f"{cls} {seconds * 1e6:.1f} us" for cls, seconds in timings.items()))
+        assert timings["ORJSONResponse"] < timings["JSONResponse"]
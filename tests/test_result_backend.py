@@ -0,0 +1,92 @@
+import pytest
+from unittest.mock import patch
+import os
+import sys
+import time
+
+from celery import Celery
+from kombu.serialization import dumps
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.infrastructure.result_backend import COMPRESSED_PREFIX, REFERENCE_PREFIX
+
+# A vision analysis (long free text) and a product description, as stored by the workers.
+VISION_RESULT = " ".join(["Tênis de corrida azul com solado de borracha, cabedal em malha respirável."] * 40)
+DESCRIPTION_RESULT = {
+    "suggested_name": "Carro de Corrida Vermelho",
+    "suggested_description": "Miniatura de carro de corrida vermelho em escala 1:18, com detalhes cromados.",
+    "suggested_category": "Brinquedos",
+}
+
+@pytest.fixture
+def backend(tmp_path):
+    env = {
+        "RESULT_STORAGE_DIR": str(tmp_path / "results"),
+        "RESULT_COMPRESSION_THRESHOLD_BYTES": "1024",
+        "RESULT_OFFLOAD_THRESHOLD_BYTES": "4096",
+    }
+    with patch.dict(os.environ, env):
+        app = Celery(
+            "test_results",
+            backend="api.infrastructure.result_backend:OffloadingRedisBackend+redis://localhost:6379/0",
+            result_serializer="msgpack",
+            result_accept_content=["msgpack", "json"],
+        )
+        yield app.backend
+
+def meta(result):
+    return {"status": "SUCCESS", "result": result, "traceback": None, "children": [], "task_id": "t1"}
+
+def test_small_results_stay_inline(backend):
+    payload = backend.encode(meta(DESCRIPTION_RESULT))
+    assert not payload.startswith(b"\x00")
+    assert backend.decode(payload)["result"] == DESCRIPTION_RESULT
+
+def test_large_results_are_compressed(backend):
+    payload = backend.encode(meta(VISION_RESULT))
+    assert payload.startswith(COMPRESSED_PREFIX)
+    assert backend.decode(payload)["result"] == VISION_RESULT
+
+def test_huge_results_are_offloaded_to_storage(backend):
+    huge = os.urandom(20000).hex() # Incompressible
+    payload = backend.encode(meta(huge))
+    assert payload.startswith(REFERENCE_PREFIX) and len(payload) < 100
+    assert len(list(backend.storage_dir.iterdir())) == 1
+    assert backend.decode(payload)["result"] == huge
+
+    # Expired offloaded results are removed by celery.backend_cleanup
+    backend.app.conf.result_expires = 60
+    old = time.time() - 120
+    for path in backend.storage_dir.iterdir():
+        os.utime(path, (old, old))
+    backend.cleanup()
+    assert list(backend.storage_dir.iterdir()) == []
+
+def test_results_stored_as_json_still_decode(backend):
+    _, _, payload = dumps(meta(DESCRIPTION_RESULT), serializer="json")
+    assert backend.decode(payload.encode("utf-8"))["result"] == DESCRIPTION_RESULT
+
+@pytest.mark.skipif(os.environ.get("RESULT_SERIALIZATION_BENCHMARK") != "1", reason="set RESULT_SERIALIZATION_BENCHMARK=1 to run")
+def test_serialization_benchmark(backend):
+    """Bytes held in Redis and encode+decode time per result: plain JSON vs msgpack with compression/offloading."""
+    rounds = 2000
+    for name, result in [("description", DESCRIPTION_RESULT), ("vision", VISION_RESULT)]:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            _, _, json_payload = dumps(meta(result), serializer="json")
+            backend.decode(json_payload.encode("utf-8"))
+        json_seconds = (time.perf_counter() - started) / rounds
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            payload = backend.encode(meta(result))
+            backend.decode(payload)
+        new_seconds = (time.perf_counter() - started) / rounds
+
+        print(f"\n{name}: json {len(json_payload.encode('utf-8'))} B / {json_seconds * 1e6:.1f} us, "
+              f"msgpack+zlib {len(payload)} B / {new_seconds * 1e6:.1f} us")
+        assert len(payload) <= len(json_payload.encode("utf-8"))
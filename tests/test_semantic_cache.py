@@ -0,0 +1,117 @@
+import pytest
+from unittest.mock import MagicMock
+import os
+import sys
+
+import numpy as np
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+from api.application.use_cases import GenerateProductDescriptionUseCase, GetTaskStatusUseCase
+from api.domain.models import TaskStatus
+from api.infrastructure.metrics import metrics
+from api.infrastructure.semantic_cache import SemanticCache
+from api.infrastructure.vector_index import VectorIndex
+from api.schemas import GenerateProductDescriptionRequest
+
+VOCABULARY = ["carro", "de", "corrida", "vermelho", "bicicleta", "azul"]
+
+class BagOfWordsEmbedder:
+    """Deterministic stand-in for Ollama embeddings."""
+    def embed(self, texts):
+        return [[float(text.split().count(word)) for word in VOCABULARY] for text in texts]
+
+RESULT = {
+    "suggested_name": "Carro de Corrida Vermelho",
+    "suggested_description": "Um carrinho de corrida vermelho.",
+    "suggested_category": "Brinquedos",
+}
+
+@pytest.fixture
+def cache(tmp_path):
+    metrics.reset()
+    return SemanticCache(BagOfWordsEmbedder(), tmp_path, threshold=0.8, save_interval=0)
+
+def test_near_duplicate_prompt_hits_cache(cache):
+    result, vector = cache.lookup("carro de corrida vermelho", None)
+    assert result is None
+    cache.add_pending("task-1", vector, "carro de corrida vermelho", None)
+    assert cache.complete("task-1", RESULT)
+
+    result, _ = cache.lookup("Carro corrida vermelho", None)
+    assert result == RESULT
+    assert cache.lookup("bicicleta azul", None)[0] is None
+    # Different category hints never share results
+    assert cache.lookup("carro corrida vermelho", "Automotivo")[0] is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["hit_rate"] == 0.25
+
+def test_cache_is_persisted(cache, tmp_path):
+    _, vector = cache.lookup("carro de corrida vermelho", None)
+    cache.add_pending("task-1", vector, "carro de corrida vermelho", None)
+    cache.complete("task-1", RESULT)
+
+    reloaded = SemanticCache(BagOfWordsEmbedder(), tmp_path, threshold=0.8)
+    assert reloaded.lookup("carro corrida vermelho", None)[0] == RESULT
+
+def test_invalid_results_are_not_cached(cache):
+    _, vector = cache.lookup("carro de corrida vermelho", None)
+    cache.add_pending("task-1", vector, "carro de corrida vermelho", None)
+    assert not cache.complete("task-1", {"nome": "sem schema"})
+    assert cache.stats()["entries"] == 0
+
+def test_oldest_entries_are_evicted_in_batches(tmp_path):
+    cache = SemanticCache(BagOfWordsEmbedder(), tmp_path, max_entries=4, evict_batch=2, save_interval=3600)
+    for i in range(7):
+        cache.add_pending(f"task-{i}", [1.0, float(i)], f"produto {i}", None)
+        cache.complete(f"task-{i}", RESULT)
+        if i == 4:
+            assert len(cache.index) == 5 # One over: waits for the batch
+    assert [m["product_name_input"] for m in cache.index.metadata] == [f"produto {i}" for i in range(2, 7)]
+
+def test_use_cases_fill_and_serve_the_cache(cache):
+    celery_client = MagicMock()
+    celery_client.send_task.return_value.id = "task-1"
+    celery_client.get_task_status.return_value = TaskStatus(task_id="task-1", status="SUCCESS", result=RESULT)
+
+    use_case = GenerateProductDescriptionUseCase(celery_client, semantic_cache=cache)
+    ticket = use_case.execute(GenerateProductDescriptionRequest(product_name_input="carro de corrida vermelho"))
+    assert ticket.status == "PENDING"
+    GetTaskStatusUseCase(celery_client, cache).execute("task-1")
+
+    ticket = use_case.execute(GenerateProductDescriptionRequest(product_name_input="carro corrida vermelho"))
+    assert ticket.status == "SUCCESS"
+    assert celery_client.send_task.call_count == 1
+    celery_client.store_result.assert_called_once_with(ticket.task_id, RESULT)
+
+def test_vector_index_grows_in_place(tmp_path):
+    index = VectorIndex()
+    for i in range(40):
+        index.add([1.0, float(i)], {"row": i})
+    buffer = index._buffer
+    index.add([0.0, 1.0], {"row": 40})
+    assert index._buffer is buffer # Room left over from the last doubling: no copy
+    assert index.vectors.shape == (41, 2)
+    assert index.search([0.0, 1.0], k=1)[0][2] == {"row": 40}
+
+    index.remove([0, 40])
+    index.save(tmp_path)
+    loaded = VectorIndex.load(tmp_path, mmap=True)
+    assert len(loaded) == 39 and loaded.metadata[0] == {"row": 1}
+    loaded.add([1.0, 0.0], {"row": "new"}) # Copies out of the read-only memory map
+    assert loaded.search([1.0, 0.0], k=1)[0][2] == {"row": "new"}
+    with pytest.raises(ValueError):
+        loaded.add([1.0, 0.0, 0.0], {})
+
+def test_vector_index_adds_a_batch_at_once():
+    index = VectorIndex()
+    index.add([1.0, 0.0], {"row": 0})
+    index.add_many([[0.0, 2.0], [3.0, 4.0]], [{"row": 1}, {"row": 2}])
+    index.add_many([], [])
+    assert len(index) == 3
+    np.testing.assert_allclose(index.vectors, [[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]])
@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY_MODULES = ["celery", "kombu", "sqlalchemy", "google.genai", "PIL", "numpy", "redis", "ollama", "requests"]
+
+# Imports the app in a fresh interpreter, serves /api/health once and reports
+# how long each step took and which heavy modules ended up loaded.
+STARTUP_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+from api.main import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    status = client.get("/api/health").status_code
+    ready = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "ready_seconds": ready - start,
+    "health_status": status,
+    "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def run_startup(tmp_path) -> dict:
+    env = {key: value for key, value in os.environ.items() if key != "supabase_POSTGRES_URL"}
+    env.update({
+        "PYTHONPATH": service_root,
+        "GENERATED_IMAGES_DIR": str(tmp_path / "generated_images"),
+        "API_PRELOAD_BACKENDS": "false",
+    })
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_api_starts_without_backends_configured(tmp_path):
+    """No database URL, no generated_images dir: the app still imports and answers /api/health."""
+    report = run_startup(tmp_path)
+    print(f"\nAPI import: {report['import_seconds']:.3f}s, ready: {report['ready_seconds']:.3f}s")
+
+    assert report["health_status"] == 200
+    assert report["loaded"] == []
+    assert (tmp_path / "generated_images").is_dir()
+
+
+@pytest.mark.skipif(os.environ.get("STARTUP_BENCHMARK") != "1", reason="set STARTUP_BENCHMARK=1 to enforce the startup budget")
+def test_api_startup_budget(tmp_path):
+    budget = float(os.environ.get("STARTUP_BUDGET_SECONDS", "1.0"))
+    best = min(run_startup(tmp_path)["ready_seconds"] for _ in range(3))
+    print(f"\nBest of 3 API startups: {best:.3f}s (budget {budget:.1f}s)")
+    assert best < budget
@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+
+# Add the service's root directory to the path to allow for relative imports
+service_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if service_root not in sys.path:
+    sys.path.insert(0, service_root)
+
+import requests
+from google.genai import errors as genai_errors
+from PIL import Image
+
+from api.infrastructure.gemini_client import GeminiClient, GeminiQuotaExceeded
+from api.infrastructure.vision_spillover import VisionSpilloverPolicy
+
+class FakeRedis:
+    """The handful of Redis commands the spillover policy uses."""
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = str(value)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+        return int(self.values[key])
+
+    def decr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) - 1)
+        return int(self.values[key])
+
+    def expire(self, key, seconds):
+        pass
+
+@pytest.fixture
+def queue_depth():
+    with patch('api.infrastructure.vision_spillover.get_queue_depth') as mock_depth:
+        mock_depth.return_value = 0
+        yield mock_depth
+
+def make_policy(**kwargs):
+    options = dict(sla_seconds=60, share=1.0, local_concurrency=2, initial_local_seconds=30, random_source=lambda: 0.0)
+    options.update(kwargs)
+    return VisionSpilloverPolicy(FakeRedis(), **options)
+
+def test_spills_only_when_backlog_exceeds_sla(queue_depth):
+    policy = make_policy()
+    queue_depth.return_value = 4 # 4 tasks * 30s / 2 in parallel = 60s
+    assert policy.should_spill() is False
+    queue_depth.return_value = 5
+    assert policy.should_spill() is True
+
+def test_spills_only_the_configured_share(queue_depth):
+    queue_depth.return_value = 100
+    assert make_policy(share=0.3, random_source=lambda: 0.5).should_spill() is False
+    assert make_policy(share=0.3, random_source=lambda: 0.1).should_spill() is True
+
+def test_respects_gemini_quota_and_cooldown(queue_depth):
+    queue_depth.return_value = 100
+    policy = make_policy(requests_per_minute=2, requests_per_day=10)
+    assert [policy.should_spill() for _ in range(3)] == [True, True, False]
+
+    policy = make_policy()
+    policy.pause()
+    assert policy.should_spill() is False
+
+def test_local_durations_update_the_wait_estimate(queue_depth):
+    policy = make_policy(smoothing=0.5)
+    policy.record_local_duration(10)
+    assert policy.local_seconds_per_task() == 20
+    queue_depth.return_value = 5 # 5 * 20s / 2 = 50s, within the SLA now
+    assert policy.should_spill() is False
+
+def gemini_quota_error():
+    response = requests.Response()
+    response.status_code = 429
+    response._content = b'{"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}}'
+    return genai_errors.ClientError(429, response)
+
+def test_gemini_quota_error_pauses_spillover(tmp_path):
+    from workers.vision_worker import analyze_with_spillover
+    image = tmp_path / "product.png"
+    Image.new("RGB", (4, 4)).save(image)
+    policy = MagicMock()
+    policy.should_spill.return_value = True
+    llava_client = MagicMock()
+    llava_client.analyze_image.return_value = {"status": "SUCCESS", "response": "Carro vermelho"}
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}), patch("api.infrastructure.gemini_client.genai.Client") as client:
+        client.return_value.models.generate_content.side_effect = gemini_quota_error()
+        gemini = GeminiClient()
+        with pytest.raises(GeminiQuotaExceeded):
+            gemini.analyze_image(str(image), "Descreva")
+
+        with patch("workers.vision_worker.vision_spillover_enabled", return_value=True), \
+             patch("workers.vision_worker.get_vision_spillover_policy", return_value=policy), \
+             patch("workers.vision_worker.get_gemini_client", return_value=gemini):
+            assert analyze_with_spillover(llava_client, str(image), "Descreva").text == "Carro vermelho"
+
+    policy.pause.assert_called_once()
+
+def test_llava_usage_is_recorded_for_the_prompt(tmp_path):
+    from workers.vision_worker import analyze_product_image
+    image = tmp_path / "product.png"
+    Image.new("RGB", (4, 4)).save(image)
+    registry = MagicMock()
+    llava_client = MagicMock(model_name="llava")
+    llava_client.analyze_image.return_value = {
+        "status": "SUCCESS", "response": "Carro vermelho", "usage": {"output_tokens": 512, "finish_reason": "length"},
+    }
+
+    with patch("workers.vision_worker.LlavaClient", return_value=llava_client), \
+         patch("workers.vision_worker.get_prompt_registry", return_value=registry), \
+         patch("workers.vision_worker.find_duplicate_analysis", return_value=(None, None)), \
+         patch("workers.vision_worker.vision_spillover_enabled", return_value=False):
+        assert analyze_product_image("task-1", str(image), "loja-a") == "Carro vermelho"
+
+    prompt = registry.render.return_value
+    assert llava_client.analyze_image.call_args.kwargs["options"] is prompt.options
+    generation = registry.record_generation.call_args.args[1]
+    assert registry.record_generation.call_args.args[0] is prompt
+    assert (generation.output_tokens, generation.finish_reason) == (512, "length")
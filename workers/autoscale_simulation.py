@@ -0,0 +1,164 @@
+"""
+Replays a recorded arrival trace against AutoscalePolicy, to tune the
+autoscaling settings offline.
+
+A trace is a JSONL file with one task per line:
+
+    {"arrival": 12.5, "duration": 31.2}
+
+`arrival` is in seconds (or an ISO timestamp; the first arrival becomes 0)
+and `duration` is how long the task ran; lines without a duration use
+--default-duration. Example:
+
+    python -m workers.autoscale_simulation trace.jsonl --min 2 --max 16 --fixed 8
+"""
+import argparse
+import json
+import math
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from workers.autoscaling import AutoscalePolicy, ScalingSignals
+
+Trace = List[Tuple[float, float]] # (arrival seconds, duration seconds), sorted by arrival
+
+
+def load_trace(path: str, default_duration: float = 30.0) -> Trace:
+    tasks = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            arrival = record["arrival"]
+            if isinstance(arrival, str):
+                arrival = datetime.fromisoformat(arrival.replace("Z", "+00:00")).timestamp()
+            tasks.append((float(arrival), float(record.get("duration") or default_duration)))
+    tasks.sort()
+    if tasks:
+        start = tasks[0][0]
+        tasks = [(arrival - start, duration) for arrival, duration in tasks]
+    return tasks
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def simulate(
+    trace: Trace,
+    policy: Optional[AutoscalePolicy] = None,
+    initial_concurrency: int = 1,
+    ollama_capacity: Optional[int] = None,
+    decision_interval: float = 5.0,
+    tick_seconds: float = 1.0,
+    task_seconds_estimate: float = 30.0,
+    smoothing: float = 0.2,
+) -> Dict:
+    """
+    Runs the trace through one worker whose concurrency is set by `policy`
+    every `decision_interval` seconds (fixed at `initial_concurrency` without
+    a policy). Time advances in steps of `tick_seconds`. Returns queue wait
+    percentiles, slot usage and the scaling decisions taken.
+    """
+    pending = deque(trace)
+    queue: deque = deque()
+    running: List[Tuple[float, float]] = [] # (finish time, duration)
+    waits: List[float] = []
+    decisions = []
+    concurrency = initial_concurrency
+    task_seconds = task_seconds_estimate
+    slot_seconds = 0.0
+    peak = concurrency
+    now = 0.0
+    next_decision = 0.0
+
+    while pending or queue or running:
+        for end, duration in running:
+            if end <= now:
+                task_seconds += smoothing * (duration - task_seconds)
+        running = [task for task in running if task[0] > now]
+        while pending and pending[0][0] <= now:
+            queue.append(pending.popleft())
+
+        if policy is not None and now >= next_decision:
+            signals = ScalingSignals(
+                queue_depth=len(queue),
+                busy=len(running),
+                task_seconds=task_seconds,
+                ollama_in_flight=len(running) if ollama_capacity is not None else 0,
+                ollama_capacity=ollama_capacity,
+            )
+            target = policy.decide(concurrency, signals, now)
+            if target != concurrency:
+                decisions.append((now, concurrency, target))
+                concurrency = target
+                peak = max(peak, concurrency)
+            next_decision = now + decision_interval
+
+        while queue and len(running) < concurrency:
+            arrival, duration = queue.popleft()
+            waits.append(now - arrival)
+            running.append((now + duration, duration))
+
+        slot_seconds += concurrency * tick_seconds
+        now += tick_seconds
+
+    return {
+        "tasks": len(waits),
+        "duration_seconds": now,
+        "wait_p50": percentile(waits, 0.5),
+        "wait_p95": percentile(waits, 0.95),
+        "wait_max": max(waits, default=0.0),
+        "mean_concurrency": slot_seconds / now if now else 0.0,
+        "peak_concurrency": peak,
+        "scaling_decisions": decisions,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay an arrival trace against the worker autoscaling policy.")
+    parser.add_argument("trace", help="JSONL file with one {\"arrival\", \"duration\"} object per task")
+    parser.add_argument("--min", type=int, default=1, dest="min_concurrency")
+    parser.add_argument("--max", type=int, default=16, dest="max_concurrency")
+    parser.add_argument("--drain-seconds", type=float, default=60.0)
+    parser.add_argument("--max-step-up", type=int, default=4)
+    parser.add_argument("--max-step-down", type=int, default=1)
+    parser.add_argument("--scale-down-ratio", type=float, default=0.7)
+    parser.add_argument("--scale-down-delay", type=float, default=120.0)
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between scaling decisions")
+    parser.add_argument("--ollama-capacity", type=int, default=None, help="Ollama slots available to the worker")
+    parser.add_argument("--default-duration", type=float, default=30.0)
+    parser.add_argument("--fixed", type=int, default=None, help="Also replay with this fixed concurrency, for comparison")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace, args.default_duration)
+    policy = AutoscalePolicy(
+        min_concurrency=args.min_concurrency,
+        max_concurrency=args.max_concurrency,
+        drain_seconds=args.drain_seconds,
+        max_step_up=args.max_step_up,
+        max_step_down=args.max_step_down,
+        scale_down_ratio=args.scale_down_ratio,
+        scale_down_delay=args.scale_down_delay,
+    )
+    runs = [("autoscaled", simulate(
+        trace, policy, initial_concurrency=max(1, args.min_concurrency), ollama_capacity=args.ollama_capacity,
+        decision_interval=args.interval, task_seconds_estimate=args.default_duration,
+    ))]
+    if args.fixed:
+        runs.append((f"fixed={args.fixed}", simulate(trace, None, initial_concurrency=args.fixed)))
+
+    for name, result in runs:
+        print(f"{name}: {result['tasks']} tasks in {result['duration_seconds']:.0f}s, "
+              f"wait p50={result['wait_p50']:.1f}s p95={result['wait_p95']:.1f}s max={result['wait_max']:.1f}s, "
+              f"concurrency mean={result['mean_concurrency']:.1f} peak={result['peak_concurrency']}, "
+              f"{len(result['scaling_decisions'])} scaling decisions")
+
+
+if __name__ == "__main__":
+    main()
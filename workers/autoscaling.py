@@ -0,0 +1,319 @@
+import os
+import math
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import redis
+from celery.concurrency.base import apply_target
+from celery.concurrency.thread import ApplyResult, TaskPool
+from celery.signals import task_postrun, task_prerun
+from celery.worker import state
+from celery.worker.autoscale import Autoscaler
+
+from api.infrastructure.ollama_pool import get_ollama_pool
+from api.infrastructure.queue_depth import get_queue_depths
+from api.infrastructure.redis_client import get_redis_client
+
+SHARED_OLLAMA_LOAD_KEY = "autoscale:ollama_in_flight"
+
+
+class ScalingSignals(NamedTuple):
+    """What the controller sees of a worker at one point in time."""
+    queue_depth: int # Messages waiting in the worker's queues on the broker
+    busy: int # Tasks the worker is running
+    task_seconds: float # Moving average of task durations
+    ollama_in_flight: int = 0 # Requests every worker sharing the Ollama hosts has in flight
+    ollama_capacity: Optional[int] = None # Free + used Ollama slots on healthy hosts (None = unbounded)
+    ollama_share: Optional[int] = None # Slots this worker may use (None = all of ollama_capacity)
+
+
+class AutoscalePolicy:
+    """
+    Picks a worker's concurrency from its backlog, task latency and Ollama load.
+
+    The worker needs enough slots for the tasks it is running plus enough to
+    drain the queue within `drain_seconds` (depth x average task time /
+    drain_seconds). It scales up at once, by at most `max_step_up` per decision.
+    It only scales down once the need has stayed below `scale_down_ratio` of
+    the current concurrency for `scale_down_delay` seconds, then by at most
+    `max_step_down` per decision, so a bursty queue doesn't make it flap.
+
+    Concurrency never exceeds this worker's share of the Ollama slots on the
+    healthy hosts: past that, threads would only wait in the endpoint pool.
+    While every slot is in use, by this or any other worker, Ollama is the
+    bottleneck and the policy doesn't scale up at all.
+    """
+
+    def __init__(
+        self,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        drain_seconds: float = 60.0,
+        max_step_up: int = 4,
+        max_step_down: int = 1,
+        scale_down_ratio: float = 0.7,
+        scale_down_delay: float = 120.0,
+    ):
+        self.min_concurrency = max(0, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.drain_seconds = max(1.0, drain_seconds)
+        self.max_step_up = max(1, max_step_up)
+        self.max_step_down = max(1, max_step_down)
+        self.scale_down_ratio = scale_down_ratio
+        self.scale_down_delay = scale_down_delay
+        self._below_since: Optional[float] = None
+
+    def needed_concurrency(self, signals: ScalingSignals) -> int:
+        backlog = math.ceil(signals.queue_depth * signals.task_seconds / self.drain_seconds)
+        return signals.busy + backlog
+
+    def ceiling(self, signals: ScalingSignals) -> int:
+        if signals.ollama_capacity is None:
+            return self.max_concurrency
+        slots = signals.ollama_capacity if signals.ollama_share is None else signals.ollama_share
+        return max(self.min_concurrency, min(self.max_concurrency, slots))
+
+    def decide(self, current: int, signals: ScalingSignals, now: float) -> int:
+        """Target concurrency for a worker currently running `current` slots."""
+        ceiling = self.ceiling(signals)
+        needed = max(self.min_concurrency, min(ceiling, self.needed_concurrency(signals)))
+
+        if current > ceiling:
+            self._below_since = None
+            return ceiling # Hosts were ejected or the caps changed: no point waiting.
+
+        if needed > current:
+            self._below_since = None
+            if signals.ollama_capacity is not None and signals.ollama_in_flight >= signals.ollama_capacity:
+                return current
+            return min(needed, current + self.max_step_up)
+
+        if needed < current * self.scale_down_ratio:
+            if self._below_since is None:
+                self._below_since = now
+            if now - self._below_since >= self.scale_down_delay:
+                return max(needed, current - self.max_step_down)
+            return current
+
+        self._below_since = None
+        return max(self.min_concurrency, current)
+
+
+class TaskLatencyTracker:
+    """
+    Moving average of task durations, fed by the task_prerun/task_postrun
+    signals. It only sees tasks run in this process: with the prefork pool the
+    estimate stays at AUTOSCALE_TASK_SECONDS_ESTIMATE.
+    """
+
+    def __init__(self, initial_seconds: float = 30.0, smoothing: float = 0.2):
+        self.average = initial_seconds
+        self.smoothing = smoothing
+        self._started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def started(self, task_id: str) -> None:
+        with self._lock:
+            self._started[task_id] = time.monotonic()
+
+    def finished(self, task_id: str) -> None:
+        with self._lock:
+            started = self._started.pop(task_id, None)
+            if started is not None:
+                self.average += self.smoothing * (time.monotonic() - started - self.average)
+
+
+task_latency = TaskLatencyTracker(float(os.environ.get("AUTOSCALE_TASK_SECONDS_ESTIMATE", "30")))
+
+
+@task_prerun.connect
+def _record_task_start(task_id=None, **kwargs):
+    if task_id:
+        task_latency.started(task_id)
+
+
+@task_postrun.connect
+def _record_task_end(task_id=None, **kwargs):
+    if task_id:
+        task_latency.finished(task_id)
+
+
+def ollama_load():
+    """(requests in flight, slots on healthy hosts) for this process's Ollama pool."""
+    endpoints = get_ollama_pool().snapshot()
+    in_flight = sum(e["outstanding"] for e in endpoints)
+    if any(e["max_concurrency"] is None for e in endpoints):
+        return in_flight, None
+    return in_flight, sum(e["max_concurrency"] for e in endpoints if not e["ejected"])
+
+
+def share_ollama_load(redis_client, worker: str, in_flight: int, stale_after: float) -> Tuple[int, int]:
+    """
+    Publishes this worker's Ollama requests in flight and returns (requests in
+    flight across workers, number of workers). Workers that haven't reported
+    for `stale_after` seconds are dropped.
+    """
+    now = time.time()
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.hset(SHARED_OLLAMA_LOAD_KEY, worker, f"{in_flight} {now}")
+    pipeline.hgetall(SHARED_OLLAMA_LOAD_KEY)
+    _, loads = pipeline.execute()
+    total, workers, stale = 0, 0, []
+    for name, value in loads.items():
+        count, reported_at = value.split()
+        if now - float(reported_at) > stale_after:
+            stale.append(name)
+            continue
+        total += int(count)
+        workers += 1
+    if stale:
+        redis_client.hdel(SHARED_OLLAMA_LOAD_KEY, *stale)
+    return total, max(1, workers)
+
+
+def ollama_share(capacity: int, shared_in_flight: int, own_in_flight: int, workers: int) -> int:
+    """
+    Slots a worker may use: an even split of the capacity between the workers,
+    or what it already uses plus the idle slots, if that is more.
+    """
+    fair_share = math.ceil(capacity / workers)
+    idle = max(0, capacity - shared_in_flight)
+    return min(capacity, max(fair_share, own_in_flight + idle))
+
+
+class ResizableThreadPool(TaskPool):
+    """
+    Celery's threads pool, resizable at runtime so an autoscaler can drive it.
+
+    Celery's own threads pool has no grow/shrink. This one has a thread for
+    up to the autoscale maximum (see reserve_threads) but never runs more
+    than `limit` tasks at once: extra tasks wait for a slot before they start
+    (and before they are acknowledged as started). Resizing only changes
+    `limit`; idle threads just wait for a slot.
+    """
+
+    def __init__(self, limit=None, *args, **kwargs):
+        # Celery starts the pool at the autoscale minimum, which may be 0.
+        super().__init__(max(1, limit or 1), *args, **kwargs)
+        self.max_threads = self.limit
+        self._running = 0
+        self._slots = threading.Condition()
+
+    def reserve_threads(self, max_threads: int) -> None:
+        """
+        Sizes the executor for `max_threads` tasks. Celery only passes the
+        autoscale minimum to the pool, so the autoscaler calls this at start-up,
+        before any task is applied.
+        """
+        if max_threads > self.max_threads:
+            self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=max_threads)
+            self.max_threads = max_threads
+
+    def on_apply(self, target, args=None, kwargs=None, callback=None, accept_callback=None, **_):
+        f = self.executor.submit(self._apply_when_free, target, args, kwargs, callback, accept_callback)
+        return ApplyResult(f)
+
+    def grow(self, n: int = 1) -> None:
+        with self._slots:
+            self.limit += n
+            self._slots.notify_all()
+
+    def shrink(self, n: int = 1) -> None:
+        with self._slots:
+            if self.limit - n < 1:
+                raise ValueError("Can't shrink the threads pool below one slot")
+            self.limit -= n
+
+    def _apply_when_free(self, *args):
+        with self._slots:
+            while self._running >= self.limit:
+                self._slots.wait()
+            self._running += 1
+        try:
+            return apply_target(*args)
+        finally:
+            with self._slots:
+                self._running -= 1
+                self._slots.notify()
+
+    def _get_info(self):
+        info = super()._get_info()
+        info.update({"running": self._running})
+        return info
+
+
+class QueueDepthAutoscaler(Autoscaler):
+    """
+    Celery autoscaler (worker_autoscaler) driven by AutoscalePolicy instead of
+    the number of reserved messages. Enabled with `--autoscale=max,min`; works
+    with the prefork pool and with ResizableThreadPool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if isinstance(self.pool, ResizableThreadPool):
+            self.pool.reserve_threads(self.max_concurrency) # grow() then only raises the limit
+        self.policy = AutoscalePolicy(
+            min_concurrency=self.min_concurrency,
+            max_concurrency=self.max_concurrency,
+            drain_seconds=float(os.environ.get("AUTOSCALE_DRAIN_SECONDS", "60")),
+            max_step_up=int(os.environ.get("AUTOSCALE_MAX_STEP_UP", "4")),
+            max_step_down=int(os.environ.get("AUTOSCALE_MAX_STEP_DOWN", "1")),
+            scale_down_ratio=float(os.environ.get("AUTOSCALE_SCALE_DOWN_RATIO", "0.7")),
+            scale_down_delay=float(os.environ.get("AUTOSCALE_SCALE_DOWN_DELAY", "120")),
+        )
+        # With the event loop, Celery calls maybe_scale every `keepalive` seconds.
+        self.keepalive = self.interval = float(os.environ.get("AUTOSCALE_INTERVAL", "5"))
+        self._last_decision = 0.0
+
+    def queues(self):
+        consumed = self.worker.app.amqp.queues.consume_from if self.worker else None
+        return list(consumed or ["text_queue", "vision_queue"])
+
+    def collect_signals(self) -> ScalingSignals:
+        # Messages this worker prefetched but hasn't started are backlog too.
+        waiting = max(0, len(state.reserved_requests) - len(state.active_requests))
+        depth = sum(get_queue_depths(self.queues()).values()) + waiting
+        in_flight, capacity = ollama_load()
+        share = None
+        if capacity is not None:
+            # Text and vision workers share the hosts: this process only sees its own leases.
+            worker = self.worker.hostname if self.worker else f"{socket.gethostname()}:{os.getpid()}"
+            own_in_flight = in_flight
+            in_flight, workers = share_ollama_load(get_redis_client(), worker, own_in_flight, 3 * self.interval)
+            share = ollama_share(capacity, in_flight, own_in_flight, workers)
+        return ScalingSignals(
+            queue_depth=depth,
+            busy=len(state.active_requests),
+            task_seconds=task_latency.average,
+            ollama_in_flight=in_flight,
+            ollama_capacity=capacity,
+            ollama_share=share,
+        )
+
+    def _maybe_scale(self, req=None):
+        now = time.monotonic()
+        if now - self._last_decision < self.interval:
+            return False # Also called on every task message
+        self._last_decision = now
+        try:
+            signals = self.collect_signals()
+        except redis.RedisError as e:
+            print(f"Autoscaler could not read the queue depth, keeping concurrency: {e}")
+            return False
+
+        current = self.processes
+        target = self.policy.decide(current, signals, now)
+        if target == current:
+            return False
+        print(f"Autoscaling {current} -> {target} (queued={signals.queue_depth}, busy={signals.busy}, "
+              f"task={signals.task_seconds:.1f}s, ollama={signals.ollama_in_flight}/{signals.ollama_capacity}, share={signals.ollama_share})")
+        if target > current:
+            self.scale_up(target - current)
+        else:
+            self._shrink(current - target) # Logs and keeps the size if it can't shrink
+        return self.processes != current
@@ -0,0 +1,232 @@
+"""
+Offline bulk processing for back-catalog migrations, without the API or Celery:
+
+    python -m workers.bulk_catalog /data/fotos --output produtos.jsonl
+    python -m workers.bulk_catalog manifest.jsonl --output produtos/ --format parquet
+
+Images run through the same pipeline as the product listing workflow
+(LLaVA analysis, then description generation); manifest rows with a
+`product_name_input` run through generate_product_description's pipeline.
+Results are written as they complete, and the ids of written results go to
+a checkpoint file, so an interrupted run resumes where it stopped.
+"""
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Set
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+
+
+def walk_images(directory: str) -> Iterator[dict]:
+    """Items for every image under the directory, in a stable order; ids are relative paths."""
+    root = Path(directory)
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield {"id": path.relative_to(root).as_posix(), "image_path": str(path)}
+
+
+def read_manifest(manifest: str) -> Iterator[dict]:
+    """
+    Items from a JSONL or CSV manifest with `image_path` or `product_name_input`
+    columns, plus optional `id`, `category_hint` and `project_id`.
+    """
+    base = Path(manifest).parent
+    with open(manifest, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(f) if manifest.endswith(".csv") else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            item = {key: value for key, value in row.items() if value not in (None, "")}
+            if "image_path" in item:
+                item["image_path"] = str(base / item["image_path"]) # Relative to the manifest
+            elif "product_name_input" not in item:
+                raise ValueError(f"Manifest row has neither image_path nor product_name_input: {row}")
+            item.setdefault("id", row.get("image_path") or item["product_name_input"])
+            yield item
+
+
+class Checkpoint:
+    """Ids of the items whose results are already written, one per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def add(self, item_ids: Iterable[str]) -> None:
+        for item_id in item_ids:
+            self._file.write(f"{item_id}\n")
+            self.done.add(item_id)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JsonlSink:
+    """Appends one JSON object per result; each one is on disk as soon as it is written."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict) -> List[str]:
+        """Writes the record and returns the ids now safely on disk."""
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return [record["id"]]
+
+    def close(self) -> List[str]:
+        self._file.close()
+        return []
+
+
+class ParquetSink:
+    """
+    Writes results to a directory of Parquet files, one per `batch_size`
+    results, so a resumed run adds files instead of rewriting earlier ones.
+    Read it back as a dataset, e.g. pandas.read_parquet(directory).
+    """
+
+    def __init__(self, directory: str, batch_size: int = 500):
+        import pyarrow # Only needed for --format parquet
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.rows: List[dict] = []
+
+    def write(self, record: dict) -> List[str]:
+        # Nested values as JSON strings, so every file has the same flat schema.
+        self.rows.append({key: value if key == "id" else json.dumps(value, ensure_ascii=False) for key, value in record.items()})
+        return self.flush() if len(self.rows) >= self.batch_size else []
+
+    def flush(self) -> List[str]:
+        if not self.rows:
+            return []
+        path = self.directory / f"part-{time.time_ns()}.parquet"
+        self.pyarrow.parquet.write_table(self.pyarrow.Table.from_pylist(self.rows), path)
+        written = [row["id"] for row in self.rows]
+        self.rows = []
+        return written
+
+    def close(self) -> List[str]:
+        return self.flush()
+
+
+def run(
+    items: Iterable[dict],
+    process: Callable[[dict], dict],
+    sink,
+    checkpoint: Checkpoint,
+    concurrency: int = 4,
+    log: Callable[[str], None] = print,
+) -> Dict[str, int]:
+    """
+    Processes the items not in the checkpoint with at most `concurrency`
+    running at once, writing each result as it completes. Failed items are
+    not checkpointed, so the next run retries them.
+    """
+    counts = {"processed": 0, "failed": 0, "skipped": 0}
+    pending: Dict[Future, dict] = {}
+
+    def collect(futures) -> None:
+        for future in futures:
+            item = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                log(f"Failed {item['id']}: {e}")
+                continue
+            counts["processed"] += 1
+            checkpoint.add(sink.write({"id": item["id"], "input": item, "result": result}))
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for item in items:
+            if item["id"] in checkpoint.done:
+                counts["skipped"] += 1
+                continue
+            # Keep only a couple of items queued per thread, so huge catalogs stream through.
+            if len(pending) >= 2 * concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(process, item)] = item
+        collect(wait(pending).done)
+    except KeyboardInterrupt:
+        log("Interrupted; waiting for the running items, run again to resume.")
+        for future in pending:
+            future.cancel()
+        collect([future for future in wait(pending).done if not future.cancelled()])
+        pending.clear()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        checkpoint.add(sink.close())
+    return counts
+
+
+class CatalogPipeline:
+    """The workers' pipelines, called in-process."""
+
+    def __init__(self):
+        from api.infrastructure.llava_client import LlavaClient
+        from api.infrastructure.prompts import build_prompt_registry
+        from workers.text_worker import build_product_listing, describe_product
+        self.llava_client = LlavaClient()
+        self.prompt_registry = build_prompt_registry() # Metrics stay local: no Redis needed
+        self.build_product_listing = build_product_listing
+        self.describe_product = describe_product
+
+    def __call__(self, item: dict) -> dict:
+        if "image_path" not in item:
+            return self.describe_product(item["product_name_input"], item.get("category_hint"), self.prompt_registry).model_dump()
+        # Unlike process_product_image, the source image is kept.
+        prompt = self.prompt_registry.render("product_image_analysis", self.llava_client.model_name)
+        response = self.llava_client.analyze_image(image_path=item["image_path"], prompt=prompt.text, options=prompt.options)
+        if response["status"] != "SUCCESS":
+            raise RuntimeError(f"LLaVA API call failed: {response['error']}")
+        from api.domain.models import GenerationResult
+        self.prompt_registry.record_generation(prompt, GenerationResult(text=response["response"], **response.get("usage", {})))
+        return self.build_product_listing(response["response"], item.get("category_hint"), self.prompt_registry).model_dump()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Process a back catalog of product images or names without the API or Celery.")
+    parser.add_argument("source", help="Directory of images, or a .jsonl/.csv manifest")
+    parser.add_argument("--output", required=True, help="JSONL file, or a directory for --format parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--checkpoint", default=None, help="Defaults to <output>.checkpoint")
+    # By default, as many requests at once as the Ollama pool allows.
+    from api.infrastructure.ollama_pool import get_ollama_urls
+    default_concurrency = len(get_ollama_urls()) * int(os.environ.get("OLLAMA_MAX_CONCURRENCY_PER_HOST", "4"))
+    parser.add_argument("--concurrency", type=int, default=max(1, default_concurrency))
+    parser.add_argument("--parquet-batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    items = walk_images(args.source) if os.path.isdir(args.source) else read_manifest(args.source)
+    sink = ParquetSink(args.output, args.parquet_batch_size) if args.format == "parquet" else JsonlSink(args.output)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.output.rstrip('/')}.checkpoint")
+    if checkpoint.done:
+        print(f"Resuming: {len(checkpoint.done)} items already done.")
+
+    started = time.monotonic()
+    try:
+        counts = run(items, CatalogPipeline(), sink, checkpoint, args.concurrency)
+    finally:
+        checkpoint.close()
+    print(f"{counts['processed']} processed, {counts['failed']} failed, {counts['skipped']} already done "
+          f"in {time.monotonic() - started:.0f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from celery.signals import task_failure, task_revoked
+
+from api.infrastructure.deadlines import DeadlineExceeded, record_deadline_miss
+
+
+@task_revoked.connect
+def count_expired_task(request=None, expired=False, sender=None, **kwargs):
+    """Tasks past their `expires` are revoked by the worker before they start."""
+    if expired:
+        record_deadline_miss(getattr(sender, "name", None) or getattr(request, "task_name", "unknown"), "queued")
+
+
+@task_failure.connect
+def count_abandoned_task(exception=None, sender=None, **kwargs):
+    """Tasks that hit their deadline while running, by the stage they were in."""
+    if isinstance(exception, DeadlineExceeded):
+        record_deadline_miss(getattr(sender, "name", "unknown"), exception.stage)
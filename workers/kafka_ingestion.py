@@ -0,0 +1,219 @@
+"""
+Kafka ingestion service for high-volume catalog events.
+
+Reads CatalogEvent messages from KAFKA_INPUT_TOPIC in batches, enqueues them
+on the existing Celery text/vision tasks, and publishes CatalogEventResult
+messages to KAFKA_OUTPUT_TOPIC as tasks finish. Offsets are committed only
+after every message of a batch has been enqueued, and consumption pauses
+while the Celery queues are deeper than KAFKA_MAX_QUEUE_DEPTH.
+
+Run with: python -m workers.kafka_ingestion
+"""
+import os
+import json
+import uuid
+import signal
+from typing import Optional
+
+import redis
+from celery import states
+from pydantic import ValidationError
+
+from config.celery_config import celery_app
+from api.schemas import CatalogEvent, CatalogEventResult
+from api.infrastructure.celery_client import CeleryClient
+from api.infrastructure.idempotency_store import RedisIdempotencyStore
+from api.infrastructure.queue_depth import get_queue_depths
+from api.infrastructure.redis_client import get_redis_client
+
+INFLIGHT_KEY = "kafka_ingestion:inflight"
+RESULT_FETCH_CHUNK = 500 # Result keys read per MGET
+EVENT_NAMESPACE = uuid.UUID("6f1c1d2e-7d55-4b8e-9a57-3c0a3f1d9b10")
+
+TASKS = {
+    "product_description": ('workers.text_worker.generate_product_description', 'text_queue'),
+    "product_image": ('workers.vision_worker.process_product_image', 'vision_queue'),
+}
+
+
+class KafkaIngestionService:
+    def __init__(
+        self,
+        consumer,
+        producer,
+        output_topic: str,
+        celery_client: Optional[CeleryClient] = None,
+        redis_client: Optional[redis.Redis] = None,
+        batch_size: int = 100,
+        poll_timeout: float = 1.0,
+        max_queue_depth: int = 500,
+        max_in_flight: int = 2000,
+        result_backend=None,
+    ):
+        self.consumer = consumer
+        self.producer = producer
+        self.output_topic = output_topic
+        self.celery_client = celery_client or CeleryClient()
+        self.redis = redis_client or get_redis_client()
+        self.result_backend = result_backend or celery_app.backend
+        self.idempotency_store = RedisIdempotencyStore(self.redis)
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.max_queue_depth = max_queue_depth
+        self.max_in_flight = max_in_flight
+        self.paused = False
+        self._running = True
+
+    def run(self) -> None:
+        while self._running:
+            self.run_once()
+        self.publish_results()
+        self.producer.flush()
+        self.consumer.close()
+
+    def stop(self, *args) -> None:
+        self._running = False
+
+    def run_once(self) -> int:
+        """Publishes finished results, then consumes and enqueues one batch. Returns messages handled."""
+        self.publish_results()
+
+        if self._backlogged():
+            if not self.paused:
+                print("Celery queues are backlogged, pausing Kafka consumption.")
+                self.paused = True
+            # Keep polling while paused: paused partitions return nothing, but a consumer
+            # that stops polling for max.poll.interval.ms is evicted from its group.
+            # Pausing every time also covers partitions assigned by a rebalance.
+            self.consumer.pause(self.consumer.assignment())
+            message = self.consumer.poll(self.poll_timeout)
+            messages = [message] if message is not None else []
+        else:
+            if self.paused:
+                print("Celery backlog drained, resuming Kafka consumption.")
+                self.consumer.resume(self.consumer.assignment())
+                self.paused = False
+            messages = self.consumer.consume(num_messages=self.batch_size, timeout=self.poll_timeout)
+
+        for message in messages:
+            if message.error():
+                print(f"Kafka consumer error: {message.error()}")
+                continue
+            self._dispatch(message.value())
+
+        if messages:
+            # Every message of the batch is in Celery (or rejected) by now.
+            self.consumer.commit(asynchronous=False)
+        return len(messages)
+
+    def publish_results(self) -> int:
+        """Publishes results of finished tasks to the output topic. Returns how many were published."""
+        finished = []
+        for task_id, event_id, meta in self._finished_tasks(self.redis.hgetall(INFLIGHT_KEY)):
+            if meta["status"] == states.SUCCESS:
+                payload = CatalogEventResult(event_id=event_id, task_id=task_id, status="SUCCESS", result=meta["result"])
+            else:
+                payload = CatalogEventResult(event_id=event_id, task_id=task_id, status="FAILURE", error=str(meta["result"]))
+            self._produce(payload)
+            finished.append(task_id)
+
+        if finished:
+            self.producer.flush()
+            self.redis.hdel(INFLIGHT_KEY, *finished)
+        return len(finished)
+
+    def _finished_tasks(self, in_flight: dict):
+        """Yields (task_id, event_id, result meta) of finished tasks, reading the results with one MGET per chunk."""
+        task_ids = list(in_flight)
+        for start in range(0, len(task_ids), RESULT_FETCH_CHUNK):
+            chunk = task_ids[start:start + RESULT_FETCH_CHUNK]
+            values = self.result_backend.mget([self.result_backend.get_key_for_task(task_id) for task_id in chunk])
+            for task_id, value in zip(chunk, values):
+                if value is None:
+                    continue # Not started, or still running: no result stored yet
+                meta = self.result_backend.decode_result(value)
+                if meta["status"] in states.READY_STATES:
+                    yield task_id, in_flight[task_id], meta
+
+    def _dispatch(self, raw_value: bytes) -> Optional[str]:
+        try:
+            event = CatalogEvent.model_validate_json(raw_value)
+        except ValidationError as e:
+            event_id = self._event_id_of(raw_value)
+            print(f"Rejecting invalid catalog event {event_id}: {e}")
+            self._produce(CatalogEventResult(event_id=event_id, status="REJECTED", error=str(e)))
+            return None
+
+        task_name, queue = TASKS[event.type]
+        if event.type == "product_description":
+            args = [event.product_name_input, event.category_hint]
+        else:
+            args = [event.image_path, event.project_id]
+        if not args[0]:
+            self._produce(CatalogEventResult(event_id=event.event_id, status="REJECTED", error=f"Missing input for {event.type} event"))
+            return None
+
+        # Deterministic task id: a redelivered event (e.g. after a crash before
+        # commit) maps to the task that was already enqueued for it.
+        task_id = str(uuid.uuid5(EVENT_NAMESPACE, event.event_id))
+        if self.idempotency_store.reserve(f"kafka:{event.event_id}", task_id) is not None:
+            return task_id
+        self.redis.hset(INFLIGHT_KEY, task_id, event.event_id)
+        try:
+            self.celery_client.send_task(task_name, args=args, queue=queue, task_id=task_id)
+        except Exception:
+            # Leave the offset uncommitted so the event is redelivered.
+            self.redis.hdel(INFLIGHT_KEY, task_id)
+            self.idempotency_store.release(f"kafka:{event.event_id}")
+            raise
+        return task_id
+
+    def _backlogged(self) -> bool:
+        depths = get_queue_depths([queue for _, queue in TASKS.values()], self.redis)
+        return max(depths.values()) >= self.max_queue_depth or self.redis.hlen(INFLIGHT_KEY) >= self.max_in_flight
+
+    def _produce(self, payload: CatalogEventResult) -> None:
+        self.producer.produce(self.output_topic, key=payload.event_id, value=payload.model_dump_json())
+        self.producer.poll(0) # Serve delivery callbacks
+
+    @staticmethod
+    def _event_id_of(raw_value: bytes) -> str:
+        try:
+            return str(json.loads(raw_value).get("event_id", "unknown"))
+        except (ValueError, AttributeError):
+            return "unknown"
+
+
+def main() -> None:
+    from confluent_kafka import Consumer, Producer # Only this service needs the Kafka client
+
+    bootstrap_servers = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+    consumer = Consumer({
+        "bootstrap.servers": bootstrap_servers,
+        "group.id": os.environ.get("KAFKA_GROUP_ID", "unified-ai-catalog-ingestion"),
+        "enable.auto.commit": False,
+        "auto.offset.reset": "earliest",
+    })
+    consumer.subscribe([os.environ.get("KAFKA_INPUT_TOPIC", "catalog-products")])
+    producer = Producer({
+        "bootstrap.servers": bootstrap_servers,
+        "linger.ms": 50,
+        "compression.type": "lz4",
+    })
+
+    service = KafkaIngestionService(
+        consumer,
+        producer,
+        os.environ.get("KAFKA_OUTPUT_TOPIC", "catalog-results"),
+        batch_size=int(os.environ.get("KAFKA_BATCH_SIZE", "100")),
+        max_queue_depth=int(os.environ.get("KAFKA_MAX_QUEUE_DEPTH", "500")),
+        max_in_flight=int(os.environ.get("KAFKA_MAX_IN_FLIGHT", "2000")),
+    )
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+    print(f"Kafka ingestion consuming from {bootstrap_servers}...")
+    service.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import os
+from pathlib import Path
+
+from config.celery_config import celery_app
+
+CHAT_HISTORY_RETENTION_MONTHS = int(os.environ.get("CHAT_HISTORY_RETENTION_MONTHS", "12"))
+
+@celery_app.task(name='workers.maintenance.archive_chat_history')
+def archive_chat_history():
+    """Creates upcoming chat_history partitions and archives/drops those past the retention window."""
+    from api.infrastructure.database.partitions import archive_expired_partitions, ensure_partitions
+    from api.infrastructure.database.postgres_repository import get_engine
+
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        return {"status": "SKIPPED", "reason": "chat_history is only partitioned on Postgres"}
+
+    ensure_partitions(engine)
+    archive_dir = os.environ.get("CHAT_HISTORY_ARCHIVE_DIR", "/app/archives/chat_history")
+    archived = archive_expired_partitions(engine, CHAT_HISTORY_RETENTION_MONTHS, Path(archive_dir) if archive_dir else None)
+    return {"status": "SUCCESS", "archived": archived}
@@ -0,0 +1,34 @@
+import threading
+from typing import Dict
+
+from celery.signals import task_postrun, task_prerun
+
+from api.infrastructure.profiling import SamplingProfiler, get_profile_interval, get_profile_store, should_profile_task
+
+# Profiles of the tasks running in this process, by task id.
+_profilers: Dict[str, SamplingProfiler] = {}
+_profilers_lock = threading.Lock()
+
+
+@task_prerun.connect
+def start_task_profile(task_id=None, task=None, **kwargs):
+    """Profiles a sample of tasks (TASK_PROFILE_SAMPLE_RATE); disabled by default."""
+    if task_id is None or task is None or not should_profile_task(task.name):
+        return
+    profiler = SamplingProfiler(threading.get_ident(), get_profile_interval()).start()
+    with _profilers_lock:
+        _profilers[task_id] = profiler
+
+
+@task_postrun.connect
+def save_task_profile(task_id=None, task=None, state=None, **kwargs):
+    with _profilers_lock:
+        profiler = _profilers.pop(task_id, None)
+    if profiler is None:
+        return
+    profiler.stop()
+    try:
+        get_profile_store().save(f"task-{task_id}", profiler.folded())
+        print(f"Saved a {profiler.duration:.1f}s profile of {task.name} ({state}) as task-{task_id}.")
+    except OSError as e:
+        print(f"Could not save the profile of task {task_id}: {e}")
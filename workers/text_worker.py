@@ -1,52 +1,192 @@
 import os
+import re
 import json
-from typing import Optional
+import math
+import threading
+from typing import List, Optional
 
+from celery.signals import worker_init, worker_process_init, worker_ready
 from pydantic import ValidationError
 from config.celery_config import celery_app
 from api.infrastructure.ollama_client import OllamaClient
+from api.infrastructure.model_factory import ModelFactory, is_llama_cpp_model
+from api.infrastructure.llama_cpp_client import LlamaCppClient, load_llama_model
+from api.infrastructure.knowledge_base import get_knowledge_base
+from api.infrastructure.prompts import PromptRegistry, get_prompt_registry
+from api.domain.models import GenerationOptions
+from api.infrastructure.deadlines import check_deadline, current_task_deadline
 from api.schemas import ProductData, GenerateProductDescriptionRequest, GeneratedProductDescription
 
+# Model used for product descriptions: an Ollama model name, or 'llama_cpp'
+# (or a .gguf file in LLAMA_CPP_MODEL_PATH's directory) to run in-process
+# with llama.cpp on CPU-only nodes.
+TEXT_WORKER_MODEL = os.environ.get("TEXT_WORKER_MODEL", "gemma:2b")
 
+model_factory = ModelFactory() # One per worker process, so loaded models are reused across tasks
 
+KNOWLEDGE_BASE_TOP_K = int(os.environ.get("KNOWLEDGE_BASE_TOP_K", "3"))
 
-@celery_app.task(name='workers.text_worker.generate_product_description')
-def generate_product_description(product_name_input: str, category_hint: Optional[str] = None):
-    """Generates a product description using the Ollama client."""
-    ollama_client = OllamaClient()
+# Output budget for a requested description length: Portuguese words are
+# about 1.5 tokens, plus room for the name, category and JSON syntax.
+DESCRIPTION_TOKENS_PER_WORD = 2.0
+DESCRIPTION_JSON_OVERHEAD_TOKENS = 96
+
+def retrieve_context(product_name_input: str, category_hint: Optional[str]) -> str:
+    """Top-k knowledge base passages for the product, formatted for the prompt ('' if none)."""
+    knowledge_base = get_knowledge_base()
+    if knowledge_base is None or KNOWLEDGE_BASE_TOP_K <= 0:
+        return ""
+    try:
+        passages = knowledge_base.search(f"{product_name_input} {category_hint or ''}".strip(), k=KNOWLEDGE_BASE_TOP_K)
+    except Exception as e:
+        print(f"Knowledge base retrieval failed, continuing without context: {e}")
+        return ""
+    return "\n\n".join(f"[{p['source']}]\n{p['text']}" for p in passages)
 
-    system_prompt = """Você é um assistente de IA. Sua tarefa é gerar um nome de produto, uma descrição e uma categoria, com base nas informações fornecidas. Sua resposta DEVE ser um objeto JSON válido com as chaves 'nome', 'descrição' e 'categoria'."""
+def uses_prefork_pool(worker) -> bool:
+    pool_cls = getattr(worker, 'pool_cls', None)
+    name = pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, '__module__', '')
+    return 'prefork' in (name or '')
 
-    user_prompt = f"""Gere um nome, descrição e categoria para um produto com base nas seguintes informações:
-Nome/Palavras-chave: {product_name_input}
-{f'Sugestão de Categoria: {category_hint}' if category_hint else ''}
+@worker_init.connect
+def load_llama_cpp_model_in_main_process(sender=None, **kwargs):
+    """Threads/solo pools run tasks in the main process, which never gets worker_process_init."""
+    if sender is not None and not uses_prefork_pool(sender):
+        load_llama_cpp_model()
 
-Responda APENAS com o objeto JSON, sem nenhum texto ou explicação adicional."""
+@worker_process_init.connect
+def load_llama_cpp_model(**kwargs):
+    """Loads the GGUF model when each pool process starts instead of on its first task."""
+    consumed_queues = celery_app.amqp.queues.consume_from or {}
+    if consumed_queues and 'text_queue' not in consumed_queues:
+        return # e.g. the vision worker, which also imports this module
+    if is_llama_cpp_model(TEXT_WORKER_MODEL):
+        load_llama_model(LlamaCppClient().resolve_model_path(TEXT_WORKER_MODEL))
 
-    full_prompt = f"{system_prompt}\n\n{user_prompt}"
 
+def description_output_tokens(description_length: int) -> int:
+    """Token budget for a JSON answer whose description has about `description_length` words."""
+    return math.ceil(description_length * DESCRIPTION_TOKENS_PER_WORD) + DESCRIPTION_JSON_OVERHEAD_TOKENS
+
+def describe_product(product_name_input: str, category_hint: Optional[str] = None, prompt_registry: Optional[PromptRegistry] = None,
+                     description_length: Optional[int] = None, deadline=None) -> GeneratedProductDescription:
+    """
+    Generates a product description with the configured text generator (Ollama or llama.cpp).
+    Raises DeadlineExceeded instead of starting generation past the deadline.
+    """
+    text_generator = model_factory.get_text_generator(TEXT_WORKER_MODEL)
+    prompt_registry = prompt_registry or get_prompt_registry()
+    options, length_section = None, ''
+    if description_length:
+        length_section = f'A descrição deve ter cerca de {description_length} palavras.'
+        options = GenerationOptions(max_output_tokens=description_output_tokens(description_length))
+    context = retrieve_context(product_name_input, category_hint)
+    context_section = (
+        f"\nUse as informações de referência abaixo para escolher a categoria e enriquecer a descrição:\n{context}\n"
+        if context else ''
+    )
+    # Oversized inputs are trimmed to the model's context window: the knowledge
+    # base passages first, then the product keywords.
+    prompt = prompt_registry.render(
+        "product_description",
+        TEXT_WORKER_MODEL,
+        options=options,
+        product_name_input=product_name_input,
+        category_section=f'Sugestão de Categoria: {category_hint}' if category_hint else '',
+        length_section=length_section,
+        context_section=context_section,
+    )
+
+    check_deadline(deadline, "generation")
     try:
-        result = ollama_client.generate(prompt=full_prompt)
-        
-        if result["status"] == "SUCCESS":
-            try:
-                product_description = json.loads(result["response"])
-                return product_description
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from Ollama: {e}")
-                raise ValueError(f"Ollama response was not valid JSON: {result['response']}")
-        else:
-            raise RuntimeError(f"Ollama API call failed: {result['error']}")
+        # Bounded by max_output_tokens: the template's default, the requested length, or the server cap.
+        generation = text_generator.generate(prompt.text, TEXT_WORKER_MODEL, prompt.options)
+        prompt_registry.record_generation(prompt, generation)
+        response_text = generation.text
+
+        try:
+            product_description = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON from model: {e}")
+            raise ValueError(f"Model response was not valid JSON: {response_text}")
+
+        # Map the prompt's Portuguese keys onto the API schema so results can be
+        # validated (and cached) as GeneratedProductDescription.
+        return GeneratedProductDescription(
+            suggested_name=str(product_description.get("nome", product_name_input)),
+            suggested_description=str(product_description.get("descrição", product_description.get("descricao", ""))),
+            suggested_category=str(product_description.get("categoria", category_hint or "")),
+        )
 
     except Exception as e:
-        print(f"Error during Ollama inference for product description generation: {e}")
+        print(f"Error during inference for product description generation: {e}")
         raise e
 
+@celery_app.task(name='workers.text_worker.generate_product_description')
+def generate_product_description(product_name_input: str, category_hint: Optional[str] = None, description_length: Optional[int] = None):
+    """Generates a product description with the configured text generator (Ollama or llama.cpp)."""
+    return describe_product(product_name_input, category_hint, description_length=description_length,
+                            deadline=current_task_deadline()).model_dump()
+
+FEATURE_LINE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.+?)\s*$")
+MAX_FEATURES = 5
+
+def extract_features(image_analysis: str) -> List[str]:
+    """Key features listed in the image analysis, as bullet/numbered lines or a JSON features list."""
+    try:
+        parsed = json.loads(image_analysis)
+        if isinstance(parsed, dict) and isinstance(parsed.get("features_list"), list):
+            return [str(feature) for feature in parsed["features_list"]][:MAX_FEATURES]
+    except json.JSONDecodeError:
+        pass
+    features = []
+    for line in image_analysis.splitlines():
+        match = FEATURE_LINE.match(line)
+        if match:
+            features.append(match.group(1).replace("**", "").strip())
+    return features[:MAX_FEATURES]
+
+def build_product_listing(image_analysis, category_hint: Optional[str] = None, prompt_registry: Optional[PromptRegistry] = None,
+                          deadline=None) -> ProductData:
+    """Describes the product from an analysis of its photo and combines both into a ProductData."""
+    if not isinstance(image_analysis, str):
+        image_analysis = json.dumps(image_analysis, ensure_ascii=False)
+    description = describe_product(image_analysis, category_hint, prompt_registry, deadline=deadline)
+    return ProductData(
+        product_name=description.suggested_name,
+        category_standard=description.suggested_category,
+        description_long=description.suggested_description,
+        features_list=extract_features(image_analysis),
+    )
+
+@celery_app.task(name='workers.text_worker.generate_product_listing')
+def generate_product_listing(image_analysis, category_hint: Optional[str] = None):
+    """
+    Second step of the product listing workflow: describes the product from the
+    vision worker's analysis of the photo (passed in by the chain).
+    """
+    return build_product_listing(image_analysis, category_hint, deadline=current_task_deadline()).model_dump()
+
+@celery_app.task(name='workers.text_worker.refresh_knowledge_base')
+def refresh_knowledge_base():
+    """Re-indexes knowledge base files that changed since the last run."""
+    knowledge_base = get_knowledge_base()
+    if knowledge_base is None:
+        return {"status": "SKIPPED", "reason": "knowledge base directory not found"}
+    return knowledge_base.refresh()
+
+@worker_ready.connect
+def refresh_knowledge_base_on_start(sender=None, **kwargs):
+    """Brings the index up to date when the text worker starts."""
+    queues = sender.app.amqp.queues.consume_from if sender is not None else {}
+    if 'text_queue' in (queues or {}) and get_knowledge_base() is not None:
+        threading.Thread(target=refresh_knowledge_base, daemon=True).start()
+
 @celery_app.task(name='workers.text_worker.simple_test_task')
 def simple_test_task():
     """A simple test task that uses the Ollama client."""
     ollama_client = OllamaClient()
     print("Sending simple test task to Ollama...")
-    result = ollama_client.generate(prompt="Why is the sky blue?")
+    result = ollama_client.generate_text(prompt="Why is the sky blue?")
     print(f"Ollama response: {result}")
     return result
@@ -1,25 +1,155 @@
 import os
 import sys
+import time
+import threading
 import shutil
 import requests
 import cv2
 import numpy as np
 import base64
+import json
+from celery.exceptions import Ignore
 from config.celery_config import celery_app
 from api.schemas import ProductData
 from api.infrastructure.llava_client import LlavaClient # Import LlavaClient
+from api.infrastructure.image_hash_index import get_dedup_max_distance, get_image_hash_index, perceptual_hash
+from api.infrastructure.prompts import get_prompt_registry
+from api.infrastructure.vision_spillover import get_vision_spillover_policy, vision_spillover_enabled
+from api.infrastructure.project_scheduler import DEFERRED_QUEUE, get_project_scheduler, project_scheduling_enabled
+from api.infrastructure.deadlines import check_deadline, current_task_deadline
+from api.domain.models import GenerationResult
 from api.config import UPLOAD_DIR # Import UPLOAD_DIR
 
-@celery_app.task(name='workers.vision_worker.process_product_image')
-def process_product_image(image_path: str, project_id: str):
+# How long a task waits for a near-duplicate image that another task is analysing.
+IMAGE_DEDUP_WAIT_SECONDS = float(os.environ.get("IMAGE_DEDUP_WAIT_SECONDS", "120"))
+
+def find_duplicate_analysis(task_id: str, image_path: str, project_id: str):
+    """
+    Returns (analysis of a near-identical image or None, image hash or None).
+    When no duplicate exists, this task is registered as analysing the image.
+    """
+    max_distance = get_dedup_max_distance(project_id)
+    if max_distance is None:
+        return None, None
+    try:
+        image_hash = perceptual_hash(image_path)
+        index = get_image_hash_index()
+        entry = index.claim(project_id, image_hash, max_distance, task_id)
+        if entry is None:
+            return None, image_hash
+        if entry["status"] == "SUCCESS":
+            print(f"Reusing analysis of near-duplicate image from task {entry['task_id']}.")
+            return entry["result"], image_hash
+        print(f"Near-duplicate image is being analysed by task {entry['task_id']}, waiting for it...")
+        result = index.wait_for_result(project_id, entry["task_id"], IMAGE_DEDUP_WAIT_SECONDS)
+        return result, image_hash
+    except Exception as e:
+        print(f"Image deduplication failed, analysing the image anyway: {e}")
+        return None, None
+
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+def get_gemini_client():
+    """One Gemini client per worker process, created the first time a task spills over."""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            from api.infrastructure.gemini_client import GeminiClient
+            _gemini_client = GeminiClient()
+        return _gemini_client
+
+def analyze_with_spillover(llava_client: LlavaClient, image_path: str, prompt: str, deadline=None, options=None) -> GenerationResult:
+    """
+    Analyzes the image with the local LLaVA, or with Gemini vision when the
+    vision_queue backlog exceeds the spillover SLA. Falls back to LLaVA if Gemini fails.
+    LLaVA stops generating once the deadline passes or num_predict is reached.
+    """
+    policy = get_vision_spillover_policy() if vision_spillover_enabled() else None
+    if policy is not None and policy.should_spill():
+        from api.infrastructure.gemini_client import GeminiQuotaExceeded
+        try:
+            return GenerationResult(text=get_gemini_client().analyze_image(image_path, prompt))
+        except GeminiQuotaExceeded as e:
+            policy.pause()
+            print(f"Gemini quota exceeded, pausing spillover and falling back to LLaVA: {e}")
+        except Exception as e:
+            print(f"Gemini spillover failed, falling back to LLaVA: {e}")
+
+    started = time.monotonic()
+    response = llava_client.analyze_image(image_path=image_path, prompt=prompt, deadline=deadline, options=options)
+    if response["status"] != "SUCCESS":
+        raise RuntimeError(f"LLaVA API call failed: {response['error']}")
+    if policy is not None:
+        policy.record_local_duration(time.monotonic() - started)
+    return GenerationResult(text=response["response"], **response.get("usage", {}))
+
+@celery_app.task(bind=True, name='workers.vision_worker.process_product_image')
+def process_product_image(self, image_path: str, project_id: str):
     """
     Celery task to process a product image and generate structured data.
+    Tasks of a project already using its fair share of the vision workers
+    are deferred until the project has a free slot.
+    """
+    scheduler = get_project_scheduler() if project_scheduling_enabled() else None
+    if scheduler is not None and not scheduler.try_acquire(project_id, force=self.request.retries >= scheduler.max_deferrals):
+        print(f"Project {project_id} is at its share of the vision workers, deferring the task.")
+        # The same message (task id, chain, deadline), counting the deferral as a retry.
+        deferred = self.signature_from_request(queue=DEFERRED_QUEUE, retries=self.request.retries + 1)
+        if scheduler.defer(project_id, json.dumps(dict(deferred), default=str)):
+            raise Ignore() # Neither a result nor the rest of the chain: the deferred message carries them
+        scheduler = None # Redis failed: run the task without a slot
+
+    started = time.monotonic()
+    success = False
+    try:
+        analysis = analyze_product_image(self.request.id, image_path, project_id, current_task_deadline())
+        success = True
+        return analysis
+    finally:
+        if scheduler is not None:
+            scheduler.release(project_id, time.monotonic() - started, success)
+            dispatch_deferred_tasks(scheduler) # The freed slot may let a deferred task run
+
+def dispatch_deferred_tasks(scheduler, max_tasks: int = 1) -> int:
+    """Publishes deferred tasks whose projects have a free slot again; returns how many."""
+    published = 0
+    for project_id, message in scheduler.pop_deferred(max_tasks):
+        try:
+            celery_app.signature(json.loads(message)).apply_async()
+        except Exception as e:
+            # Still held in Redis: it goes back to its project's list for a later try.
+            print(f"Could not publish a deferred task of project {project_id}: {e}")
+            scheduler.return_deferred(project_id, message)
+            continue
+        scheduler.ack_deferred(project_id, message)
+        published += 1
+    return published
+
+@celery_app.task(name='workers.vision_worker.dispatch_deferred_tasks')
+def dispatch_deferred_tasks_task():
+    """
+    Periodic sweep (PROJECT_DEFER_SECONDS) for deferred tasks no release
+    handed on, e.g. when every running task of their project finished first,
+    or whose dispatcher died before publishing them.
+    """
+    if project_scheduling_enabled():
+        scheduler = get_project_scheduler()
+        scheduler.recover_dispatching() # Messages of dispatchers that died mid-publish
+        dispatch_deferred_tasks(scheduler, scheduler.capacity)
+
+def analyze_product_image(task_id: str, image_path: str, project_id: str, deadline=None):
+    """
+    Analyses the image and removes it afterwards.
+    Near-duplicates of an image already analysed for the project reuse that analysis.
+    Past the deadline, inference is skipped or abandoned with DeadlineExceeded.
     """
     # This task should ideally be refactored to use AnalyzeSpriteUseCase directly
     # or have a more generic image processing flow.
     # For now, it will use LlavaClient directly.
 
     llava_client = LlavaClient() # Instantiate LlavaClient
+    image_hash = None
 
     try:
         print(f"Processing image at path: {image_path}")
@@ -34,30 +164,37 @@ def process_product_image(image_path: str, project_id: str):
         print(f"Checking for file existence at {image_path}: {os.path.exists(image_path)}")
         # --- END GEMINI DEBUGGING ---
 
-        # 1. Pre-process the image using OpenCV (if necessary, or pass directly to LlavaClient)
-        # For now, we'll assume LlavaClient handles the image data directly.
-        
-        # 2. Run inference using LlavaClient
-        prompt = (
-            "You are an expert product cataloger. Analyze the following image of a product "
-            "and generate the structured data based on the Pydantic schema. "
-            "Provide a concise, SEO-friendly product name, a standard high-level category, "
-            "a detailed description of at least 50 words, and a list of 3-5 key features."
-        )
+        # 1. Skip inference for near-duplicates of an image already analysed for this project
+        duplicate_result, image_hash = find_duplicate_analysis(task_id, image_path, project_id)
+        if duplicate_result is not None:
+            os.remove(image_path) # Clean up the uploaded file
+            return duplicate_result
         
-        response = llava_client.analyze_image(image_path=image_path, prompt=prompt)
+        # 2. Run inference using LlavaClient (or Gemini, when the local backlog is too deep)
+        prompt_registry = get_prompt_registry()
+        prompt = prompt_registry.render("product_image_analysis", llava_client.model_name)
         
-        if response["status"] == "SUCCESS":
-            # This part needs to be adapted to ProductData schema if this task is still for products
-            # For now, returning raw response
-            print("Inference successful. Cleaning up image file.")
-            os.remove(image_path) # Clean up the uploaded file
-            return response["response"]
-        else:
-            raise RuntimeError(f"LLaVA API call failed: {response['error']}")
+        check_deadline(deadline, "inference") # e.g. after waiting for a near-duplicate
+        # Bounded by the template's max_output_tokens, sent to LLaVA as num_predict.
+        generation = analyze_with_spillover(llava_client, image_path, prompt.text, deadline, prompt.options)
+        prompt_registry.record_generation(prompt, generation)
+        analysis = generation.text
+
+        # This part needs to be adapted to ProductData schema if this task is still for products
+        # For now, returning raw response
+        print("Inference successful. Cleaning up image file.")
+        if image_hash is not None:
+            try:
+                get_image_hash_index().complete(project_id, task_id, image_hash, analysis)
+            except Exception as e:
+                print(f"Could not record the analysis in the image hash index: {e}")
+        os.remove(image_path) # Clean up the uploaded file
+        return analysis
 
     except Exception as e:
         print(f"An error occurred in the Celery task: {e}")
+        if image_hash is not None:
+            get_image_hash_index().discard(project_id, task_id)
         # Clean up the file even if an error occurs
         if os.path.exists(image_path):
             os.remove(image_path)
@@ -0,0 +1,30 @@
+import threading
+from typing import List, Optional
+
+from celery.signals import worker_ready
+
+from config.celery_config import celery_app
+from api.infrastructure.ollama_warmup import OllamaWarmer, get_models_for_queues
+
+
+@celery_app.task(name='workers.warmup.warm_up_models')
+def warm_up_models(models: Optional[List[str]] = None, queue: Optional[str] = None):
+    """
+    Pre-loads Ollama models and refreshes their keep-alive timers.
+    Scheduled by celery beat once per worker queue; returns the resident models per host.
+    """
+    if models is None:
+        models = get_models_for_queues([queue] if queue else ['text_queue', 'vision_queue'])
+    return OllamaWarmer().warm_up(models)
+
+
+@worker_ready.connect
+def warm_up_on_worker_start(sender=None, **kwargs):
+    """Loads the models of the queues this worker consumes as soon as it starts."""
+    queues = list(sender.app.amqp.queues.consume_from.keys()) if sender is not None else []
+    models = get_models_for_queues(queues)
+    if not models:
+        return
+    print(f"Warming up Ollama models {models} for queues {queues}...")
+    # Run in the background so a slow model load doesn't delay task consumption.
+    threading.Thread(target=OllamaWarmer().warm_up, args=(models,), daemon=True).start()